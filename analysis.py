@@ -0,0 +1,357 @@
+import time
+import asyncio
+import logging
+from typing import Optional, Dict, List, Any, Callable, Awaitable, Tuple
+
+from services import (
+    get_sol_balance, get_sol_price, get_token_accounts, get_token_data_dexscreener, TOKEN_2022_PROGRAM_ID,
+    get_evm_balance, get_evm_native_prices, get_session, price_service, EVM_CHAINS, EVM_CHAIN_INFO
+)
+from tracing import span, annotate
+from token_registry import token_registry
+from erc20_index import erc20_index, ERC20_CHAINS
+from history import portfolio_history
+from summaries import summary_cache
+from records import TokenAccount, TokenMarket, TokenRow, share
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+MIN_TOKEN_VALUE_USD = 0.01  # Dust filter
+
+# Stages reported to on_stage while a Solana wallet is analysed
+STAGE_FETCHED = "fetched"
+STAGE_PRICED = "priced"
+
+# ── Token Pricing ──────────────────────────────────────────────────────────
+async def price_tokens(mints: List[str], listed: Dict[str, Dict[str, Any]],
+                       sol_price_usd: float) -> List[Optional[TokenMarket]]:
+    """Token data for each mint: batched CoinGecko prices for registry-labelled mints, DexScreener for the rest"""
+    # Unlabelled mints go straight to DexScreener while the CoinGecko batch is in flight
+    quotes = asyncio.ensure_future(price_service.get_token_prices("solana", [mint for mint in mints if mint in listed]))
+    session = get_session()
+
+    async def price(mint: str) -> Optional[TokenMarket]:
+        quote = (await quotes).get(mint) if mint in listed else None
+        if quote is None:
+            # Not labelled locally, or too illiquid for CoinGecko
+            return await get_token_data_dexscreener(session, mint, sol_price_usd)
+        return TokenMarket(
+            name=listed[mint]["name"],
+            symbol=listed[mint]["symbol"],
+            price_usd=quote["price_usd"],
+            price_in_sol=quote["price_usd"] / sol_price_usd if sol_price_usd > 0 else None,
+            market_cap=quote["market_cap"],
+            volume_24h=quote["volume_24h"],
+            liquidity=None,
+            price_change_24h=quote["price_change_24h"],
+            url=f"https://dexscreener.com/solana/{mint}",
+        )
+
+    return await asyncio.gather(*(price(mint) for mint in mints))
+
+async def price_mints(mints: List[str], sol_price_usd: float) -> Dict[str, TokenMarket]:
+    """Labelled token data for every mint worth pricing; mints without a usable price are left out"""
+    # Labels come from the local registry; unlisted mints can be skipped before any price lookup
+    listed = token_registry.lookup(mints)
+    priced_mints = [mint for mint in mints if token_registry.should_price(mint, listed.get(mint))]
+    annotate(listed=len(listed), skipped=len(mints) - len(priced_mints))
+    if not priced_mints:
+        return {}
+
+    priced: Dict[str, TokenMarket] = {}
+    with span("pricing"):
+        token_data_list = await price_tokens(priced_mints, listed, sol_price_usd)
+    for mint, token_data in zip(priced_mints, token_data_list):
+        entry = listed.get(mint)
+        if token_data and entry:
+            priced[mint] = token_data._replace(name=share(entry["name"]), symbol=share(entry["symbol"]),
+                                               verified=bool(entry["verified"]))
+        elif token_data and token_data.name != "Unknown":
+            priced[mint] = token_data
+    return priced
+
+# ── Wallet Analysis ────────────────────────────────────────────────────────
+def parse_token_accounts(token_accounts: List[TokenAccount]) -> Dict[str, float]:
+    """Non-zero balance per mint, summed over a wallet's token accounts of both token programs"""
+    mint_balances: Dict[str, float] = {}
+    for account in token_accounts:
+        if account.mint and account.amount > 0:
+            mint_balances[account.mint] = mint_balances.get(account.mint, 0) + account.amount
+    return mint_balances
+
+async def fetch_solana_holdings(wallet_address: str) -> Dict[str, Any]:
+    """SOL balance and token balances of a wallet, without prices"""
+    with span("fetch"):
+        sol_balance, token_accounts = await asyncio.gather(
+            get_sol_balance(wallet_address), get_token_accounts(wallet_address)
+        )
+    with span("parse"):
+        mint_balances = parse_token_accounts(token_accounts)
+        annotate(token_2022_accounts=sum(1 for account in token_accounts if account.program == TOKEN_2022_PROGRAM_ID))
+    return {"address": wallet_address, "sol_balance": sol_balance, "mint_balances": mint_balances}
+
+def build_solana_report(holdings: Dict[str, Any], sol_price_usd: float,
+                        priced: Dict[str, TokenMarket]) -> Dict[str, Any]:
+    """Report for one wallet from its holdings and token data priced for it (or for a whole batch)"""
+    sol_balance = holdings["sol_balance"]
+    mint_balances = holdings["mint_balances"]
+    sol_usd_value = sol_balance * sol_price_usd if sol_price_usd > 0 else 0.0
+
+    token_details: List[TokenRow] = []
+    total_tokens_value_sol = 0.0
+    total_tokens_value_usd = 0.0
+    for mint, balance in mint_balances.items():
+        token_data = priced.get(mint)
+        if not token_data:
+            continue
+        token_sol_value = balance * token_data.price_in_sol if token_data.price_in_sol else 0
+        token_usd_value = balance * token_data.price_usd if token_data.price_usd else 0
+
+        if token_usd_value >= MIN_TOKEN_VALUE_USD:
+            total_tokens_value_sol += token_sol_value
+            total_tokens_value_usd += token_usd_value
+            token_details.append(TokenRow(
+                mint=mint,
+                name=token_data.name,
+                symbol=token_data.symbol,
+                balance=balance,
+                price_usd=token_data.price_usd,
+                token_usd_value=token_usd_value,
+                market_cap=token_data.market_cap,
+                volume_24h=token_data.volume_24h,
+                price_change_24h=token_data.price_change_24h,
+                verified=token_data.verified,
+                url=token_data.url,
+                token_sol_value=token_sol_value,
+            ))
+    token_details.sort(key=lambda x: x.token_usd_value, reverse=True)
+
+    return {
+        "chain": "solana",
+        "address": holdings["address"],
+        "scanned_at": time.time(),
+        "native_balance": sol_balance,
+        "native_price_usd": sol_price_usd,
+        "native_value_usd": sol_usd_value,
+        "token_count": len(mint_balances),
+        "valuable_tokens": len(token_details),
+        "tokens_value_native": total_tokens_value_sol,
+        "tokens_value_usd": total_tokens_value_usd,
+        "total_value_usd": sol_usd_value + total_tokens_value_usd,
+        "tokens": token_details,
+    }
+
+def record_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep the report's summary for inline queries, append it to the portfolio history and attach the previous scan"""
+    summary_cache.put(report)
+    report["previous_scan"] = portfolio_history.record(report)
+    return report
+
+async def analyze_solana_wallet(wallet_address: str,
+                                on_stage: Optional[Callable[[str], Awaitable[None]]] = None,
+                                record: bool = True) -> Dict[str, Any]:
+    """Balances, holdings and USD values of a Solana wallet, without any Telegram formatting"""
+    # record=False rebuilds a report without counting it as a scan: no summary, no history point
+    annotate(chain="solana", address=wallet_address)
+
+    holdings, sol_price_usd = await asyncio.gather(fetch_solana_holdings(wallet_address), get_sol_price())
+    annotate(tokens=len(holdings["mint_balances"]))
+    if on_stage:
+        await on_stage(STAGE_FETCHED)
+
+    priced: Dict[str, TokenMarket] = {}
+    if holdings["mint_balances"]:
+        priced = await price_mints(list(holdings["mint_balances"]), sol_price_usd)
+        if on_stage:
+            await on_stage(STAGE_PRICED)
+    report = build_solana_report(holdings, sol_price_usd, priced)
+    return record_report(report) if record else report
+
+async def fetch_erc20_tokens(chain: str, wallet_address: str) -> Dict[str, Any]:
+    """Priced ERC-20 holdings of a wallet on one chain, from the incremental index and one batched price lookup"""
+    holdings = await erc20_index.holdings(chain, wallet_address)
+    contracts = list(holdings["tokens"])
+    quotes = await price_service.get_token_prices(EVM_CHAIN_INFO[chain]["platform"], contracts) if contracts else {}
+
+    explorer = EVM_CHAIN_INFO[chain]["explorer"]
+    tokens = []
+    for contract, token in holdings["tokens"].items():
+        quote = quotes.get(contract)
+        if not quote:
+            continue  # Unlisted tokens (mostly airdropped spam) have no price
+        token_usd_value = token["balance"] * quote["price_usd"]
+        if token_usd_value >= MIN_TOKEN_VALUE_USD:
+            tokens.append(TokenRow(
+                mint=contract,
+                name=share(token["name"]),
+                symbol=share(token["symbol"]),
+                balance=token["balance"],
+                price_usd=quote["price_usd"],
+                token_usd_value=token_usd_value,
+                market_cap=quote["market_cap"],
+                volume_24h=quote["volume_24h"],
+                price_change_24h=quote["price_change_24h"],
+                verified=False,
+                url=f"{explorer}/token/{contract}?a={wallet_address}",
+                network=chain,
+            ))
+    return {"token_count": len(contracts), "tokens": tokens, "complete": holdings["complete"]}
+
+async def analyze_ethereum_wallet(wallet_address: str, record: bool = True) -> Dict[str, Any]:
+    """Native balances of a 0x address on every configured EVM chain, plus ERC-20 holdings, checked concurrently"""
+    annotate(chain="ethereum", address=wallet_address, networks=len(EVM_CHAINS))
+
+    with span("fetch"):
+        balances, prices, token_results = await asyncio.gather(
+            asyncio.gather(*(get_evm_balance(chain, wallet_address) for chain in EVM_CHAINS)),
+            get_evm_native_prices(EVM_CHAINS),
+            # Per chain, so one chain's index or price failure still leaves the native balances and other chains
+            asyncio.gather(*(fetch_erc20_tokens(chain, wallet_address) for chain in ERC20_CHAINS), return_exceptions=True)
+        )
+
+    unavailable = []
+    for i, (chain, result) in enumerate(zip(ERC20_CHAINS, token_results)):
+        if isinstance(result, Exception):
+            logger.error(f"Error fetching {EVM_CHAIN_INFO[chain]['name']} tokens of {wallet_address}: {result}")
+            unavailable.append(EVM_CHAIN_INFO[chain]["name"])
+            token_results[i] = {"token_count": 0, "tokens": [], "complete": False}
+
+    networks = []
+    for chain, balance in zip(EVM_CHAINS, balances):
+        price_usd = prices[chain]
+        networks.append({
+            "chain": chain,
+            "name": EVM_CHAIN_INFO[chain]["name"],
+            "symbol": EVM_CHAIN_INFO[chain]["symbol"],
+            "balance": balance or 0.0,
+            "price_usd": price_usd,
+            "value_usd": (balance or 0.0) * price_usd if price_usd > 0 else 0.0,
+            "error": balance is None,
+        })
+
+    tokens = sorted((token for result in token_results for token in result["tokens"]),
+                    key=lambda x: x.token_usd_value, reverse=True)
+    tokens_value_usd = sum(token.token_usd_value for token in tokens)
+
+    # native_balance is the ETH held across mainnet and L2s; native_value_usd also counts other gas coins (POL, BNB)
+    eth_balance = sum(network["balance"] for network in networks if network["symbol"] == "ETH")
+    eth_price_usd = next((network["price_usd"] for network in networks if network["symbol"] == "ETH"), 0.0)
+    native_value_usd = sum(network["value_usd"] for network in networks)
+    report = {
+        "chain": "ethereum",
+        "address": wallet_address,
+        "scanned_at": time.time(),
+        "native_balance": eth_balance,
+        "native_price_usd": eth_price_usd,
+        "native_value_usd": native_value_usd,
+        "token_count": sum(result["token_count"] for result in token_results),
+        "valuable_tokens": len(tokens),
+        "tokens_value_native": tokens_value_usd / eth_price_usd if eth_price_usd > 0 else 0.0,
+        "tokens_value_usd": tokens_value_usd,
+        "total_value_usd": native_value_usd + tokens_value_usd,
+        "networks": networks,
+        "tokens_complete": all(result["complete"] for result in token_results),
+        "tokens_unavailable": unavailable,
+        "tokens": tokens,
+    }
+    return record_report(report) if record else report
+
+async def analyze_native_balance(wallet_address: str, wallet_type: str) -> Dict[str, Any]:
+    """Only the SOL or mainnet ETH balance and its USD value: two cached-or-single calls, for answers that can't wait"""
+    if wallet_type == 'ethereum':
+        balance, prices = await asyncio.gather(
+            get_evm_balance("ethereum", wallet_address), get_evm_native_prices(["ethereum"])
+        )
+        price_usd, symbol = prices["ethereum"], "ETH"
+    else:
+        balance, price_usd = await asyncio.gather(get_sol_balance(wallet_address), get_sol_price())
+        symbol = "SOL"
+    return {
+        "chain": wallet_type,
+        "address": wallet_address,
+        "symbol": symbol,
+        "native_balance": balance,
+        "native_value_usd": (balance or 0.0) * price_usd if price_usd > 0 else 0.0,
+    }
+
+async def analyze_wallet(wallet_address: str, wallet_type: str, record: bool = True) -> Dict[str, Any]:
+    if wallet_type == 'ethereum':
+        return await analyze_ethereum_wallet(wallet_address, record)
+    return await analyze_solana_wallet(wallet_address, record=record)
+
+# ── Batch Analysis ─────────────────────────────────────────────────────────
+def combine_reports(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Portfolio across wallets: native balances per chain and per-token totals"""
+    chains: Dict[str, Dict[str, Any]] = {}
+    tokens: Dict[str, Dict[str, Any]] = {}
+    for report in reports:
+        chain = chains.setdefault(report["chain"], {"wallets": 0, "balance": 0.0, "value_usd": 0.0})
+        chain["wallets"] += 1
+        chain["balance"] += report["native_balance"]
+        chain["value_usd"] += report["native_value_usd"]
+        for token in report["tokens"]:
+            total = tokens.get(token.mint)
+            if total is None:
+                total = tokens[token.mint] = {
+                    "mint": token.mint, "name": token.name, "symbol": token.symbol,
+                    "verified": token.verified, "price_usd": token.price_usd, "url": token.url,
+                    "balance": 0.0, "token_usd_value": 0.0, "wallets": 0,
+                }
+            total["balance"] += token.balance
+            total["token_usd_value"] += token.token_usd_value
+            total["wallets"] += 1
+
+    combined = sorted(tokens.values(), key=lambda x: x["token_usd_value"], reverse=True)
+    native_value_usd = sum(chain["value_usd"] for chain in chains.values())
+    tokens_value_usd = sum(token["token_usd_value"] for token in combined)
+    return {
+        "wallets": len(reports),
+        "chains": chains,
+        "native_value_usd": native_value_usd,
+        "tokens_value_usd": tokens_value_usd,
+        "total_value_usd": native_value_usd + tokens_value_usd,
+        "unique_tokens": len(combined),
+        "tokens": combined,
+    }
+
+async def analyze_batch(wallets: List[Tuple[str, str]],
+                        run: Optional[Callable[[Callable[[], Awaitable[Any]]], Awaitable[Any]]] = None,
+                        on_stage: Optional[Callable[[str], Awaitable[None]]] = None) -> Tuple[List[Any], Dict[str, Any]]:
+    """Reports for many wallets with every distinct mint priced once, plus their combined portfolio"""
+    # Holdings first, then one pricing pass over the union of mints, so upstream calls grow with
+    # unique mints rather than wallets x mints. run executes each step, e.g. on the scan scheduler.
+    run = run or (lambda factory: factory())
+
+    async def fetch(address: str, wallet_type: str):
+        if wallet_type == 'ethereum':
+            return await run(lambda: analyze_ethereum_wallet(address))
+        return await run(lambda: fetch_solana_holdings(address))
+
+    has_solana = any(wallet_type != 'ethereum' for _, wallet_type in wallets)
+    sol_price_task = asyncio.ensure_future(get_sol_price()) if has_solana else None
+    results = await asyncio.gather(*(fetch(address, wallet_type) for address, wallet_type in wallets),
+                                   return_exceptions=True)
+    if on_stage:
+        await on_stage(STAGE_FETCHED)
+
+    holdings = [result for result in results if isinstance(result, dict) and "mint_balances" in result]
+    mints = list(dict.fromkeys(mint for wallet in holdings for mint in wallet["mint_balances"]))
+    annotate(wallets=len(wallets), unique_mints=len(mints),
+             wallet_mints=sum(len(wallet["mint_balances"]) for wallet in holdings))
+
+    sol_price_usd = await sol_price_task if sol_price_task else 0.0
+    priced: Dict[str, TokenMarket] = {}
+    if mints:
+        priced = await run(lambda: price_mints(mints, sol_price_usd))
+        if on_stage:
+            await on_stage(STAGE_PRICED)
+
+    # One entry per wallet: its report, or the exception that stopped it
+    reports = [
+        record_report(build_solana_report(result, sol_price_usd, priced))
+        if isinstance(result, dict) and "mint_balances" in result else result
+        for result in results
+    ]
+    return reports, combine_reports([report for report in reports if isinstance(report, dict)])
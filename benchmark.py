@@ -0,0 +1,558 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import tempfile
+import asyncio
+import logging
+import argparse
+import resource
+import tracemalloc
+from collections import Counter
+from typing import Optional, Dict, List, Any
+
+from aiohttp import web, WSMsgType
+
+# ── Configuration ──────────────────────────────────────────────────────────
+SCENARIOS = ("solana", "ethereum", "batch")
+UPSTREAMS = ("rpc", "dex", "etherscan", "coingecko")
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+SPL_TOKEN_PROGRAM = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+TOKEN_2022_PROGRAM = "TokenzQdBNbLqP5VEhdkAS6EPFLC1PHnBqCXEpPxuEb"
+TOKEN_2022_SHARE = 0.2  # Fraction of a fake wallet's token accounts owned by Token-2022
+ERC20_CONTRACT_POOL = 50  # Fake ERC-20 contracts a wallet's transfers are drawn from
+PRICES_USD = {"solana": 150.0, "ethereum": 3000.0, "binancecoin": 600.0, "polygon-ecosystem-token": 0.5}
+COINGECKO_LISTED_SHARE = 0.8  # Fraction of mints the fake CoinGecko has a price for; the rest are "illiquid"
+UPSTREAM_LIMIT_VARS = ("SOLANA_RPC_RPS", "DEXSCREENER_RPS", "ETHERSCAN_RPS", "COINGECKO_RPS")
+
+def random_solana_address(rng: random.Random) -> str:
+    return "".join(rng.choice(BASE58_ALPHABET) for _ in range(44))
+
+def random_ethereum_address(rng: random.Random) -> str:
+    return "0x" + "".join(rng.choice("0123456789abcdef") for _ in range(40))
+
+# ── Fake Upstreams ─────────────────────────────────────────────────────────
+class FakeUpstreams:
+    """Local aiohttp stand-ins for the Solana RPC and WebSocket, DexScreener, Etherscan and CoinGecko"""
+
+    def __init__(self, latency_ms: Dict[str, float], jitter: float = 0.2, error_rate: float = 0.0,
+                 mint_pool: int = 500, default_tokens: int = 10, seed: int = 1):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.default_tokens = default_tokens
+        self.rng = random.Random(seed)
+        self.mints = [random_solana_address(self.rng) for _ in range(mint_pool)]
+        self.contracts = [random_ethereum_address(self.rng).lower() for _ in range(ERC20_CONTRACT_POOL)]
+        self.wallets: Dict[str, int] = {}  # address -> number of token accounts
+        self.activity: Counter = Counter()  # address -> transactions since start
+        self.calls: Counter = Counter()
+        self.subscriptions: Dict[int, tuple] = {}  # subscription id -> (websocket, account)
+        # Per API key quotas like Etherscan's: calls per second (0 = unlimited), and keys it rejects outright
+        self.etherscan_key_rps = 0
+        self.invalid_etherscan_keys: set = set()
+        self._etherscan_windows: Dict[str, List[float]] = {}
+        self._next_subscription = 0
+        self.app = web.Application()
+        self.app.router.add_post("/rpc", self.handle_rpc)
+        self.app.router.add_get("/ws", self.handle_ws)
+        self.app.router.add_get("/dex/search", self.handle_dex)
+        self.app.router.add_get("/etherscan", self.handle_etherscan)
+        self.app.router.add_get("/coingecko/simple/price", self.handle_coingecko)
+        self.app.router.add_get("/coingecko/simple/token_price/{platform}", self.handle_token_price)
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        sock = socket.socket()
+        sock.bind((host, port))  # Port 0 picks a free port
+        await web.SockSite(self._runner, sock).start()
+        self.base_url = f"http://{host}:{sock.getsockname()[1]}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def env(self) -> Dict[str, str]:
+        """Environment that points services.py at this server"""
+        return {
+            "SOLANA_RPC_URL": f"{self.base_url}/rpc",
+            "SOLANA_WS_URL": f"{self.base_url.replace('http://', 'ws://', 1)}/ws",
+            "DEXSCREENER_API": f"{self.base_url}/dex/search",
+            "ETHERSCAN_API": f"{self.base_url}/etherscan",
+            "COINGECKO_API": f"{self.base_url}/coingecko",
+        }
+
+    async def _respond(self, upstream: str, name: str) -> Optional[web.Response]:
+        """Simulate latency and injected failures; returns an error response or None"""
+        self.calls[name] += 1
+        latency = self.latency_ms.get(upstream, 0) / 1000
+        if latency:
+            await asyncio.sleep(latency * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.calls[f"{name}.error"] += 1
+            return web.Response(status=500, text="injected failure")
+        return None
+
+    def token_accounts(self, owner: str, program: str) -> List[Dict[str, Any]]:
+        rng = random.Random(owner)
+        count = min(self.wallets.get(owner, self.default_tokens), len(self.mints))
+        accounts = [
+            {
+                "pubkey": random_solana_address(rng),
+                "account": {"data": {"parsed": {"info": {
+                    "mint": mint,
+                    "owner": owner,
+                    "tokenAmount": {"uiAmount": round(rng.uniform(1, 100000), 4), "decimals": 6},
+                }}}},
+            }
+            for mint in rng.sample(self.mints, count)
+        ]
+        split = round(count * (1 - TOKEN_2022_SHARE))
+        if program == SPL_TOKEN_PROGRAM:
+            return accounts[:split]
+        if program == TOKEN_2022_PROGRAM:
+            return accounts[split:]
+        return []
+
+    def _rpc_result(self, request: Dict[str, Any]) -> Any:
+        method = request.get("method")
+        params = request.get("params") or []
+        if method == "getBalance":
+            return {"context": {"slot": 1}, "value": random.Random(params[0]).randint(0, 500) * 10**9}
+        if method == "getSignaturesForAddress":
+            # Bump self.activity[address] to simulate a new transaction
+            signature = f"sig-{params[0][:8]}-{self.activity[params[0]]}"
+            return [{"signature": signature, "slot": 1, "err": None}]
+        if method == "getTokenAccountsByOwner":
+            program = (params[1] if len(params) > 1 else {}).get("programId")
+            return {"context": {"slot": 1}, "value": self.token_accounts(params[0], program)}
+        return None
+
+    async def handle_rpc(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        calls = body if isinstance(body, list) else [body]
+        error = await self._respond("rpc", "rpc." + ",".join(sorted({c.get("method", "?") for c in calls})))
+        if error:
+            return error
+        results = [{"jsonrpc": "2.0", "id": c.get("id"), "result": self._rpc_result(c)} for c in calls]
+        return web.json_response(results if isinstance(body, list) else results[0])
+
+    async def handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        """accountSubscribe/accountUnsubscribe; notify() pushes changes, drop_websockets() simulates an outage"""
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.calls["ws.connect"] += 1
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    break
+                call = json.loads(message.data)
+                method, params = call.get("method"), call.get("params") or []
+                self.calls[f"ws.{method}"] += 1
+                if method == "accountSubscribe":
+                    self._next_subscription += 1
+                    self.subscriptions[self._next_subscription] = (ws, params[0])
+                    result = self._next_subscription
+                elif method == "accountUnsubscribe":
+                    result = self.subscriptions.pop(params[0], None) is not None
+                else:
+                    await ws.send_json({"jsonrpc": "2.0", "id": call.get("id"),
+                                        "error": {"code": -32601, "message": "Method not found"}})
+                    continue
+                await ws.send_json({"jsonrpc": "2.0", "id": call.get("id"), "result": result})
+        finally:
+            for subscription, (owner, _) in list(self.subscriptions.items()):
+                if owner is ws:
+                    del self.subscriptions[subscription]
+        return ws
+
+    async def notify(self, account: str):
+        """Send accountNotification to every subscriber of account (and count it as activity of the account)"""
+        self.activity[account] += 1
+        for subscription, (ws, subscribed) in list(self.subscriptions.items()):
+            if subscribed == account and not ws.closed:
+                await ws.send_json({"jsonrpc": "2.0", "method": "accountNotification", "params": {
+                    "subscription": subscription,
+                    "result": {"context": {"slot": 1}, "value": {"lamports": 0, "data": ["", "base64"]}},
+                }})
+
+    async def drop_websockets(self):
+        for ws in {ws for ws, _ in self.subscriptions.values()}:
+            await ws.close()
+
+    async def handle_dex(self, request: web.Request) -> web.Response:
+        error = await self._respond("dex", "dex.search")
+        if error:
+            return error
+        mint = request.query.get("q", "")
+        rng = random.Random(mint)
+        price_usd = rng.uniform(0.0001, 50)
+        pair = {
+            "pairAddress": random_solana_address(rng),
+            "baseToken": {"address": mint, "name": f"Bench {mint[:6]}", "symbol": mint[:4].upper()},
+            "quoteToken": {"address": "So11111111111111111111111111111111111111112", "symbol": "SOL"},
+            "priceUsd": f"{price_usd:.8f}",
+            "priceNative": f"{price_usd / PRICES_USD['solana']:.10f}",
+            "fdv": rng.uniform(1e4, 1e9),
+            "volume": {"h24": rng.uniform(0, 1e7)},
+            "liquidity": {"usd": rng.uniform(1e3, 1e7)},
+            "priceChange": {"h24": rng.uniform(-50, 50)},
+            "url": f"https://dexscreener.com/solana/{mint}",
+        }
+        return web.json_response({"schemaVersion": "1.0.0", "pairs": [pair]})
+
+    async def handle_etherscan(self, request: web.Request) -> web.Response:
+        action = request.query.get("action", "?")
+        error = await self._respond("etherscan", f"etherscan.{action}")
+        if error:
+            return error
+        rejected = self.check_etherscan_key(request.query.get("apikey", ""))
+        if rejected:
+            return web.json_response({"status": "0", "message": "NOTOK", "result": rejected})
+        if action == "tokentx":
+            transfers = self.token_transfers(request.query)
+            if not transfers:
+                return web.json_response({"status": "0", "message": "No transactions found", "result": []})
+            return web.json_response({"status": "1", "message": "OK", "result": transfers})
+        if action == "balance":
+            seed = f"{request.query.get('chainid', '1')}:{request.query.get('address', '')}"
+            wei = random.Random(seed).randint(0, 10**21)
+            return web.json_response({"status": "1", "message": "OK", "result": str(wei)})
+        return web.json_response({"status": "0", "message": "NOTOK", "result": f"Unsupported action {action}"})
+
+    def check_etherscan_key(self, key: str) -> Optional[str]:
+        """Etherscan's error text if key is invalid or over its per-second quota, else None"""
+        self.calls[f"etherscan.key.{key}"] += 1
+        if key in self.invalid_etherscan_keys:
+            return "Invalid API Key (#err2)|"
+        if self.etherscan_key_rps:
+            now = time.monotonic()
+            window = [t for t in self._etherscan_windows.get(key, []) if now - t < 1.0]
+            self._etherscan_windows[key] = window
+            if len(window) >= self.etherscan_key_rps:
+                self.calls[f"etherscan.key.{key}.limited"] += 1
+                return f"Max calls per sec rate limit reached ({self.etherscan_key_rps}/sec)"
+            window.append(now)
+        return None
+
+    def token_transfers(self, query) -> List[Dict[str, Any]]:
+        """A wallet's ERC-20 history: mostly incoming transfers, oldest first, from startblock on"""
+        address = query.get("address", "").lower()
+        rng = random.Random(f"tokentx:{query.get('chainid', '1')}:{address}")
+        block = 18_000_000
+        transfers = []
+        for _ in range(rng.randint(0, 4 * self.default_tokens)):
+            block += rng.randint(1, 5000)
+            incoming = rng.random() < 0.8
+            counterparty = random_ethereum_address(rng).lower()
+            transfers.append({
+                "blockNumber": str(block),
+                "from": counterparty if incoming else address,
+                "to": address if incoming else counterparty,
+                "value": str(rng.randint(1, 10**6) * 10**12 if incoming else 1),
+                "contractAddress": rng.choice(self.contracts),
+                "tokenName": "Bench ERC20",
+                "tokenSymbol": "BERC",
+                "tokenDecimal": "18",
+            })
+        start = int(query.get("startblock", 0))
+        return [t for t in transfers if int(t["blockNumber"]) >= start][:int(query.get("offset", 10000))]
+
+    async def handle_coingecko(self, request: web.Request) -> web.Response:
+        error = await self._respond("coingecko", "coingecko.simple_price")
+        if error:
+            return error
+        ids = [i for i in request.query.get("ids", "").split(",") if i]
+        return web.json_response({i: {"usd": PRICES_USD.get(i, 1.0)} for i in ids})
+
+    async def handle_token_price(self, request: web.Request) -> web.Response:
+        error = await self._respond("coingecko", "coingecko.token_price")
+        if error:
+            return error
+        prices = {}
+        for mint in request.query.get("contract_addresses", "").split(","):
+            if mint and random.Random("coingecko" + mint).random() < COINGECKO_LISTED_SHARE:
+                rng = random.Random(mint)  # Same price as the DexScreener pair
+                prices[mint] = {
+                    "usd": rng.uniform(0.0001, 50), "usd_market_cap": rng.uniform(1e4, 1e9),
+                    "usd_24h_vol": rng.uniform(0, 1e7), "usd_24h_change": rng.uniform(-50, 50),
+                }
+        return web.json_response(prices)
+
+    def write_token_list(self, path: str, share: float):
+        """Token-list JSON covering the first share of the mint pool, for building a token registry"""
+        listed = self.mints[:int(len(self.mints) * share)]
+        tokens = [
+            {"chainId": 101, "address": mint, "name": f"Bench {mint[:6]}", "symbol": mint[:4].upper(),
+             "decimals": 6, "tags": ["verified"]}
+            for mint in listed
+        ]
+        with open(path, "w") as f:
+            json.dump({"tokens": tokens}, f)
+
+# ── Statistics ─────────────────────────────────────────────────────────────
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(samples)))
+    return samples[min(rank, len(samples)) - 1]
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "p50": round(percentile(ordered, 50), 4),
+        "p95": round(percentile(ordered, 95), 4),
+        "p99": round(percentile(ordered, 99), 4),
+        "mean": round(sum(ordered) / len(ordered), 4) if ordered else 0.0,
+        "max": round(ordered[-1], 4) if ordered else 0.0,
+    }
+
+def peak_rss_bytes() -> int:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
+
+# ── Workloads ──────────────────────────────────────────────────────────────
+async def run_level(bot, upstreams: FakeUpstreams, scenario: str, concurrency: int, requests: int,
+                    wallet_tokens: List[int], batch_size: int, rng: random.Random) -> Dict[str, Any]:
+    """Run requests scans of one scenario with concurrency scans in flight at a time"""
+    def solana_wallet(index: int) -> str:
+        address = random_solana_address(rng)
+        upstreams.wallets[address] = wallet_tokens[index % len(wallet_tokens)]
+        return address
+
+    async def one(index: int):
+        if scenario == "solana":
+            await bot.create_enhanced_solana_analysis(solana_wallet(index))
+        elif scenario == "ethereum":
+            await bot.create_enhanced_ethereum_analysis(random_ethereum_address(rng))
+        else:
+            # Like a pasted batch: every step goes through the fair scan scheduler, mints are priced once
+            user_id = index % concurrency
+            wallets = [(solana_wallet(index * batch_size + i), "solana") for i in range(batch_size)]
+
+            async def run(factory):
+                return await bot.scan_scheduler.submit(user_id, factory, batch=True)
+
+            reports, portfolio = await bot.analyze_batch(wallets, run)
+            for report in reports:
+                if isinstance(report, Exception):
+                    raise report
+                bot.render_solana_report(report)
+            bot.format_portfolio(portfolio, 0, 0)
+
+    latencies: List[float] = []
+    errors: Counter = Counter()
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                await one(index)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    calls_before = Counter(upstreams.calls)
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    upstream_calls = dict(sorted((upstreams.calls - calls_before).items()))
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": dict(errors),
+        "duration": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency": summarize(latencies),
+        "upstream_calls": upstream_calls,
+        "upstream_calls_per_request": round(sum(v for k, v in upstream_calls.items() if not k.endswith(".error")) / requests, 2),
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    if scenario == "batch":
+        result["batch_size"] = batch_size
+        result["wallets_per_second"] = round(len(latencies) * batch_size / elapsed, 3) if elapsed else 0.0
+    if tracemalloc.is_tracing():
+        result["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+    return result
+
+# ── Reporting ──────────────────────────────────────────────────────────────
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Relative change of p95 latency and throughput against a previous run"""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    comparison = []
+    for result in results:
+        old = previous.get((result["scenario"], result["concurrency"]))
+        if not old:
+            continue
+        def change(new_value: float, old_value: float) -> Optional[float]:
+            return round((new_value - old_value) / old_value, 4) if old_value else None
+        comparison.append({
+            "scenario": result["scenario"],
+            "concurrency": result["concurrency"],
+            "p95_change": change(result["latency"]["p95"], old["latency"]["p95"]),
+            "p99_change": change(result["latency"]["p99"], old["latency"]["p99"]),
+            "throughput_change": change(result["throughput_rps"], old["throughput_rps"]),
+            "upstream_calls_change": change(result["upstream_calls_per_request"], old.get("upstream_calls_per_request", 0)),
+        })
+    return comparison
+
+def print_summary(report: Dict[str, Any]):
+    for r in report["results"]:
+        lat = r["latency"]
+        print(
+            f"{r['scenario']:<9} c={r['concurrency']:<4} ok={r['ok']}/{r['requests']} "
+            f"p50={lat['p50']*1000:.1f}ms p95={lat['p95']*1000:.1f}ms p99={lat['p99']*1000:.1f}ms "
+            f"rps={r['throughput_rps']:.1f} calls/req={r['upstream_calls_per_request']} "
+            f"rss={r['peak_rss_bytes'] / 2**20:.1f}MiB",
+            file=sys.stderr
+        )
+    for c in report.get("comparison", []):
+        fmt = lambda v: "n/a" if v is None else f"{v:+.1%}"
+        print(f"vs baseline {c['scenario']:<9} c={c['concurrency']:<4} p95 {fmt(c['p95_change'])} "
+              f"throughput {fmt(c['throughput_change'])}", file=sys.stderr)
+
+# ── Entry Point ────────────────────────────────────────────────────────────
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark wallet analysis against local fake upstreams")
+    parser.add_argument("--scenario", default="solana,ethereum,batch", help="Comma separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Scans (or batches) per concurrency level")
+    parser.add_argument("--wallet-tokens", default="10", help="Comma separated token counts, cycled across wallets")
+    parser.add_argument("--batch-size", type=int, default=10, help="Wallets per batch in the batch scenario")
+    parser.add_argument("--mint-pool", type=int, default=500, help="Distinct token mints wallets draw from")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Simulated latency of every upstream")
+    parser.add_argument("--upstream-latency", action="append", default=[], metavar="NAME=MS",
+                        help="Per-upstream latency override (" + ", ".join(UPSTREAMS) + ")")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency jitter as a fraction of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream requests that fail with 500")
+    parser.add_argument("--listed-share", type=float, default=0.0,
+                        help="Fraction of the mint pool put in a token registry (priced through CoinGecko)")
+    parser.add_argument("--upstream-limits", action="store_true", help="Keep the per-upstream request rate limits")
+    parser.add_argument("--warm-cache", action="store_true", help="Keep the response cache between levels")
+    parser.add_argument("--trace-memory", action="store_true", help="Report tracemalloc peaks (slows the run down)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, help="Exit non-zero if p95 regresses by more than this fraction")
+    parser.add_argument("--verbose", action="store_true", help="Keep the bot's error logging")
+    args = parser.parse_args(argv)
+
+    args.scenarios = [s.strip() for s in args.scenario.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    args.levels = [int(c) for c in args.concurrency.split(",")]
+    args.tokens = [int(t) for t in args.wallet_tokens.split(",")]
+    args.latencies = {name: args.latency_ms for name in UPSTREAMS}
+    for override in args.upstream_latency:
+        name, _, value = override.partition("=")
+        if name not in UPSTREAMS or not value:
+            parser.error(f"bad --upstream-latency {override!r}")
+        args.latencies[name] = float(value)
+    return args
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    upstreams = FakeUpstreams(args.latencies, args.jitter, args.error_rate, args.mint_pool, args.tokens[0], args.seed)
+    await upstreams.start()
+
+    # services.py reads its endpoints at import time, so point it at the fakes before importing the bot
+    os.environ.update(upstreams.env())
+    os.environ.setdefault("ETHERSCAN_API_KEY", "benchmark")
+    os.environ.setdefault("STORAGE_BACKEND", "memory")
+    if not args.upstream_limits:
+        for name in UPSTREAM_LIMIT_VARS:
+            os.environ.setdefault(name, "0")
+    registry_dir = tempfile.TemporaryDirectory(prefix="bench-registry-")
+    os.environ["TOKEN_REGISTRY_PATH"] = os.path.join(registry_dir.name, "token_registry.db")
+    if args.listed_share:
+        from token_registry import build_index
+        token_list = os.path.join(registry_dir.name, "tokens.json")
+        upstreams.write_token_list(token_list, args.listed_share)
+        build_index([token_list], os.environ["TOKEN_REGISTRY_PATH"])
+    import main as bot
+    from services import cache_service
+    from scan_scheduler import scan_scheduler
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    rng = random.Random(args.seed)
+    results = []
+    try:
+        for scenario in args.scenarios:
+            for concurrency in args.levels:
+                if not args.warm_cache:
+                    cache_service.clear()
+                results.append(await run_level(bot, upstreams, scenario, concurrency, args.requests,
+                                               args.tokens, args.batch_size, rng))
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        await scan_scheduler.stop()
+        await upstreams.stop()
+        registry_dir.cleanup()
+
+    return {
+        "generated_at": time.time(),
+        "python": sys.version.split()[0],
+        "config": {
+            "scenarios": args.scenarios,
+            "concurrency": args.levels,
+            "requests": args.requests,
+            "wallet_tokens": args.tokens,
+            "batch_size": args.batch_size,
+            "mint_pool": args.mint_pool,
+            "latency_ms": args.latencies,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "warm_cache": args.warm_cache,
+            "upstream_limits": args.upstream_limits,
+            "listed_share": args.listed_share,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report["results"], json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    print_summary(report)
+
+    if args.max_regression is not None:
+        regressed = [c for c in report.get("comparison", []) if (c["p95_change"] or 0) > args.max_regression]
+        if regressed:
+            print(f"❌ p95 regressed by more than {args.max_regression:.0%} in {len(regressed)} run(s)", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from typing import Optional, Dict, List, Any, Set, TextIO
+
+from dotenv import load_dotenv
+
+# services.py reads its configuration at import time
+load_dotenv()
+
+import services
+from analysis import analyze_wallet
+from utils import validate_wallet_address
+
+# ── Configuration ──────────────────────────────────────────────────────────
+DEFAULT_CONCURRENCY = 16
+CHECKPOINT_INTERVAL = 2.0  # Seconds between checkpoint writes
+PROGRESS_INTERVAL = 5.0    # Seconds between progress lines on stderr
+
+CSV_FIELDS = [
+    "line", "address", "chain", "status", "native_balance", "native_price_usd", "native_value_usd",
+    "token_count", "valuable_tokens", "tokens_value_native", "tokens_value_usd", "total_value_usd",
+    "scanned_at", "error",
+]
+
+logger = logging.getLogger(__name__)
+
+# ── Output ─────────────────────────────────────────────────────────────────
+class ResultWriter:
+    """Writes one record per scanned line and flushes it straight away"""
+
+    def __init__(self, stream: TextIO, fmt: str, with_tokens: bool = False, write_header: bool = True):
+        self.stream = stream
+        self.fmt = fmt
+        self.with_tokens = with_tokens and fmt == "ndjson"
+        self._csv = csv.DictWriter(stream, CSV_FIELDS, extrasaction="ignore") if fmt == "csv" else None
+        if self._csv and write_header:
+            self._csv.writeheader()
+
+    def write(self, record: Dict[str, Any]):
+        if self._csv:
+            self._csv.writerow(record)
+        else:
+            if not self.with_tokens:
+                record = {k: v for k, v in record.items() if k != "tokens"}
+            elif "tokens" in record:
+                record = {**record, "tokens": [token._asdict() for token in record["tokens"]]}
+            self.stream.write(json.dumps(record, default=str) + "\n")
+        self.stream.flush()
+
+    def offset(self) -> Optional[int]:
+        """Bytes written to the output file so far; None for stdout, which can't be rewound"""
+        if self.stream is sys.stdout:
+            return None
+        return os.fstat(self.stream.fileno()).st_size
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+def open_writer(path: str, fmt: str, with_tokens: bool, resume: bool, offset: Optional[int] = None) -> ResultWriter:
+    if path == "-":
+        return ResultWriter(sys.stdout, fmt, with_tokens)
+    if resume and offset is not None and os.path.exists(path) and os.path.getsize(path) > offset:
+        # Rows written after the last checkpoint belong to lines it doesn't list as done; they are scanned again
+        os.truncate(path, offset)
+    appending = resume and os.path.exists(path) and os.path.getsize(path) > 0
+    stream = open(path, "a" if appending else "w", newline="" if fmt == "csv" else None)
+    return ResultWriter(stream, fmt, with_tokens, write_header=not appending)
+
+# ── Checkpoint ─────────────────────────────────────────────────────────────
+class Checkpoint:
+    """Which input lines are finished, kept as a low-water mark plus the few finished lines above it"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.next_line = 0
+        self.done: Set[int] = set()
+        self.output_offset: Optional[int] = None  # Output size when the checkpoint was written
+        self._saved_at = 0.0
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            data = json.load(f)
+        self.next_line = data.get("next_line", 0)
+        self.done = set(data.get("done", []))
+        self.output_offset = data.get("output_offset")
+
+    def is_done(self, line: int) -> bool:
+        return line < self.next_line or line in self.done
+
+    def mark(self, line: int):
+        self.done.add(line)
+        while self.next_line in self.done:
+            self.done.remove(self.next_line)
+            self.next_line += 1
+
+    def save(self, writer: Optional[ResultWriter] = None, force: bool = False):
+        """Record the finished lines together with how much output they produced"""
+        if not self.path or (not force and time.monotonic() - self._saved_at < CHECKPOINT_INTERVAL):
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"next_line": self.next_line, "done": sorted(self.done), "updated_at": time.time(),
+                       "output_offset": writer.offset() if writer else None}, f)
+        os.replace(tmp_path, self.path)
+        self._saved_at = time.monotonic()
+
+# ── Scanning ───────────────────────────────────────────────────────────────
+async def scan_record(line: int, address: str) -> Dict[str, Any]:
+    is_valid, wallet_type = validate_wallet_address(address)
+    if not is_valid:
+        return {"line": line, "address": address, "chain": None, "status": "invalid", "error": wallet_type}
+    try:
+        # Headless: no inline summary, history point or cached wallet entries, so memory stays bounded
+        report = await analyze_wallet(address, wallet_type, record=False)
+    except Exception as e:
+        logger.error(f"Error analyzing wallet {address}: {e}")
+        return {"line": line, "address": address, "chain": wallet_type, "status": "error", "error": str(e)[:200]}
+    return {"line": line, **report, "status": "ok", "error": None}
+
+async def scan_stream(stream: TextIO, writer: ResultWriter, checkpoint: Checkpoint, concurrency: int,
+                      quiet: bool = False) -> Counter:
+    """Scan addresses as they are read; at most a few times concurrency lines are held in memory"""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    counts: Counter = Counter()
+    started = time.monotonic()
+
+    async def produce():
+        line = 0
+        while True:
+            raw = await loop.run_in_executor(None, stream.readline)  # stdin may be a slow pipe
+            if not raw:
+                break
+            address = raw.strip()
+            if not checkpoint.is_done(line):
+                if address:
+                    await queue.put((line, address))
+                else:
+                    checkpoint.mark(line)
+            line += 1
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            record = await scan_record(*item)
+            # Written and marked with no await in between, so every checkpoint matches the output exactly
+            writer.write(record)
+            checkpoint.mark(item[0])
+            checkpoint.save(writer)
+            counts[record["status"]] += 1
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            done = sum(counts.values())
+            rate = done / (time.monotonic() - started)
+            print(f"scanned {done} ({dict(counts)}) {rate:.1f}/s", file=sys.stderr)
+
+    reporter = None if quiet else asyncio.create_task(report_progress())
+    try:
+        await asyncio.gather(produce(), *[consume() for _ in range(concurrency)])
+    finally:
+        if reporter:
+            reporter.cancel()
+        checkpoint.save(writer, force=True)
+    return counts
+
+# ── Entry Point ────────────────────────────────────────────────────────────
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Scan wallets from a file or stdin without Telegram. Uses the same services, cache "
+                    "and upstream rate limits as the bot (shared with running bots when STORAGE_BACKEND=sqlite)."
+    )
+    parser.add_argument("input", nargs="?", default="-", help="File with one address per line, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="Result file, or - for stdout")
+    parser.add_argument("-f", "--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Wallets scanned at once")
+    parser.add_argument("--checkpoint", help="Progress file; an existing one resumes the run and appends to --output")
+    parser.add_argument("--with-tokens", action="store_true", help="Include per-token holdings (NDJSON only)")
+    parser.add_argument("--quiet", action="store_true", help="No progress lines on stderr")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    return args
+
+async def run(args: argparse.Namespace) -> Counter:
+    checkpoint = Checkpoint(args.checkpoint)
+    checkpoint.load()
+    resume = bool(checkpoint.next_line or checkpoint.done)
+    writer = open_writer(args.output, args.format, args.with_tokens, resume, checkpoint.output_offset)
+    stream = sys.stdin if args.input == "-" else open(args.input)
+    try:
+        return await scan_stream(stream, writer, checkpoint, args.concurrency, args.quiet)
+    finally:
+        writer.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    services.cache_wallets = False
+    try:
+        counts = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Interrupted; rerun with the same --checkpoint to resume", file=sys.stderr)
+        return 130
+    if not args.quiet:
+        print(f"Done: {dict(counts)}", file=sys.stderr)
+    return 1 if counts.get("error") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import os
+import logging
+from typing import Optional, Dict, List, Any
+
+from services import (
+    cache_service, get_token_transfers, EVM_CHAIN_INFO, EVM_CHAINS, CACHE_DURATION, TOKEN_TRANSFERS_PAGE_SIZE
+)
+from storage import HoldingsIndex, create_holdings_index
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+# EVM chains whose ERC-20 holdings are indexed (a subset of EVM_CHAINS); empty disables token holdings
+ERC20_CHAINS = [
+    chain for chain in (c.strip().lower() for c in os.getenv("ERC20_CHAINS", "ethereum").split(","))
+    if chain in EVM_CHAINS
+]
+ERC20_MAX_PAGES = int(os.getenv("ERC20_MAX_PAGES", "10"))  # tokentx pages per scan while a wallet's index is built
+ERC20_SYNC_INTERVAL = float(os.getenv("ERC20_SYNC_INTERVAL", str(CACHE_DURATION)))  # Seconds before asking again
+
+# ── Holdings Engine ────────────────────────────────────────────────────────
+class Erc20Index:
+    """ERC-20 balances per wallet, replayed from Etherscan tokentx pages and kept up to date from a block cursor"""
+    # Balances are sums of transfers, so rebasing or fee-on-transfer tokens can drift from the on-chain value
+
+    def __init__(self, store: Optional[HoldingsIndex] = None):
+        self.store = store or create_holdings_index()
+        self.stats = {"syncs": 0, "calls": 0, "transfers": 0}
+
+    async def holdings(self, chain: str, wallet_address: str) -> Dict[str, Any]:
+        """{"tokens": {contract: {name, symbol, decimals, balance}}, "complete": bool} after catching up"""
+        address = wallet_address.lower()
+        key = f"{EVM_CHAIN_INFO[chain]['id']}:{address}"
+        synced_key = cache_service.get_key('erc20_synced', key)
+        if cache_service.get(synced_key) is None:
+            # One sync per wallet at a time, so no transfer is applied twice
+            async with cache_service.single_flight(synced_key):
+                if cache_service.get(synced_key, record=False) is None:
+                    if await self.sync(chain, address, key):
+                        cache_service.set(synced_key, True, ttl=ERC20_SYNC_INTERVAL)
+
+        entry = self.store.get(key) or {"tokens": {}, "complete": False}
+        tokens = {}
+        for contract, token in entry["tokens"].items():
+            raw = int(token["raw"])
+            if raw > 0:
+                tokens[contract] = {
+                    "name": token["name"], "symbol": token["symbol"], "decimals": token["decimals"],
+                    "balance": raw / 10 ** token["decimals"],
+                }
+        return {"tokens": tokens, "complete": entry["complete"]}
+
+    async def sync(self, chain: str, address: str, key: str) -> bool:
+        """Apply transfers after the cursor; False if the index could not be brought fully up to date"""
+        entry = self.store.get(key) or {"block": -1, "tokens": {}, "complete": False}
+        self.stats["syncs"] += 1
+        for _ in range(ERC20_MAX_PAGES):
+            transfers = await get_token_transfers(chain, address, entry["block"] + 1)
+            self.stats["calls"] += 1
+            if transfers is None:
+                return False
+            stored = self.store.get(key)
+            if stored is not None and stored["block"] != entry["block"]:
+                return False  # Another worker moved the cursor meanwhile (its lease ran out); keep its result
+            if not transfers:
+                entry["complete"] = True
+                self.store.put(key, entry)
+                return True
+
+            full = len(transfers) >= TOKEN_TRANSFERS_PAGE_SIZE
+            last_block = int(transfers[-1]["blockNumber"])
+            if full:
+                # The page may end part way through its last block: leave that block for the next page
+                head = [t for t in transfers if int(t["blockNumber"]) < last_block]
+                if not head:
+                    # The whole page is one block with more transfers of this wallet than Etherscan returns per
+                    # query, so the rest of it can't be read. Moving past it would lose them for good.
+                    logger.error(f"ERC-20 index for {address} on {chain} stuck: block {last_block} holds more than a page of transfers")
+                    entry["complete"] = False
+                    self.store.put(key, entry)
+                    return False
+                transfers = head
+                last_block = int(head[-1]["blockNumber"])
+            self.apply(entry, address, transfers)
+            entry["block"] = last_block
+            entry["complete"] = not full
+            self.store.put(key, entry)  # Per page, so a long history is resumed where it stopped
+            if not full:
+                return True
+
+        logger.info(f"ERC-20 index for {address} on {chain} still building (cursor at block {entry['block']})")
+        return False
+
+    def apply(self, entry: Dict[str, Any], address: str, transfers: List[Dict[str, Any]]):
+        tokens = entry["tokens"]
+        for transfer in transfers:
+            contract = transfer["contractAddress"].lower()
+            token = tokens.get(contract)
+            if token is None:
+                token = tokens[contract] = {
+                    "name": transfer.get("tokenName") or "Unknown",
+                    "symbol": transfer.get("tokenSymbol") or "UNK",
+                    "decimals": int(transfer.get("tokenDecimal") or 0),
+                    "raw": "0",  # Raw integer amount as text; token amounts exceed 64 bits
+                }
+            raw = int(token["raw"])
+            value = int(transfer["value"])
+            if transfer["to"].lower() == address:
+                raw += value
+            if transfer["from"].lower() == address:
+                raw -= value
+            token["raw"] = str(raw)
+        self.stats["transfers"] += len(transfers)
+
+erc20_index = Erc20Index()
@@ -0,0 +1,48 @@
+import os
+import time
+import logging
+from typing import Optional, Dict, List, Any
+
+from storage import HistoryStore, HistoryPoint, create_history_store
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+HISTORY_TOP_HOLDINGS = int(os.getenv("HISTORY_TOP_HOLDINGS", "5"))  # Holdings whose USD value is kept per point
+NATIVE_LABELS = {"solana": "SOL", "ethereum": "Native"}  # EVM native value spans ETH, POL and BNB
+HISTORY_PERIODS = {"24h": 86400, "7d": 7 * 86400, "30d": 30 * 86400, "1y": 365 * 86400}
+
+# ── Portfolio History ──────────────────────────────────────────────────────
+class PortfolioHistory:
+    """Total and top-holding values of every scanned wallet over time"""
+
+    def __init__(self, store: Optional[HistoryStore] = None):
+        self.store = store or create_history_store()
+
+    @staticmethod
+    def key(chain: str, address: str) -> str:
+        return f"{chain}:{address.lower() if chain == 'ethereum' else address}"
+
+    def record(self, report: Dict[str, Any]) -> Optional[Dict[str, float]]:
+        """Append the report's values; returns the previous point as {"scanned_at", "total_value_usd"}"""
+        key = self.key(report["chain"], report["address"])
+        top = [(NATIVE_LABELS.get(report["chain"], "Native"), report["native_value_usd"])]
+        top += [(token.symbol, token.token_usd_value) for token in report["tokens"]]
+        top.sort(key=lambda holding: holding[1], reverse=True)
+        try:
+            previous = self.store.last(key)
+            self.store.append(key, (report["scanned_at"], report["total_value_usd"], tuple(top[:HISTORY_TOP_HOLDINGS])))
+        except Exception as e:
+            # History is a nice-to-have; a scan never fails because of it
+            logger.error(f"Error recording portfolio history of {report['address']}: {e}")
+            return None
+        if previous is None:
+            return None
+        return {"scanned_at": previous[0], "total_value_usd": previous[1]}
+
+    def range(self, chain: str, address: str, seconds: float) -> List[HistoryPoint]:
+        now = time.time()
+        return self.store.range(self.key(chain, address), now - seconds, now)
+
+portfolio_history = PortfolioHistory()
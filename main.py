@@ -1,31 +1,53 @@
 import os
+import sys
+import time
+import math
 import shutil
-import json
 import logging
 import asyncio
-import aiofiles
-import aiohttp
 from datetime import datetime
-from typing import Optional, Dict
+from collections import OrderedDict
+from typing import Optional, Dict, List, Any, Tuple
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+PROCESS_STARTED = time.monotonic()  # Start of the cold-start measurement
+
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+)
+from telegram.request import BaseRequest
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, InlineQueryHandler
+)
 from dotenv import load_dotenv
-from colorama import init, Fore, Style
-from pyfiglet import Figlet
+
+# Load environment variables before the local modules read their configuration
+load_dotenv()
 
 # Import from new modules
-from services import (
-    get_sol_balance, get_sol_price, get_token_accounts, get_token_data_dexscreener,
-    get_eth_balance, get_eth_price, ssl_context
+from analysis import (
+    analyze_solana_wallet, analyze_ethereum_wallet, analyze_batch, analyze_wallet, analyze_native_balance,
+    MIN_TOKEN_VALUE_USD, STAGE_FETCHED, STAGE_PRICED
 )
+from services import prewarm, close_session, invalidate_solana_wallet, etherscan_keys
+from watchlist import (
+    watch_poller, snapshot, load_snapshot, save_snapshot, diff_snapshots, WATCH_MAX_PER_USER
+)
+from subscriptions import subscription_engine
+from history import portfolio_history, HISTORY_PERIODS
+from summaries import summary_cache, WalletSummary
 from utils import (
     escape_markdown, escape_markdown_v2, format_large_number, format_percentage,
-    validate_wallet_address
+    format_usd_change, format_age, sparkline, validate_wallet_address
 )
-
-# Load environment variables
-load_dotenv()
+from outbound import (
+    outbound, ProgressReporter, PRIORITY_REPLY, PRIORITY_LOG, PRIORITY_BROADCAST
+)
+from scan_scheduler import scan_scheduler, ScanTicket
+from ratelimit import rate_limiter, DEFAULT_TIER
+from webhook import WebhookServer, BOT_MODE, WEBHOOK_SECRET
+from storage import create_user_store, create_token_bucket
+from metrics import MetricsServer, SCAN_LATENCY, STARTUP_SECONDS, INLINE_QUERIES, METRICS_PORT, wallet_size_bucket
+from tracing import tracer, traced, activate, span, annotate, Trace
 
 # Logging configuration
 logging.basicConfig(level=logging.INFO)
@@ -34,78 +56,103 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("telegram").setLevel(logging.WARNING)
 logging.getLogger("apscheduler").setLevel(logging.WARNING)
 
-# Configuration
+# Configuration (checked by validate_config() when the bot starts, so importing this module never fails)
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-if TELEGRAM_TOKEN is None:
-    raise RuntimeError("TELEGRAM_TOKEN is not set in the environment variables!")
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL")  # Override for a local Bot API server or fake Telegram
+COLD_START_TARGET = float(os.getenv("COLD_START_TARGET", "3.0"))  # Seconds from process start to first reply
+
+def env_chat_id(name: str) -> Optional[int]:
+    try:
+        return int(os.getenv(name) or 0) or None
+    except ValueError:
+        return None
 
 # Admin configuration
-ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
-LOG_CHANNEL_ID = os.getenv("LOG_CHANNEL_ID")
+ADMIN_CHAT_ID = env_chat_id("ADMIN_CHAT_ID")
+LOG_CHANNEL_ID = env_chat_id("LOG_CHANNEL_ID")
 
-if ADMIN_CHAT_ID:
-    ADMIN_CHAT_ID = int(ADMIN_CHAT_ID)
-if LOG_CHANNEL_ID:
-    LOG_CHANNEL_ID = int(LOG_CHANNEL_ID)
+def validate_config() -> List[str]:
+    """Configuration problems that stop the bot from starting; warnings are printed directly"""
+    errors = []
+    if not TELEGRAM_TOKEN:
+        errors.append("TELEGRAM_TOKEN not found in environment variables")
+    for name in ("ADMIN_CHAT_ID", "LOG_CHANNEL_ID"):
+        if os.getenv(name) and env_chat_id(name) is None:
+            errors.append(f"{name} must be a numeric chat ID")
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+        # Shared by every worker behind the webhook URL, so it can't be generated per process
+        errors.append("WEBHOOK_SECRET must be set when BOT_MODE=webhook, or anyone can post forged updates")
+    if not os.getenv("ETHERSCAN_API_KEY") and not os.getenv("ETHERSCAN_API_KEYS"):
+        print("⚠️  Warning: ETHERSCAN_API_KEY not set. EVM balances will be unavailable.")
 
-if not ADMIN_CHAT_ID and not LOG_CHANNEL_ID:
-    print("⚠️  Warning: Neither ADMIN_CHAT_ID nor LOG_CHANNEL_ID set in .env file. Admin notifications disabled.")
-elif LOG_CHANNEL_ID:
-    print("✅ User logging will be sent to private channel/group.")
-elif ADMIN_CHAT_ID:
-    print("✅ User logging will be sent to admin direct message.")
+    if not ADMIN_CHAT_ID and not LOG_CHANNEL_ID:
+        print("⚠️  Warning: Neither ADMIN_CHAT_ID nor LOG_CHANNEL_ID set in .env file. Admin notifications disabled.")
+    elif LOG_CHANNEL_ID:
+        print("✅ User logging will be sent to private channel/group.")
+    elif ADMIN_CHAT_ID:
+        print("✅ User logging will be sent to admin direct message.")
+    return errors
 
 # Constants
 MAX_MESSAGE_LENGTH = 4000
+BATCH_TOP_TOKENS = 10  # Tokens listed in a batch's combined portfolio
 TOKENS_PER_PAGE = 6
-MIN_TOKEN_VALUE_USD = 0.01
+REPORTS_KEPT = 1000  # Latest Solana reports kept so token page buttons page through them instead of rescanning
+EVM_TOKENS_SHOWN = 10  # ERC-20 tokens listed in an EVM report
+WATCH_ALERT_TOKENS = 5  # Token changes listed per watch alert
+WATCH_SCAN_USER = "watchlist"  # Scan scheduler queue for rescans of watched wallets
+HISTORY_DEFAULT_PERIOD = "7d"
+HISTORY_SPARK_WIDTH = 24  # Characters in the /history sparkline
+INLINE_QUICK_TIMEOUT = 2.0  # Seconds an inline answer may wait for a native balance when no summary is cached
+INLINE_CACHE_SECONDS = 60   # How long Telegram may reuse an inline answer built from a full scan
+INLINE_QUICK_CACHE_SECONDS = 5  # ... and one without tokens, so the full summary replaces it soon
+QUEUE_STATUS_INTERVAL = 2.0  # Seconds between queue position updates while a scan waits
 
-# User Tracking
-USER_DATA_FILE = "user_data.json"
-known_users = {}
-user_count = 0
+SOLANA_PROGRESS = {
+    STAGE_FETCHED: (
+        f"🔍 *Analyzing Solana wallet...*\n"
+        f"✅ Wallet balance loaded\n"
+        f"✅ Current prices fetched\n"
+        f"✅ Token accounts loaded\n"
+        f"⏳ Processing token data..."
+    ),
+    STAGE_PRICED: (
+        f"🔍 *Analyzing Solana wallet...*\n"
+        f"✅ Wallet balance loaded\n"
+        f"✅ Current prices fetched\n"
+        f"✅ Token accounts loaded\n"
+        f"✅ Token data processed\n"
+        f"⏳ Generating report..."
+    ),
+}
 
-async def load_user_data():
-    global user_count, known_users
-    try:
-        if os.path.exists(USER_DATA_FILE):
-            async with aiofiles.open(USER_DATA_FILE, 'r') as f:
-                content = await f.read()
-                data = json.loads(content)
-                user_count = data.get('user_count', 0)
-                known_users = data.get('users', {})
-        else:
-            known_users = {}
-            user_count = 0
-    except Exception as e:
-        logger.error(f"Error loading user data: {e}")
-        known_users = {}
+# User Tracking (JSON file by default, shared SQLite with STORAGE_BACKEND=sqlite)
+user_store = create_user_store()
 
-async def save_user_data():
-    try:
-        data = {
-            'user_count': user_count,
-            'users': known_users
-        }
-        async with aiofiles.open(USER_DATA_FILE, 'w') as f:
-            await f.write(json.dumps(data, indent=2))
-    except Exception as e:
-        logger.error(f"Error saving user data: {e}")
+async def load_user_data():
+    await user_store.load()
+    rate_limiter.load_tiers(user_store.get_meta('tiers'))
+    # Per-user buckets in the shared storage backend, so limits hold across workers
+    rate_limiter.create_bucket = create_token_bucket
 
 async def increment_user_interaction(user_id: int, interaction_type: str):
     """Increment interaction count for a user"""
-    global known_users
-    user_key = str(user_id)
-    if user_key in known_users:
-        if 'interactions' not in known_users[user_key]:
-            known_users[user_key]['interactions'] = {'total': 0, 'scans': 0, 'commands': 0}
-        known_users[user_key]['interactions']['total'] += 1
+    def bump(record):
+        if 'interactions' not in record:
+            record['interactions'] = {'total': 0, 'scans': 0, 'commands': 0}
+        record['interactions']['total'] += 1
         if interaction_type == 'scan':
-            known_users[user_key]['interactions']['scans'] += 1
+            record['interactions']['scans'] += 1
         elif interaction_type == 'command':
-            known_users[user_key]['interactions']['commands'] += 1
-        known_users[user_key]['last_active'] = datetime.now().isoformat()
-        await save_user_data()
+            record['interactions']['commands'] += 1
+        record['last_active'] = datetime.now().isoformat()
+    await user_store.modify(user_id, bump)
+
+def get_user_tier(user_id: int) -> str:
+    """Rate-limit tier for a user; the admin is never limited"""
+    if ADMIN_CHAT_ID and user_id == ADMIN_CHAT_ID:
+        return 'unlimited'
+    return (user_store.get(user_id) or {}).get('tier') or DEFAULT_TIER
 
 async def log_activity(application, user_id: int, activity: str, wallet_address: Optional[str] = None):
     """Log user activity to the admin channel/chat"""
@@ -114,7 +161,7 @@ async def log_activity(application, user_id: int, activity: str, wallet_address:
         return
     
     try:
-        user_info = known_users.get(str(user_id), {})
+        user_info = user_store.get(user_id) or {}
         username = user_info.get('username')
         username_display = f"@{username}" if username else f"ID:{user_id}"
         interactions = user_info.get('interactions', {}).get('total', 0)
@@ -133,9 +180,11 @@ async def log_activity(application, user_id: int, activity: str, wallet_address:
             f"🔍 {escape_markdown_v2(activity)}{wallet_display}"
         )
         
-        await application.bot.send_message(
-            chat_id=target_chat_id,
-            text=activity_msg,
+        outbound.send_nowait(
+            application.bot,
+            target_chat_id,
+            activity_msg,
+            priority=PRIORITY_LOG,
             parse_mode="MarkdownV2"
         )
     except Exception as e:
@@ -148,15 +197,17 @@ async def log_command(application, user_id: int, command: str):
         return
     
     try:
-        user_info = known_users.get(str(user_id), {})
+        user_info = user_store.get(user_id) or {}
         username = user_info.get('username')
         username_display = f"@{username}" if username else f"ID:{user_id}"
         
         cmd_msg = f"⌨️ {escape_markdown_v2(username_display)} used `/{escape_markdown_v2(command)}`"
         
-        await application.bot.send_message(
-            chat_id=target_chat_id,
-            text=cmd_msg,
+        outbound.send_nowait(
+            application.bot,
+            target_chat_id,
+            cmd_msg,
+            priority=PRIORITY_LOG,
             parse_mode="MarkdownV2"
         )
     except Exception as e:
@@ -177,7 +228,8 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     # Notify user if it was an update from them
     if isinstance(update, Update) and update.effective_message:
         try:
-            await update.effective_message.reply_text(
+            await outbound.reply(
+                update.effective_message,
                 "❌ *An unexpected error occurred\\.*\nOur team has been notified\\.",
                 parse_mode="MarkdownV2"
             )
@@ -193,7 +245,7 @@ async def notify_admin_error(application, error_type: str, error_msg: str, user_
     try:
         user_info = ""
         if user_id:
-            user_data = known_users.get(str(user_id), {})
+            user_data = user_store.get(user_id) or {}
             username = user_data.get('username')
             user_info = f"\n👤 User: {escape_markdown_v2(f'@{username}' if username else f'ID:{user_id}')}"
         
@@ -203,9 +255,11 @@ async def notify_admin_error(application, error_type: str, error_msg: str, user_
             f"📝 *Details:* `{escape_markdown_v2(str(error_msg)[:200])}`"
         )
         
-        await application.bot.send_message(
-            chat_id=target_chat_id,
-            text=alert_msg,
+        outbound.send_nowait(
+            application.bot,
+            target_chat_id,
+            alert_msg,
+            priority=PRIORITY_LOG,
             parse_mode="MarkdownV2"
         )
     except Exception as e:
@@ -213,6 +267,12 @@ async def notify_admin_error(application, error_type: str, error_msg: str, user_
 
 # Helper Functions
 def print_banner():
+    # Cosmetic only: skipped (with its imports) when output is not a terminal, e.g. in containers
+    if not sys.stdout.isatty() or os.getenv("NO_BANNER"):
+        return
+    from colorama import init, Fore, Style
+    from pyfiglet import Figlet
+
     if os.name == 'nt':
         os.system('cls')
     else:
@@ -228,19 +288,20 @@ def print_banner():
         Fore.LIGHTMAGENTA_EX, Fore.LIGHTCYAN_EX, Fore.LIGHTWHITE_EX
     ]
     color_count = len(colors)
-    colored_banner = ""
+    colored_banner = []
     color_idx = 0
     for char in banner:
         if char != " " and char != "\n":
-            colored_banner += colors[color_idx % color_count] + char + Style.RESET_ALL
+            colored_banner.append(colors[color_idx % color_count] + char + Style.RESET_ALL)
             color_idx += 1
         else:
-            colored_banner += char
-    for line in colored_banner.rstrip().split('\n'):
+            colored_banner.append(char)
+    for line in "".join(colored_banner).rstrip().split('\n'):
         print(line.center(terminal_width))
+    print("\n" * 3)
 
 async def ensure_user_registered(application, user) -> None:
-    """Ensure user is in known_users and data is saved"""
+    """Ensure user is in the user store and data is saved"""
     if not user:
         return
         
@@ -288,11 +349,8 @@ async def notify_admin_new_user(application, user_id: int, username: Optional[st
         return
     
     try:
-        global user_count, known_users
-        user_count += 1
-        
-        known_users[str(user_id)] = {
-            'user_number': user_count,
+        # The store assigns the user number atomically, so concurrent workers never share one
+        user_count = await user_store.register(user_id, {
             'username': username,
             'first_name': first_name,
             'last_name': last_name,
@@ -300,9 +358,9 @@ async def notify_admin_new_user(application, user_id: int, username: Optional[st
             'join_date': datetime.now().isoformat(),
             'last_active': datetime.now().isoformat(),
             'interactions': {'total': 0, 'scans': 0, 'commands': 0}
-        }
-        
-        await save_user_data()
+        })
+        if user_count is None:
+            return  # Registered concurrently by another handler or worker
         
         username_display = f"@{username}" if username else "No username"
         full_name = f"{first_name or ''} {last_name or ''}".strip() or "No name"
@@ -333,28 +391,29 @@ async def notify_admin_new_user(application, user_id: int, username: Optional[st
                 f"📅 *Joined:* {escape_markdown_v2(join_date_str)}"
             )
         
-        await application.bot.send_message(
-            chat_id=target_chat_id,
-            text=admin_msg,
+        outbound.send_nowait(
+            application.bot,
+            target_chat_id,
+            admin_msg,
+            priority=PRIORITY_LOG,
             parse_mode="MarkdownV2"
         )
         
         if LOG_CHANNEL_ID and ADMIN_CHAT_ID and user_count % 10 == 0:
             milestone_msg = f"🎉 *Milestone Alert\\!*\n\nBot has reached **{user_count} total users**\\!"
-            try:
-                await application.bot.send_message(
-                    chat_id=ADMIN_CHAT_ID,
-                    text=milestone_msg,
-                    parse_mode="MarkdownV2"
-                )
-            except Exception:
-                pass
+            outbound.send_nowait(
+                application.bot,
+                ADMIN_CHAT_ID,
+                milestone_msg,
+                priority=PRIORITY_LOG,
+                parse_mode="MarkdownV2"
+            )
         
     except Exception as e:
         logger.error(f"Error notifying admin about new user: {e}")
 
 def is_new_user(user_id: int) -> bool:
-    return str(user_id) not in known_users
+    return user_store.get(user_id) is None
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_message and update.effective_user:
@@ -384,7 +443,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         keyboard = InlineKeyboardMarkup([
             [InlineKeyboardButton("ℹ️ About", callback_data="about")]
         ])
-        await update.effective_message.reply_text(
+        await outbound.reply(
+            update.effective_message,
             welcome_msg,
             parse_mode="Markdown",
             reply_markup=keyboard
@@ -396,7 +456,8 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await log_command(context.application, update.effective_user.id, "status")
         await increment_user_interaction(update.effective_user.id, 'command')
         
-        await update.effective_message.reply_text(
+        await outbound.reply(
+            update.effective_message,
             f"✅ *Bot is running!*\n\n⏰ *Uptime:* `{escape_markdown(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))}`",
             parse_mode="Markdown"
         )
@@ -414,24 +475,29 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             "📜 *Available Commands:*\n"
             "• `/start` \\- Show welcome message\n"
             "• `/help` \\- Show this help message\n"
-            "• `/status` \\- Check if the bot is online\n\n"
+            "• `/status` \\- Check if the bot is online\n"
+            "• `/watch <address>` \\- Get a message when a Solana wallet's balances change\n"
+            "• `/unwatch <address>` \\- Stop watching a wallet\n"
+            "• `/history <address> [24h|7d|30d|1y]` \\- Value of a scanned wallet over time\n\n"
             "✨ *Pro Tips:*\n"
             "• You can send multiple addresses at once (one per line) for batch scanning\\.\n"
+            "• `0x` addresses are checked on every supported EVM chain \\(Ethereum, Base, Arbitrum and more\\) at once\\.\n"
             "• Use the **Refresh** button on any report to get latest price data\\.\n"
             "• Only tokens worth more than **$0\\.01** are shown in the detailed list to keep things clean\\."
         )
-        await update.effective_message.reply_text(help_text, parse_mode="MarkdownV2")
+        await outbound.reply(update.effective_message, help_text, parse_mode="MarkdownV2")
 
 async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.effective_user or not update.effective_message:
         return
         
     if not ADMIN_CHAT_ID or update.effective_user.id != ADMIN_CHAT_ID:
-        await update.effective_message.reply_text("❌ *Access Denied*", parse_mode="Markdown")
+        await outbound.reply(update.effective_message, "❌ *Access Denied*", parse_mode="Markdown")
         return
 
     if not context.args:
-        await update.effective_message.reply_text(
+        await outbound.reply(
+            update.effective_message,
             "❌ *Usage:* `/broadcast [your message]`\n\n"
             "This will send a message to all registered users\\.",
             parse_mode="MarkdownV2"
@@ -450,47 +516,175 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     sent_count = 0
     fail_count = 0
     
-    status_msg = await update.effective_message.reply_text(f"⏳ Sending broadcast to {len(known_users)} users...")
+    user_ids = list(user_store.all().keys())
+    status_msg = await outbound.reply(update.effective_message, f"⏳ Sending broadcast to {len(user_ids)} users...")
     
-    for user_id in known_users.keys():
-        try:
-            await context.application.bot.send_message(
-                chat_id=int(user_id),
-                text=formatted_msg,
-                parse_mode="Markdown"
-            )
-            sent_count += 1
-            # Rate limiting prevention
-            if sent_count % 20 == 0:
-                await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"Failed to send broadcast to {user_id}: {e}")
+    # The outbound scheduler paces these behind user replies and within Telegram's limits
+    results = await asyncio.gather(*[
+        outbound.send(
+            context.application.bot,
+            int(user_id),
+            formatted_msg,
+            priority=PRIORITY_BROADCAST,
+            parse_mode="Markdown"
+        )
+        for user_id in user_ids
+    ], return_exceptions=True)
+    
+    for user_id, result in zip(user_ids, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to send broadcast to {user_id}: {result}")
             fail_count += 1
+        else:
+            sent_count += 1
             
-    await status_msg.edit_text(
+    await outbound.edit(
+        status_msg,
         f"✅ *Broadcast Complete*\n\n"
-        f"👤 *Total Users:* `{len(known_users)}`\n"
+        f"👤 *Total Users:* `{len(user_ids)}`\n"
         f"✅ *Sent:* `{sent_count}`\n"
         f"❌ *Failed:* `{fail_count}`",
+        priority=PRIORITY_REPLY,
+        parse_mode="Markdown"
+    )
+
+async def tier_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin: list rate-limit tiers, assign a user's tier or change a tier limit"""
+    if not update.effective_user or not update.effective_message:
+        return
+
+    if not ADMIN_CHAT_ID or update.effective_user.id != ADMIN_CHAT_ID:
+        await outbound.reply(update.effective_message, "❌ *Access Denied*", parse_mode="Markdown")
+        return
+
+    args = context.args or []
+    limit_names = list(rate_limiter.limits(DEFAULT_TIER).keys())
+    usage = (
+        "❌ *Usage:*\n"
+        "`/tier` - list tiers\n"
+        "`/tier <user_id|@username> <tier>` - assign a tier\n"
+        "`/tier set <tier> <limit> <value|none>` - change a limit\n\n"
+        f"*Limits:* `{escape_markdown(', '.join(limit_names))}`"
+    )
+
+    if not args:
+        lines = []
+        users = user_store.all()
+        for name, limits in rate_limiter.tiers.items():
+            members = sum(1 for info in users.values() if (info.get('tier') or DEFAULT_TIER) == name)
+            values = ", ".join(f"{key}={'∞' if value is None else f'{value:g}'}" for key, value in limits.items())
+            lines.append(f"*{escape_markdown(name)}* ({members} users)\n`{escape_markdown(values)}`")
+        await outbound.reply(
+            update.effective_message,
+            f"🎚️ *Rate Limit Tiers*\n━━━━━━━━━━━━━━━━━━━━━━\n\n" + "\n\n".join(lines) + f"\n\n*Default:* `{escape_markdown(DEFAULT_TIER)}`",
+            parse_mode="Markdown"
+        )
+        return
+
+    if args[0] == 'set' and len(args) == 4:
+        _, tier_name, limit, value = args
+        if limit not in limit_names:
+            await outbound.reply(update.effective_message, usage, parse_mode="Markdown")
+            return
+        try:
+            parsed = None if value.lower() in ('none', 'unlimited', 'off') else float(value)
+        except ValueError:
+            await outbound.reply(update.effective_message, usage, parse_mode="Markdown")
+            return
+        rate_limiter.set_limit(tier_name, limit, parsed)
+        await user_store.set_meta('tiers', rate_limiter.tiers)
+        await outbound.reply(
+            update.effective_message,
+            f"✅ *{escape_markdown(tier_name)}* `{escape_markdown(limit)}` set to `{escape_markdown(value)}`",
+            parse_mode="Markdown"
+        )
+        return
+
+    if len(args) != 2:
+        await outbound.reply(update.effective_message, usage, parse_mode="Markdown")
+        return
+
+    target, tier_name = args
+    if tier_name not in rate_limiter.tiers:
+        await outbound.reply(update.effective_message, f"❌ Unknown tier `{escape_markdown(tier_name)}`", parse_mode="Markdown")
+        return
+
+    if target.startswith('@'):
+        user_key = next((uid for uid, info in user_store.all().items() if (info.get('username') or '').lower() == target[1:].lower()), None)
+    else:
+        user_key = target
+
+    if user_key is None or not await user_store.modify(user_key, lambda record: record.update(tier=tier_name)):
+        await outbound.reply(update.effective_message, f"❌ Unknown user `{escape_markdown(target)}`", parse_mode="Markdown")
+        return
+    await outbound.reply(
+        update.effective_message,
+        f"✅ User `{escape_markdown(target)}` moved to *{escape_markdown(tier_name)}*",
+        parse_mode="Markdown"
+    )
+
+def format_trace(rank: int, trace: Trace) -> str:
+    address = trace.find('address', '')
+    phases = " · ".join(f"{phase} {seconds:.2f}s" for phase, seconds in trace.breakdown().items())
+    lookups = trace.cache_hits + trace.cache_misses
+    line = (
+        f"#{rank} `{trace.duration:.2f}s` {escape_markdown(trace.find('chain', trace.name))} "
+        f"`{escape_markdown(address[:6])}...{escape_markdown(address[-4:])}` "
+        f"({escape_markdown(datetime.fromtimestamp(trace.started_at).strftime('%H:%M:%S'))})\n"
+        f"{escape_markdown(phases) if phases else 'no phases recorded'}"
+    )
+    if trace.find('tokens') is not None:
+        line += f"\n{trace.find('tokens')} tokens"
+    if lookups:
+        line += f", cache {trace.cache_hits}/{lookups} hits"
+    if trace.find('error'):
+        line += f"\n❌ `{escape_markdown(str(trace.find('error'))[:80])}`"
+    return line
+
+async def trace_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin: show the slowest recent scans with their phase breakdown, or export them as JSON"""
+    if not update.effective_user or not update.effective_message:
+        return
+
+    if not ADMIN_CHAT_ID or update.effective_user.id != ADMIN_CHAT_ID:
+        await outbound.reply(update.effective_message, "❌ *Access Denied*", parse_mode="Markdown")
+        return
+
+    args = context.args or []
+    if args and args[0].lower() == 'json':
+        document = tracer.to_json().encode()
+        filename = f"traces-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        await outbound.submit(
+            update.effective_message.chat_id, PRIORITY_REPLY,
+            update.effective_message.reply_document, document=document, filename=filename
+        )
+        return
+
+    limit = min(int(args[0]), 20) if args and args[0].isdigit() else 5
+    stats = tracer.stats()
+    traces = tracer.slowest(limit)
+    body = "\n\n".join(format_trace(rank, trace) for rank, trace in enumerate(traces, 1))
+    await outbound.reply(
+        update.effective_message,
+        f"🧭 *Slowest Recent Scans*\n━━━━━━━━━━━━━━━━━━━━━━\n\n"
+        f"{body if body else 'No scans slower than ' + format(stats['slow_seconds'], 'g') + 's yet'}\n\n"
+        f"`{stats['buffered']}` kept of `{stats['finished']}` traced • `/trace json` to export",
         parse_mode="Markdown"
     )
 
 async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_message and update.effective_user:
         if not ADMIN_CHAT_ID or update.effective_user.id != ADMIN_CHAT_ID:
-            await update.effective_message.reply_text("❌ *Access Denied*", parse_mode="Markdown")
+            await outbound.reply(update.effective_message, "❌ *Access Denied*", parse_mode="Markdown")
             return
         
         # Log command usage
         await log_command(context.application, update.effective_user.id, "stats")
         
         try:
-            if not known_users:
-                await load_user_data()
-
             recent_users = []
             sorted_users = sorted(
-                known_users.items(), 
+                user_store.all().items(), 
                 key=lambda x: x[1].get('user_number', 0), 
                 reverse=True
             )
@@ -516,54 +710,59 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                 recent_users.append(f"#{user_num} {escape_markdown(name_display)} ({escape_markdown(username_display)}) - {escape_markdown(join_str)}")
             
             log_destination = "Private Channel/Group" if LOG_CHANNEL_ID else "Direct Messages" if ADMIN_CHAT_ID else "Disabled"
-            
+
+            scan_stats = scan_scheduler.stats()
+            queue_stats = outbound.stats()
+            queue_lines = [
+                f"• {name}: {stats['queued']} queued, avg {stats['avg_wait']:.2f}s, p95 {stats['p95_wait']:.2f}s, max {stats['max_wait']:.2f}s"
+                for name, stats in queue_stats['priorities'].items()
+            ]
+            key_lines = []
+            for key in etherscan_keys.stats():
+                line = (f"• {key['key']}: {key['calls']} calls, {key['in_flight']} in flight, "
+                        f"{key['rate_limited']} rate limited, {key['invalid']} invalid, {key['errors']} errors")
+                if key['benched_for']:
+                    line += f", benched {key['benched_for']:.0f}s ({key['bench_reason']})"
+                key_lines.append(line)
+
             stats_msg = (
                 f"📊 *Bot Statistics*\n"
                 f"━━━━━━━━━━━━━━━━━━━━━━\n\n"
-                f"👥 *Total Users:* `{user_count}`\n"
+                f"👥 *Total Users:* `{user_store.count()}`\n"
                 f"📍 *Logging to:* `{escape_markdown(log_destination)}`\n"
                 f"📅 *Last Updated:* `{escape_markdown(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))}`\n\n"
                 f"🆕 *Recent Users (Last 10):*\n"
-                f"{chr(10).join(recent_users) if recent_users else 'No users yet'}"
+                f"{chr(10).join(recent_users) if recent_users else 'No users yet'}\n\n"
+                f"⚙️ *Scan Workers:* `{scan_stats['running']}/{scan_stats['workers']}` busy, `{scan_stats['queued_single']}` single + `{scan_stats['queued_batch']}` batch queued, avg `{scan_stats['avg_duration']:.1f}s`\n"
+                f"📮 *Outbound Queue:* `{queue_stats['sent']}` sent, `{queue_stats['failed']}` failed, `{queue_stats['retried']}` flood retries (`{queue_stats['retry_wait']:.0f}s` paused), `{queue_stats['replaced']}` stale edits dropped\n"
+                f"{escape_markdown(chr(10).join(queue_lines))}\n"
+                f"🔑 *Etherscan Keys:*\n{escape_markdown(chr(10).join(key_lines)) if key_lines else '`none configured`'}"
             )
             
-            await update.effective_message.reply_text(stats_msg, parse_mode="Markdown")
+            await outbound.reply(update.effective_message, stats_msg, parse_mode="Markdown")
         
         except Exception as e:
-            await update.effective_message.reply_text(
+            await outbound.reply(
+                update.effective_message,
                 f"❌ *Error fetching stats:* `{escape_markdown(str(e))}`",
                 parse_mode="Markdown"
             )
 
-async def create_enhanced_solana_analysis(wallet_address: str, progress_callback=None):
-    # Fetch data
-    sol_balance_task = get_sol_balance(wallet_address)
-    sol_price_task = get_sol_price()
-    token_accounts_task = get_token_accounts(wallet_address)
-    
-    sol_balance, sol_price_usd, token_accounts = await asyncio.gather(
-        sol_balance_task, sol_price_task, token_accounts_task
-    )
-    
-    if progress_callback:
-        await progress_callback(
-            f"🔍 *Analyzing Solana wallet...*\n"
-            f"✅ Wallet balance loaded\n"
-            f"✅ Current prices fetched\n"
-            f"✅ Token accounts loaded\n"
-            f"⏳ Processing token data..."
-        )
-    
-    sol_usd_value = sol_balance * sol_price_usd if sol_price_usd > 0 else 0.0
-    
-    # Process tokens
-    mint_balances = {}
-    for account in token_accounts:
-        info = account.get("account", {}).get("data", {}).get("parsed", {}).get("info", {})
-        mint = info.get("mint")
-        balance = info.get("tokenAmount", {}).get("uiAmount", 0)
-        if mint and balance > 0:
-            mint_balances[mint] = mint_balances.get(mint, 0) + balance
+def format_since_last_scan(report: Dict[str, Any]) -> str:
+    """Value change since the wallet's previous scan, as a header line ("" for a first scan)"""
+    previous = report.get('previous_scan')
+    if not previous:
+        return ""
+    change = format_usd_change(report['total_value_usd'] - previous['total_value_usd'], previous['total_value_usd'])
+    age = format_age(report['scanned_at'] - previous['scanned_at'])
+    return f"📈 *Since Last Scan:* `{escape_markdown(change)}` ({escape_markdown(age)} ago)\n"
+
+def render_solana_report(report: Dict[str, Any]):
+    """Header message, token pages and keyboard for a Solana wallet report"""
+    sol_balance = report['native_balance']
+    sol_price_usd = report['native_price_usd']
+    sol_usd_value = report['native_value_usd']
+    token_details = report['tokens']
 
     last_updated_str = datetime.now().strftime('%H:%M:%S')
 
@@ -573,105 +772,88 @@ async def create_enhanced_solana_analysis(wallet_address: str, progress_callback
         f"💰 *SOL Balance:* `{escape_markdown(format_large_number(sol_balance))}` SOL\n"
         f"💵 *SOL Price:* `${escape_markdown(f'{sol_price_usd:,.2f}')}`\n"
         f"💎 *SOL Value:* `${escape_markdown(f'{sol_usd_value:,.2f}')}`\n"
-        f"🪙 *SPL Tokens:* `{escape_markdown(str(len(mint_balances)))}` different tokens\n"
+        f"🪙 *SPL Tokens:* `{escape_markdown(str(report['token_count']))}` different tokens\n"
     )
     
-    if not mint_balances:
+    if not report['token_count']:
         header_msg += f"📭 *No SPL Tokens Found*\n\n"
-        header_msg += f"🏦 *Total Portfolio Value:* `${escape_markdown(f'{sol_usd_value:,.2f}')}`"
-        return header_msg, [], create_wallet_keyboard(wallet_address, 'solana')
-
-    # Fetch token details
-    token_details = []
-    total_tokens_value_sol = 0.0
-    total_tokens_value_usd = 0.0
-    valuable_tokens = 0
-    
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-        tasks = [get_token_data_dexscreener(session, mint, sol_price_usd) for mint in mint_balances.keys()]
-        token_data_list = await asyncio.gather(*tasks)
-    
-    for mint, balance, token_data in zip(mint_balances.keys(), mint_balances.values(), token_data_list):
-        if token_data and token_data["name"] != "Unknown":
-            token_sol_value = balance * token_data["price_in_sol"] if token_data["price_in_sol"] else 0
-            token_usd_value = balance * token_data["price_usd"] if token_data["price_usd"] else 0
-            
-            if token_usd_value >= MIN_TOKEN_VALUE_USD:
-                valuable_tokens += 1
-                total_tokens_value_sol += token_sol_value
-                total_tokens_value_usd += token_usd_value
-                
-                token_details.append({
-                    "name": token_data["name"],
-                    "symbol": token_data["symbol"],
-                    "mint": mint,
-                    "balance": balance,
-                    "token_sol_value": token_sol_value,
-                    "token_usd_value": token_usd_value,
-                    "price_usd": token_data["price_usd"],
-                    "market_cap": token_data["market_cap"],
-                    "volume_24h": token_data["volume_24h"],
-                    "price_change_24h": token_data["price_change_24h"],
-                    "url": token_data["url"]
-                })
-    
-    token_details.sort(key=lambda x: x['token_usd_value'], reverse=True)
-    
-    if progress_callback:
-        await progress_callback(
-            f"🔍 *Analyzing Solana wallet...*\n"
-            f"✅ Wallet balance loaded\n"
-            f"✅ Current prices fetched\n"
-            f"✅ Token accounts loaded\n"
-            f"✅ Token data processed\n"
-            f"⏳ Generating report..."
-        )
-    
-    total_wallet_value = sol_usd_value + total_tokens_value_usd
+        header_msg += f"🏦 *Total Portfolio Value:* `${escape_markdown(f'{sol_usd_value:,.2f}')}`\n"
+        header_msg += format_since_last_scan(report)
+        return header_msg, [], create_wallet_keyboard(report['address'], 'solana')
+
+    with span("render"):
+        total_tokens_value_sol = report['tokens_value_native']
+        total_tokens_value_usd = report['tokens_value_usd']
+        total_wallet_value = report['total_value_usd']
     
-    header_msg += f"💼 *Portfolio Analytics:*\n"
-    header_msg += f"🪙 *Valuable Tokens:* `{escape_markdown(str(valuable_tokens))}` (>${escape_markdown(str(MIN_TOKEN_VALUE_USD))})\n"
-    header_msg += f"💰 *Token Value:* `{escape_markdown(format_large_number(total_tokens_value_sol))}` SOL (`${escape_markdown(f'{total_tokens_value_usd:,.2f}')}`)\n"
-    header_msg += f"🏦 *Total Portfolio:* `${escape_markdown(f'{total_wallet_value:,.2f}')}`\n"
-    if total_wallet_value > 0:
-        header_msg += f"📊 *Token Allocation:* `{escape_markdown(f'{(total_tokens_value_usd/total_wallet_value*100):.1f}%')}`\n"
-    else:
-        header_msg += f"📊 *Token Allocation:* `{escape_markdown('0.0%')}`\n"
-    header_msg += f"\n⏰ *Last Updated:* `{escape_markdown(last_updated_str)}`"
+        header_msg += f"💼 *Portfolio Analytics:*\n"
+        header_msg += f"🪙 *Valuable Tokens:* `{escape_markdown(str(report['valuable_tokens']))}` (>${escape_markdown(str(MIN_TOKEN_VALUE_USD))})\n"
+        header_msg += f"💰 *Token Value:* `{escape_markdown(format_large_number(total_tokens_value_sol))}` SOL (`${escape_markdown(f'{total_tokens_value_usd:,.2f}')}`)\n"
+        header_msg += f"🏦 *Total Portfolio:* `${escape_markdown(f'{total_wallet_value:,.2f}')}`\n"
+        header_msg += format_since_last_scan(report)
+        if total_wallet_value > 0:
+            header_msg += f"📊 *Token Allocation:* `{escape_markdown(f'{(total_tokens_value_usd/total_wallet_value*100):.1f}%')}`\n"
+        else:
+            header_msg += f"📊 *Token Allocation:* `{escape_markdown('0.0%')}`\n"
+        header_msg += f"\n⏰ *Last Updated:* `{escape_markdown(last_updated_str)}`"
     
-    token_messages = []
-    if token_details:
-        for i in range(0, len(token_details), TOKENS_PER_PAGE):
-            chunk = token_details[i:i + TOKENS_PER_PAGE]
-            page_num = (i // TOKENS_PER_PAGE) + 1
-            total_pages = (len(token_details) + TOKENS_PER_PAGE - 1) // TOKENS_PER_PAGE
+        token_messages = []
+        if token_details:
+            for i in range(0, len(token_details), TOKENS_PER_PAGE):
+                chunk = token_details[i:i + TOKENS_PER_PAGE]
+                page_num = (i // TOKENS_PER_PAGE) + 1
+                total_pages = (len(token_details) + TOKENS_PER_PAGE - 1) // TOKENS_PER_PAGE
             
-            token_msg = f"🪙 *Top Holdings - Page {escape_markdown(str(page_num))}/{escape_markdown(str(total_pages))}*\n━━━━━━━━━━━━━━━━━━━━━━\n\n"
+                token_msg = f"🪙 *Top Holdings - Page {escape_markdown(str(page_num))}/{escape_markdown(str(total_pages))}*\n━━━━━━━━━━━━━━━━━━━━━━\n\n"
             
-            for j, token in enumerate(chunk, 1):
-                rank = i + j
-                display_name = token['name'][:20] + "..." if len(token['name']) > 23 else token['name']
+                for j, token in enumerate(chunk, 1):
+                    rank = i + j
+                    display_name = token.name[:20] + "..." if len(token.name) > 23 else token.name
                 
-                token_msg += f"#{escape_markdown(str(rank))} *{escape_markdown(display_name)}* (`{escape_markdown(token['symbol'])}`)\n"
-                token_msg += f"📊 *Balance:* `{escape_markdown(format_large_number(token['balance']))}`\n"
-                token_msg += f"💰 *Value:* `${escape_markdown(f'{token['token_usd_value']:,.2f}')}`\n"
+                    token_msg += f"#{escape_markdown(str(rank))} *{escape_markdown(display_name)}* (`{escape_markdown(token.symbol)}`){' ✅' if token.verified else ''}\n"
+                    token_msg += f"📊 *Balance:* `{escape_markdown(format_large_number(token.balance))}`\n"
+                    token_msg += f"💰 *Value:* `${escape_markdown(f'{token.token_usd_value:,.2f}')}`\n"
                 
-                extras = []
-                if token['market_cap']:
-                    extras.append(f"MC: ${escape_markdown(format_large_number(token['market_cap']))}")
-                if token['price_change_24h'] is not None:
-                    extras.append(escape_markdown(format_percentage(token['price_change_24h'])))
+                    extras = []
+                    if token.market_cap:
+                        extras.append(f"MC: ${escape_markdown(format_large_number(token.market_cap))}")
+                    if token.price_change_24h is not None:
+                        extras.append(escape_markdown(format_percentage(token.price_change_24h)))
                 
-                if extras:
-                    token_msg += f"📈 {' • '.join(extras)}\n"
+                    if extras:
+                        token_msg += f"📈 {' • '.join(extras)}\n"
                 
-                escaped_url = token['url'].replace('(', r'\(').replace(')', r'\)')
-                token_msg += f"🔗 [DexScreener]({escaped_url})\n\n"
+                    escaped_url = token.url.replace('(', r'\(').replace(')', r'\)')
+                    token_msg += f"🔗 [DexScreener]({escaped_url})\n\n"
             
-            if len(token_msg) > MAX_MESSAGE_LENGTH:
-                token_msg = token_msg[:MAX_MESSAGE_LENGTH-100] + "...\n\n📱 *Message truncated*"
+                if len(token_msg) > MAX_MESSAGE_LENGTH:
+                    token_msg = token_msg[:MAX_MESSAGE_LENGTH-100] + "...\n\n📱 *Message truncated*"
             
-            token_messages.append(token_msg)
+                token_messages.append(token_msg)
+
+    return header_msg, token_messages, create_wallet_keyboard(report['address'], 'solana')
+
+# Latest report shown per chat and Solana wallet, for its token page buttons
+shown_reports: "OrderedDict[Tuple[Any, str], Dict[str, Any]]" = OrderedDict()
+
+def keep_report(chat_id: Any, report: Dict[str, Any]):
+    key = (chat_id, report['address'])
+    shown_reports[key] = report
+    shown_reports.move_to_end(key)
+    while len(shown_reports) > REPORTS_KEPT:
+        shown_reports.popitem(last=False)
+
+@traced("solana_analysis")
+async def create_enhanced_solana_analysis(wallet_address: str, progress_callback=None, chat_id: Any = None):
+    scan_started = time.perf_counter()
+
+    async def on_stage(stage: str):
+        if progress_callback:
+            await progress_callback(SOLANA_PROGRESS[stage])
+
+    report = await analyze_solana_wallet(wallet_address, on_stage)
+    keep_report(chat_id, report)
+    header_msg, token_messages, keyboard = render_solana_report(report)
 
     if progress_callback:
         await progress_callback(
@@ -684,26 +866,81 @@ async def create_enhanced_solana_analysis(wallet_address: str, progress_callback
             f"🎉 *Analysis complete!*"
         )
 
-    return header_msg, token_messages, create_wallet_keyboard(wallet_address, 'solana')
+    SCAN_LATENCY.observe(time.perf_counter() - scan_started, chain="solana", size=wallet_size_bucket(report['token_count']))
+    return header_msg, token_messages, keyboard
 
-async def create_enhanced_ethereum_analysis(wallet_address: str):
-    eth_balance, eth_price_usd = await asyncio.gather(
-        get_eth_balance(wallet_address),
-        get_eth_price()
-    )
-    
-    eth_usd_value = eth_balance * eth_price_usd if eth_price_usd > 0 else 0.0
-    
+def render_ethereum_report(report: Dict[str, Any]):
+    """Message and keyboard for an EVM wallet report, one line per chain"""
+    total_value = f"{report['total_value_usd']:,.2f}"
     response = (
-        f"🔷 *Enhanced Ethereum Analysis*\n"
+        f"🔷 *Enhanced EVM Analysis*\n"
         f"━━━━━━━━━━━━━━━━━━━━━━\n\n"
-        f"💰 *ETH Balance:* `{escape_markdown(format_large_number(eth_balance))}` ETH\n"
-        f"💵 *ETH Price:* `${escape_markdown(f'{eth_price_usd:,.2f}')}`\n"
-        f"💎 *Portfolio Value:* `${escape_markdown(f'{eth_usd_value:,.2f}')}`\n\n"
+    )
+    for network in report['networks']:
+        if network['error']:
+            response += f"⚠️ *{escape_markdown(network['name'])}:* `unavailable`\n"
+            continue
+        balance = escape_markdown(format_large_number(network['balance']))
+        value = f"{network['value_usd']:,.2f}"
+        response += (
+            f"⛓️ *{escape_markdown(network['name'])}:* `{balance}` {network['symbol']} "
+            f"(`${escape_markdown(value)}`)\n"
+        )
+    if report['tokens']:
+        response += f"\n🪙 *Tokens:*\n"
+        for token in report['tokens'][:EVM_TOKENS_SHOWN]:
+            value = f"{token.token_usd_value:,.2f}"
+            response += (
+                f"• *{escape_markdown(token.symbol)}* `{escape_markdown(format_large_number(token.balance))}` "
+                f"(`${escape_markdown(value)}`)\n"
+            )
+        if len(report['tokens']) > EVM_TOKENS_SHOWN:
+            response += f"_…and {len(report['tokens']) - EVM_TOKENS_SHOWN} more_\n"
+    if report.get('tokens_unavailable'):
+        response += f"⚠️ _Tokens unavailable on {escape_markdown(', '.join(report['tokens_unavailable']))}_\n"
+    elif not report.get('tokens_complete', True):
+        response += f"⏳ _Token history is still being indexed; balances may be incomplete_\n"
+    eth_price = f"{report['native_price_usd']:,.2f}"
+    response += (
+        f"\n💵 *ETH Price:* `${escape_markdown(eth_price)}`\n"
+        f"💎 *Portfolio Value:* `${escape_markdown(total_value)}`\n"
+        f"{format_since_last_scan(report)}\n"
         f"⏰ *Last Updated:* `{escape_markdown(datetime.now().strftime('%H:%M:%S'))}`"
     )
-    
-    return response, create_wallet_keyboard(wallet_address, 'ethereum')
+    return response, create_wallet_keyboard(report['address'], 'ethereum')
+
+@traced("ethereum_analysis")
+async def create_enhanced_ethereum_analysis(wallet_address: str):
+    scan_started = time.perf_counter()
+    report = await analyze_ethereum_wallet(wallet_address)
+    response, keyboard = render_ethereum_report(report)
+    SCAN_LATENCY.observe(time.perf_counter() - scan_started, chain="ethereum", size=wallet_size_bucket(report['token_count']))
+    return response, keyboard
+
+def queue_scan(user_id: int, address: str, wallet_type: str, batch: bool = False,
+               progress: Optional[ProgressReporter] = None, progress_text: Optional[str] = None,
+               trace: Optional[Trace] = None, chat_id: Any = None) -> ScanTicket:
+    """Queue a wallet analysis on the shared scan scheduler"""
+    async def run_scan():
+        if progress and progress_text:
+            progress.set(progress_text)  # Clear the queue position once the scan starts
+        if wallet_type == 'ethereum':
+            return await create_enhanced_ethereum_analysis(address)
+        return await create_enhanced_solana_analysis(address, progress, chat_id)
+    with activate(trace):
+        return scan_scheduler.submit(user_id, run_scan, batch=batch)
+
+def format_queue_status(ticket: ScanTicket) -> str:
+    eta = ticket.eta()
+    if ticket.started or eta <= 0:
+        return ""
+    return f"\n\n🕒 Queue position `{ticket.position() + 1}` (ETA ~{eta:.0f}s)"
+
+async def wait_for_scan_start(ticket: ScanTicket, progress: ProgressReporter, text: str):
+    """Keep the queue position shown on the progress message until the scan starts"""
+    while not ticket.started and not ticket.future.done():
+        progress.set(text + format_queue_status(ticket))
+        await asyncio.wait([ticket.future], timeout=QUEUE_STATUS_INTERVAL)
 
 async def handle_wallet_address(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_message and update.effective_message.text:
@@ -736,133 +973,502 @@ async def handle_wallet_address(update: Update, context: ContextTypes.DEFAULT_TY
                     error_msg += "Please send a valid wallet address:\n🟣 *Solana:* Base58 format\n🔷 *Ethereum:* Hex format starting with `0x`"
             else:
                 error_msg += f"None of the {len(lines)} addresses were valid."
-            await update.effective_message.reply_text(error_msg, parse_mode="Markdown")
+            await outbound.reply(update.effective_message, error_msg, parse_mode="Markdown")
             return
         
         # Batch mode: multiple wallets
         is_batch = len(valid_wallets) > 1
+        user_id = update.effective_user.id if update.effective_user else update.effective_message.chat_id
         
+        # Per-user rate limits
+        tier = get_user_tier(user_id)
         if is_batch:
-            # Ensure user is registered
-            if update.effective_user:
-                await ensure_user_registered(context.application, update.effective_user)
-            
-            # Show batch processing message
-            batch_msg = (
-                f"📦 *Batch Processing*\n"
-                f"━━━━━━━━━━━━━━━━━━━━━━\n\n"
-                f"✅ *Valid:* `{len(valid_wallets)}` wallets\n"
-            )
-            if invalid_wallets:
-                batch_msg += f"❌ *Invalid:* `{len(invalid_wallets)}` addresses\n"
-            batch_msg += f"\n⏳ Processing..."
-            
-            processing_msg = await update.effective_message.reply_text(batch_msg, parse_mode="Markdown")
-            
-            # Log batch activity
-            if update.effective_user:
-                await log_activity(context.application, update.effective_user.id, f"Batch scan: {len(valid_wallets)} wallets")
-                await increment_user_interaction(update.effective_user.id, 'scan')
+            max_batch, retry_after = await rate_limiter.check_batch(user_id, tier, len(valid_wallets))
+            if max_batch:
+                await outbound.reply(
+                    update.effective_message,
+                    f"📦 *Batch too large*\n\nYour plan allows up to `{max_batch}` wallets per batch, you sent `{len(valid_wallets)}`.",
+                    parse_mode="Markdown"
+                )
+                return
         else:
-            processing_msg = None
+            retry_after = await rate_limiter.check(user_id, tier, 'scan')
+        if retry_after:
+            await outbound.reply(
+                update.effective_message,
+                f"⏳ *Slow down!*\n\nYou're scanning too fast. Please try again in `{math.ceil(retry_after)}s`.",
+                parse_mode="Markdown"
+            )
+            return
+        
+        if is_batch:
+            await process_batch(update, context, user_id, valid_wallets, invalid_wallets)
+            return
         
-        # Process each wallet
-        for idx, (address, wallet_type) in enumerate(valid_wallets, 1):
+        # Single wallet
+        address, wallet_type = valid_wallets[0]
+        progress = None
+        trace = tracer.start("wallet_scan", chain=wallet_type, address=address, user_id=user_id)
+        with activate(trace):
             try:
-                # Update progress for batch mode
-                if is_batch and processing_msg:
-                    try:
-                        await processing_msg.edit_text(
-                            f"� *Batch Processing*\n"
-                            f"━━━━━━━━━━━━━━━━━━━━━━\n\n"
-                            f"⏳ Processing wallet {idx}/{len(valid_wallets)}...\n"
-                            f"📍 `{address[:6]}...{address[-4:]}`",
-                            parse_mode="Markdown"
-                        )
-                    except Exception:
-                        pass
-                else:
-                    # Single wallet mode - show standard processing message
-                    processing_msg = await update.effective_message.reply_text(
-                        f"�🔍 *Analyzing {escape_markdown(wallet_type.title())} wallet...*\n"
-                        f"⏳ Fetching wallet balance...\n"
-                        f"⏳ Getting current prices...\n"
-                        f"⏳ Loading token accounts...\n"
-                        f"⏳ Analyzing portfolio...",
-                        parse_mode="Markdown"
-                    )
-                    
-                    # Log activity for single wallet
-                    if update.effective_user:
-                        await log_activity(context.application, update.effective_user.id, f"Scanned {wallet_type.title()} wallet", address)
-                        await increment_user_interaction(update.effective_user.id, 'scan')
-                
-                async def update_progress(message_text):
-                    if processing_msg and not is_batch:
-                        try:
-                            await processing_msg.edit_text(message_text, parse_mode="Markdown")
-                        except Exception:
-                            pass
-
-                if wallet_type == 'ethereum':
-                    message, keyboard = await create_enhanced_ethereum_analysis(address)
-                    await update.effective_message.reply_text(
-                        message,
-                        parse_mode="Markdown",
-                        reply_markup=keyboard,
-                        disable_web_page_preview=True
-                    )
-                else:
-                    header_msg, token_messages, keyboard = await create_enhanced_solana_analysis(address, update_progress)
-                    
-                    await update.effective_message.reply_text(
-                        header_msg,
-                        parse_mode="Markdown",
-                        reply_markup=keyboard,
-                        disable_web_page_preview=True
-                    )
-                    if token_messages:
-                        page = 0
-                        total_pages = len(token_messages)
-                        nav_keyboard = get_token_pagination_keyboard(address, page, total_pages)
-                        await update.effective_message.reply_text(
-                            token_messages[page],
-                            parse_mode="Markdown",
-                            reply_markup=nav_keyboard,
-                            disable_web_page_preview=True
-                        )
-                
-                # Small delay between wallets to avoid rate limiting
-                if is_batch and idx < len(valid_wallets):
-                    await asyncio.sleep(1)
-                    
-            except Exception as e:
-                logger.error(f"Error analyzing wallet {address}: {e}")
-                await update.effective_message.reply_text(
-                    f"❌ *Error analyzing wallet*\n`{address[:6]}...{address[-4:]}`\n`{escape_markdown(str(e)[:100])}`",
-                    parse_mode="Markdown"
+                processing_text = (
+                    f"🔍 *Analyzing {escape_markdown(wallet_type.title())} wallet...*\n"
+                    f"⏳ Fetching wallet balance...\n"
+                    f"⏳ Getting current prices...\n"
+                    f"⏳ Loading token accounts...\n"
+                    f"⏳ Analyzing portfolio..."
                 )
+                processing_msg = await outbound.reply(update.effective_message, processing_text, parse_mode="Markdown")
+                progress = ProgressReporter(processing_msg, processing_text)
+                ticket = queue_scan(user_id, address, wallet_type, progress=progress, progress_text=processing_text,
+                                    chat_id=update.effective_message.chat_id)
+            
+                # Log activity for single wallet
                 if update.effective_user:
-                    await notify_admin_error(context.application, "Wallet Analysis Failed", str(e), update.effective_user.id)
+                    await log_activity(context.application, update.effective_user.id, f"Scanned {wallet_type.title()} wallet", address)
+                    await increment_user_interaction(update.effective_user.id, 'scan')
+
+                await wait_for_scan_start(ticket, progress, processing_text)
+                result = await ticket
+                with span("send"):
+                    await send_wallet_result(update.effective_message, address, wallet_type, result)
+                
+            except Exception as e:
+                await report_wallet_error(update, context, address, e)
+        tracer.finish(trace)
         
-        # Delete processing message
-        if processing_msg:
-            try:
-                await processing_msg.delete()
-            except Exception:
-                pass
+        # Stop progress edits and delete processing message
+        if progress:
+            await progress.finish()
+
+async def send_wallet_result(message, address: str, wallet_type: str, result: Tuple):
+    """Reply with a rendered wallet analysis: the header and, for Solana, the first page of holdings"""
+    if wallet_type == 'ethereum':
+        text, keyboard = result
+        await outbound.reply(message, text, parse_mode="Markdown", reply_markup=keyboard, disable_web_page_preview=True)
+        return
+    header_msg, token_messages, keyboard = result
+    await outbound.reply(message, header_msg, parse_mode="Markdown", reply_markup=keyboard, disable_web_page_preview=True)
+    if token_messages:
+        nav_keyboard = get_token_pagination_keyboard(address, 0, len(token_messages))
+        await outbound.reply(
+            message,
+            token_messages[0],
+            parse_mode="Markdown",
+            reply_markup=nav_keyboard,
+            disable_web_page_preview=True
+        )
+
+async def report_wallet_error(update: Update, context: ContextTypes.DEFAULT_TYPE, address: str, error: Exception):
+    logger.error(f"Error analyzing wallet {address}: {error}")
+    annotate(error=str(error)[:200])
+    await outbound.reply(
+        update.effective_message,
+        f"❌ *Error analyzing wallet*\n`{address[:6]}...{address[-4:]}`\n`{escape_markdown(str(error)[:100])}`",
+        parse_mode="Markdown"
+    )
+    if update.effective_user:
+        await notify_admin_error(context.application, "Wallet Analysis Failed", str(error), update.effective_user.id)
+
+def format_portfolio(portfolio: Dict[str, Any], failed: int, invalid: int) -> str:
+    """Combined summary of a batch: native balances per chain and per-token totals across wallets"""
+    tokens_value = f"{portfolio['tokens_value_usd']:,.2f}"
+    total_value = f"{portfolio['total_value_usd']:,.2f}"
+    msg = (
+        f"📦 *Combined Portfolio*\n"
+        f"━━━━━━━━━━━━━━━━━━━━━━\n\n"
+        f"👛 *Wallets:* `{portfolio['wallets']}`\n"
+    )
+    for chain, totals in portfolio['chains'].items():
+        # EVM value covers every configured chain's gas coin; the balance shown is ETH on mainnet and L2s
+        icon, label, symbol = ("🔷", "EVM", "ETH") if chain == 'ethereum' else ("🟣", "SOL", "SOL")
+        value = f"{totals['value_usd']:,.2f}"
+        msg += (
+            f"{icon} *{label}:* `{escape_markdown(format_large_number(totals['balance']))}` {symbol} "
+            f"(`${escape_markdown(value)}`) in `{totals['wallets']}` wallets\n"
+        )
+    msg += f"🪙 *Unique Tokens:* `{portfolio['unique_tokens']}`\n"
+    msg += f"💰 *Token Value:* `${escape_markdown(tokens_value)}`\n"
+    msg += f"🏦 *Total Portfolio:* `${escape_markdown(total_value)}`\n"
+
+    if portfolio['tokens']:
+        msg += f"\n*Top Holdings Across Wallets:*\n"
+        for rank, token in enumerate(portfolio['tokens'][:BATCH_TOP_TOKENS], 1):
+            value = f"{token['token_usd_value']:,.2f}"
+            held_in = f"{token['wallets']} wallet" + ("s" if token['wallets'] > 1 else "")
+            msg += (
+                f"#{rank} *{escape_markdown(token['symbol'])}* "
+                f"`{escape_markdown(format_large_number(token['balance']))}` • "
+                f"`${escape_markdown(value)}` • {held_in}\n"
+            )
+    if failed:
+        msg += f"\n⚠️ `{failed}` wallets could not be analyzed."
+    if invalid:
+        msg += f"\n❌ Skipped `{invalid}` invalid addresses."
+    if len(msg) > MAX_MESSAGE_LENGTH:
+        msg = msg[:MAX_MESSAGE_LENGTH-100] + "...\n\n📱 *Message truncated*"
+    return msg
+
+async def process_batch(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int,
+                        valid_wallets: List[Tuple[str, str]], invalid_wallets: List[str]):
+    """Scan several wallets as one pipeline, reply per wallet, then send the combined portfolio"""
+    message = update.effective_message
+    if update.effective_user:
+        await ensure_user_registered(context.application, update.effective_user)
+    
+    batch_msg = (
+        f"📦 *Batch Processing*\n"
+        f"━━━━━━━━━━━━━━━━━━━━━━\n\n"
+        f"✅ *Valid:* `{len(valid_wallets)}` wallets\n"
+    )
+    if invalid_wallets:
+        batch_msg += f"❌ *Invalid:* `{len(invalid_wallets)}` addresses\n"
+    processing_msg = await outbound.reply(message, batch_msg + f"\n⏳ Processing...", parse_mode="Markdown")
+    progress = ProgressReporter(processing_msg, batch_msg + f"\n⏳ Processing...")
+    
+    if update.effective_user:
+        await log_activity(context.application, update.effective_user.id, f"Batch scan: {len(valid_wallets)} wallets")
+        await increment_user_interaction(update.effective_user.id, 'scan')
+    
+    fetched = 0
+    
+    async def run(factory):
+        # Every step is a batch item on the scan scheduler, interleaved fairly with other users' scans
+        nonlocal fetched
+        ticket = scan_scheduler.submit(user_id, factory, batch=True)
+        text = batch_msg + f"\n⏳ Loading wallets `{fetched}/{len(valid_wallets)}`..."
+        await wait_for_scan_start(ticket, progress, text)
+        result = await ticket
+        fetched += 1
+        if fetched <= len(valid_wallets):
+            progress.set(batch_msg + f"\n⏳ Loading wallets `{fetched}/{len(valid_wallets)}`...")
+        return result
+    
+    async def on_stage(stage: str):
+        if stage == STAGE_FETCHED:
+            progress.set(batch_msg + f"\n⏳ Pricing tokens across all wallets...")
+    
+    scan_started = time.perf_counter()
+    trace = tracer.start("batch_scan", user_id=user_id, wallets=len(valid_wallets), batch=True)
+    with activate(trace):
+        try:
+            reports, portfolio = await analyze_batch(valid_wallets, run, on_stage)
+        except Exception as e:
+            await report_wallet_error(update, context, f"{len(valid_wallets)} wallets", e)
+            await progress.finish()
+            tracer.finish(trace)
+            return
+        SCAN_LATENCY.observe(time.perf_counter() - scan_started, chain="batch",
+                             size=wallet_size_bucket(portfolio['unique_tokens']))
         
-        # Show batch summary if applicable
-        if is_batch:
-            summary = f"✅ *Batch Complete*\n\nProcessed `{len(valid_wallets)}` wallets successfully."
-            if invalid_wallets:
-                summary += f"\n❌ Skipped `{len(invalid_wallets)}` invalid addresses."
-            await update.effective_message.reply_text(summary, parse_mode="Markdown")
+        failed = 0
+        with span("render"):
+            rendered = [
+                report if isinstance(report, Exception)
+                else render_ethereum_report(report) if wallet_type == 'ethereum' else render_solana_report(report)
+                for (address, wallet_type), report in zip(valid_wallets, reports)
+            ]
+        with span("send"):
+            for (address, wallet_type), result in zip(valid_wallets, rendered):
+                if isinstance(result, Exception):
+                    failed += 1
+                    await report_wallet_error(update, context, address, result)
+                    continue
+                await send_wallet_result(message, address, wallet_type, result)
+            await progress.finish()
+            await outbound.reply(message, format_portfolio(portfolio, failed, len(invalid_wallets)), parse_mode="Markdown")
+    tracer.finish(trace)
+
+def watched_wallets() -> Dict[str, List[int]]:
+    """Watched address -> ids of the users watching it, read from the user store each round"""
+    watched: Dict[str, List[int]] = {}
+    for user_id, addresses in user_store.get_meta('watchlists', {}).items():
+        for address in addresses:
+            watched.setdefault(address, []).append(int(user_id))
+    return watched
+
+def get_watchlist(user_id: int) -> List[str]:
+    return user_store.get_meta('watchlists', {}).get(str(user_id), [])
+
+async def set_watchlist(user_id: int, addresses: List[str]):
+    # Kept in the store's shared settings: users are only registered there when admin logging is on
+    watchlists = user_store.get_meta('watchlists', {})
+    if addresses:
+        watchlists[str(user_id)] = addresses
+    else:
+        watchlists.pop(str(user_id), None)
+    await user_store.set_meta('watchlists', watchlists)
+
+async def scan_watched_wallet(address: str) -> Dict[str, Any]:
+    # Background work: queued as a batch item so it never delays interactive scans
+    return await scan_scheduler.run(WATCH_SCAN_USER, lambda: analyze_solana_wallet(address), batch=True)
+
+def format_watch_alert(address: str, report: Dict[str, Any], changes: Dict[str, Any]) -> str:
+    value = f"{report['total_value_usd']:,.2f}"
+    value_delta = f"{changes['value_delta']:+,.2f}"
+    msg = (
+        f"👁 *Watched Wallet Changed*\n"
+        f"`{address[:6]}...{address[-4:]}`\n\n"
+        f"💎 *Portfolio Value:* `${escape_markdown(value)}` (`{escape_markdown(value_delta)}`)\n"
+    )
+    if abs(changes['sol_delta']) > 0:
+        sol_delta = f"{changes['sol_delta']:+,.4f}"
+        msg += f"🟣 *SOL:* `{escape_markdown(sol_delta)}`\n"
+    for symbol, delta in changes['changed'][:WATCH_ALERT_TOKENS]:
+        token_delta = f"{delta:+,.4f}"
+        msg += f"🔄 *{escape_markdown(symbol)}:* `{escape_markdown(token_delta)}`\n"
+    if changes['added']:
+        msg += f"➕ *New:* {escape_markdown(', '.join(changes['added'][:WATCH_ALERT_TOKENS]))}\n"
+    if changes['removed']:
+        msg += f"➖ *Gone:* {escape_markdown(', '.join(changes['removed'][:WATCH_ALERT_TOKENS]))}\n"
+    return msg
+
+async def handle_watch_change(application, address: str, user_ids: List[int], invalidate: bool = True):
+    """A probe or notification saw activity: rescan once for all watchers and alert them if balances really moved"""
+    if invalidate:
+        invalidate_solana_wallet(address)  # Subscription refreshes have just rewarmed the cache themselves
+    report = await scan_watched_wallet(address)
+    current = snapshot(report)
+    previous = load_snapshot(address)
+    save_snapshot(address, current)
+    changes = diff_snapshots(previous, current) if previous else None
+    if not changes:
+        return
+    message = format_watch_alert(address, report, changes)
+    keyboard = create_wallet_keyboard(address, 'solana')
+    for user_id in user_ids:
+        outbound.send_nowait(application.bot, user_id, message, parse_mode="Markdown", reply_markup=keyboard)
+
+async def watch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/watch lists the user's watchlist, /watch <address> adds a Solana wallet to it"""
+    if not update.effective_user or not update.effective_message:
+        return
+    user_id = update.effective_user.id
+    await log_command(context.application, user_id, "watch")
+    await increment_user_interaction(user_id, 'command')
+    watchlist = get_watchlist(user_id)
+
+    if not context.args:
+        lines = "\n".join(f"• `{address}`" for address in watchlist) or "_Nothing yet_"
+        await outbound.reply(
+            update.effective_message,
+            f"👁 *Your Watchlist* (`{len(watchlist)}/{WATCH_MAX_PER_USER}`)\n━━━━━━━━━━━━━━━━━━━━━━\n\n{lines}\n\n"
+            f"`/watch <address>` to add a Solana wallet, `/unwatch <address>` to remove one. "
+            f"You get a message when a watched wallet's balances change.",
+            parse_mode="Markdown"
+        )
+        return
+
+    address = context.args[0].strip()
+    is_valid, wallet_type = validate_wallet_address(address)
+    if not is_valid or wallet_type != 'solana':
+        await outbound.reply(update.effective_message, "❌ Only Solana wallets can be watched for now.", parse_mode="Markdown")
+        return
+    if address in watchlist:
+        await outbound.reply(update.effective_message, f"👁 Already watching `{address[:6]}...{address[-4:]}`", parse_mode="Markdown")
+        return
+    if len(watchlist) >= WATCH_MAX_PER_USER:
+        await outbound.reply(
+            update.effective_message,
+            f"❌ *Watchlist full*\n\nYou can watch up to `{WATCH_MAX_PER_USER}` wallets. Remove one with `/unwatch <address>`.",
+            parse_mode="Markdown"
+        )
+        return
+
+    await set_watchlist(user_id, watchlist + [address])
+
+    # Baseline for the first alert; wallets someone else already watches have one
+    report = None
+    if load_snapshot(address) is None:
+        try:
+            report = await scan_watched_wallet(address)
+            save_snapshot(address, snapshot(report))
+        except Exception as e:
+            logger.error(f"Error taking baseline of watched wallet {address}: {e}")
+    current = f"\n💎 *Current Value:* `${escape_markdown(format(report['total_value_usd'], ',.2f'))}`" if report else ""
+    await outbound.reply(
+        update.effective_message,
+        f"👁 *Watching* `{address[:6]}...{address[-4:]}`{current}\n\nI'll message you when its balances change.",
+        parse_mode="Markdown"
+    )
+
+async def unwatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not update.effective_user or not update.effective_message:
+        return
+    user_id = update.effective_user.id
+    await log_command(context.application, user_id, "unwatch")
+    watchlist = get_watchlist(user_id)
+    address = context.args[0].strip() if context.args else ""
+    if address not in watchlist:
+        await outbound.reply(update.effective_message, "❌ Usage: `/unwatch <address>` for a wallet on your `/watch` list", parse_mode="Markdown")
+        return
+    await set_watchlist(user_id, [watched for watched in watchlist if watched != address])
+    await outbound.reply(update.effective_message, f"✅ Stopped watching `{address[:6]}...{address[-4:]}`", parse_mode="Markdown")
+
+def format_history(address: str, period: str, points: List[Tuple[float, float, Tuple]]) -> str:
+    """History view: change over the period, high/low, a sparkline and the top holdings then and now"""
+    header = f"📈 *Portfolio History* `{address[:6]}...{address[-4:]}` · `{period}`\n━━━━━━━━━━━━━━━━━━━━━━\n\n"
+    if not points:
+        return header + "_No scans in this period yet. Send the address to scan it._"
+    first_ts, first_value, first_top = points[0]
+    last_ts, last_value, last_top = points[-1]
+    values = [value for _, value, _ in points]
+    now_value = f"{last_value:,.2f}"
+    high = f"{max(values):,.2f}"
+    low = f"{min(values):,.2f}"
+    msg = header + (
+        f"💎 *Latest:* `${escape_markdown(now_value)}` ({escape_markdown(format_age(time.time() - last_ts))} ago)\n"
+        f"📊 *Change:* `{escape_markdown(format_usd_change(last_value - first_value, first_value))}`\n"
+        f"🔺 *High:* `${escape_markdown(high)}`  🔻 *Low:* `${escape_markdown(low)}`\n"
+    )
+    if len(points) > 1:
+        # Last value in each of HISTORY_SPARK_WIDTH equal time slices; empty slices repeat the one before
+        width = (last_ts - first_ts) / HISTORY_SPARK_WIDTH or 1.0
+        slices: List[float] = []
+        i = 0
+        for n in range(1, HISTORY_SPARK_WIDTH + 1):
+            while i < len(points) and points[i][0] <= first_ts + n * width:
+                i += 1
+            slices.append(points[i - 1][1] if i else first_value)
+        msg += f"`{sparkline(slices)}`\n"
+    if last_top:
+        before = dict(first_top)
+        msg += f"\n🏆 *Top Holdings:*\n"
+        for symbol, value in last_top:
+            line_value = f"{value:,.2f}"
+            msg += f"• *{escape_markdown(symbol)}* `${escape_markdown(line_value)}`"
+            if symbol in before and len(points) > 1:
+                msg += f" (`{escape_markdown(format_usd_change(value - before[symbol], before[symbol]))}`)"
+            msg += "\n"
+    first_date = datetime.fromtimestamp(first_ts).strftime('%Y-%m-%d %H:%M')
+    msg += f"\n🗂 `{len(points)}` points since `{escape_markdown(first_date)}`"
+    return msg
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/history <address> [24h|7d|30d|1y] shows how a scanned wallet's value moved"""
+    if not update.effective_user or not update.effective_message:
+        return
+    await log_command(context.application, update.effective_user.id, "history")
+    await increment_user_interaction(update.effective_user.id, 'command')
+    address = context.args[0].strip() if context.args else ""
+    period = context.args[1].lower() if len(context.args or []) > 1 else HISTORY_DEFAULT_PERIOD
+    is_valid, wallet_type = validate_wallet_address(address)
+    if not is_valid or period not in HISTORY_PERIODS:
+        await outbound.reply(
+            update.effective_message,
+            f"❌ Usage: `/history <address> [{'|'.join(HISTORY_PERIODS)}]`",
+            parse_mode="Markdown"
+        )
+        return
+    points = portfolio_history.range(wallet_type, address, HISTORY_PERIODS[period])
+    await outbound.reply(update.effective_message, format_history(address, period, points), parse_mode="Markdown")
+
+# Background scans started by inline queries, one per address
+inline_warming: Dict[str, asyncio.Task] = {}
+
+def format_summary_card(summary: WalletSummary) -> str:
+    """Message an inline result posts: total value, native balance and the largest holdings"""
+    address = summary.address
+    symbol = "SOL" if summary.chain == 'solana' else "ETH"
+    total = f"{summary.total_value_usd:,.2f}"
+    native_value = f"{summary.native_value_usd:,.2f}"
+    msg = (
+        f"{'🟣 *Solana Wallet*' if summary.chain == 'solana' else '🔷 *EVM Wallet*'} `{address[:6]}...{address[-4:]}`\n"
+        f"━━━━━━━━━━━━━━━━━━━━━━\n"
+        f"💎 *Portfolio Value:* `${escape_markdown(total)}`\n"
+        f"💰 *{symbol}:* `{escape_markdown(format_large_number(summary.native_balance))}` (`${escape_markdown(native_value)}`)\n"
+        f"🪙 *Tokens:* `{summary.token_count}`\n"
+    )
+    for token_symbol, value in summary.top:
+        token_value = f"{value:,.2f}"
+        msg += f"• *{escape_markdown(token_symbol)}* `${escape_markdown(token_value)}`\n"
+    msg += f"⏰ _Scanned {escape_markdown(format_age(time.time() - summary.scanned_at))} ago_"
+    return msg
+
+def format_quick_card(native: Optional[Dict[str, Any]], address: str, wallet_type: str) -> str:
+    """Inline card before the wallet has been scanned: the native balance if it came back in time"""
+    msg = f"{'🟣 *Solana Wallet*' if wallet_type == 'solana' else '🔷 *EVM Wallet*'} `{address[:6]}...{address[-4:]}`\n"
+    if native is not None:
+        value = f"{native['native_value_usd']:,.2f}"
+        balance = escape_markdown(format_large_number(native['native_balance']))
+        msg += f"💰 *{native['symbol']}:* `{balance}` (`${escape_markdown(value)}`)\n"
+    return msg + "⏳ _Token holdings are being scanned; ask again in a moment for the full summary._"
+
+async def warm_inline_summary(user_id: int, address: str, wallet_type: str):
+    """Queue a full scan so the next inline query for address is answered from its summary"""
+    if address in inline_warming:
+        return
+    # Charged like a scan, so typing addresses inline cannot be used to run free scans
+    if await rate_limiter.check(user_id, get_user_tier(user_id), 'scan') > 0 or address in inline_warming:
+        return
+
+    async def warm():
+        try:
+            await scan_scheduler.run(user_id, lambda: analyze_wallet(address, wallet_type), batch=True)
+        except Exception as e:
+            logger.error(f"Error warming inline summary of {address}: {e}")
+        finally:
+            inline_warming.pop(address, None)
+
+    inline_warming[address] = asyncio.create_task(warm())
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """@bot <address> answers from the cached summary, else with a native-balance card while a scan warms the cache"""
+    query = update.inline_query
+    if query is None:
+        return
+    address = query.query.strip()
+    is_valid, wallet_type = validate_wallet_address(address)
+    if not is_valid:
+        INLINE_QUERIES.inc(result="invalid")
+        await query.answer([], cache_time=INLINE_CACHE_SECONDS)
+        return
+
+    explorer = create_wallet_keyboard(address, wallet_type).inline_keyboard[0]  # URL buttons only: no chat to refresh in
+    summary = summary_cache.get(wallet_type, address)
+    if summary is not None:
+        INLINE_QUERIES.inc(result="summary")
+        total = f"{summary.total_value_usd:,.2f}"
+        text, cache_time = format_summary_card(summary), INLINE_CACHE_SECONDS
+        description = f"${total} · {summary.token_count} tokens"
+    else:
+        INLINE_QUERIES.inc(result="quick")
+        await warm_inline_summary(query.from_user.id, address, wallet_type)
+        try:
+            native = await asyncio.wait_for(analyze_native_balance(address, wallet_type), INLINE_QUICK_TIMEOUT)
+            if native['native_balance'] is None:
+                native = None  # Balance lookup failed; don't post a misleading 0
+        except Exception as e:
+            logger.error(f"Error fetching native balance for inline query {address}: {e}")
+            native = None
+        text, cache_time = format_quick_card(native, address, wallet_type), INLINE_QUICK_CACHE_SECONDS
+        if native is not None:
+            balance = format_large_number(native['native_balance'])
+            description = f"{balance} {native['symbol']} · tokens still scanning"
+        else:
+            description = "Scanning, ask again in a moment"
+
+    result = InlineQueryResultArticle(
+        id=f"{wallet_type}:{address}",
+        title=f"{'Solana' if wallet_type == 'solana' else 'EVM'} wallet {address[:6]}...{address[-4:]}",
+        description=description,
+        input_message_content=InputTextMessageContent(text, parse_mode="Markdown", disable_web_page_preview=True),
+        reply_markup=InlineKeyboardMarkup([explorer]),
+    )
+    await query.answer([result], cache_time=cache_time)
 
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     if query is None:
         return
+    chat_id = query.message.chat_id if query.message else None
+    user_id = update.effective_user.id if update.effective_user else chat_id
+
+    if query.data and query.data.startswith("refresh_"):
+        retry_after = await rate_limiter.check(user_id, get_user_tier(user_id), 'refresh')
+        if retry_after:
+            await query.answer(f"⏳ Refreshing too fast. Try again in {math.ceil(retry_after)}s.", show_alert=True)
+            return
     await query.answer()
 
     if query.data == "about":
@@ -882,7 +1488,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "• 🤖 Interactive interface"
         )
         keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="back")]])
-        await query.edit_message_text(about_msg, parse_mode="Markdown", disable_web_page_preview=False, reply_markup=keyboard)
+        await outbound.submit(chat_id, PRIORITY_REPLY, query.edit_message_text, about_msg, parse_mode="Markdown", disable_web_page_preview=False, reply_markup=keyboard)
     
     elif query.data == "back":
         welcome_msg = (
@@ -900,31 +1506,40 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "🔥 *Try it now!*"
         )
         keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("ℹ️ About", callback_data="about")]])
-        await query.edit_message_text(welcome_msg, parse_mode="Markdown", reply_markup=keyboard)
+        await outbound.submit(chat_id, PRIORITY_REPLY, query.edit_message_text, welcome_msg, parse_mode="Markdown", reply_markup=keyboard)
 
     elif query.data and query.data.startswith("refresh_"):
         try:
             _, wallet_address, wallet_type = query.data.split("_", 2)
             
             # Show refreshing state
-            await query.edit_message_text(
+            await outbound.submit(
+                chat_id,
+                PRIORITY_REPLY,
+                query.edit_message_text,
                 f"🔄 *Refreshing {wallet_type.title()} analysis...*\n"
                 f"⏳ Fetching latest prices and balances...",
                 parse_mode="Markdown"
             )
             
             if wallet_type == 'ethereum':
-                message, keyboard = await create_enhanced_ethereum_analysis(wallet_address)
-                await query.edit_message_text(
+                message, keyboard = await scan_scheduler.run(user_id, lambda: create_enhanced_ethereum_analysis(wallet_address))
+                await outbound.submit(
+                    chat_id,
+                    PRIORITY_REPLY,
+                    query.edit_message_text,
                     message,
                     parse_mode="Markdown",
                     reply_markup=keyboard,
                     disable_web_page_preview=True
                 )
             else:
-                header_msg, token_messages, keyboard = await create_enhanced_solana_analysis(wallet_address)
+                header_msg, token_messages, keyboard = await scan_scheduler.run(user_id, lambda: create_enhanced_solana_analysis(wallet_address, chat_id=chat_id))
                 
-                await query.edit_message_text(
+                await outbound.submit(
+                    chat_id,
+                    PRIORITY_REPLY,
+                    query.edit_message_text,
                     header_msg,
                     parse_mode="Markdown",
                     reply_markup=keyboard,
@@ -934,7 +1549,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     page = 0
                     total_pages = len(token_messages)
                     nav_keyboard = get_token_pagination_keyboard(wallet_address, page, total_pages)
-                    await query.message.reply_text(
+                    await outbound.reply(
+                        query.message,
                         token_messages[page],
                         parse_mode="Markdown",
                         reply_markup=nav_keyboard,
@@ -948,39 +1564,45 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 
         except Exception as e:
             logger.error(f"Error in refresh callback: {e}")
-            await query.edit_message_text(f"❌ *Refresh Error:* `{escape_markdown(str(e))}`", parse_mode="Markdown")
+            await outbound.submit(chat_id, PRIORITY_REPLY, query.edit_message_text, f"❌ *Refresh Error:* `{escape_markdown(str(e))}`", parse_mode="Markdown")
 
     elif query.data and query.data.startswith("tokens_"):
         try:
             _, wallet_address, page_str = query.data.split("_", 2)
             page = int(page_str)
-            _, token_messages, _ = await create_enhanced_solana_analysis(wallet_address)
+            report = shown_reports.get((chat_id, wallet_address))
+            if report is None:
+                # Shown by another worker or before a restart; rebuilt without counting as a scan
+                report = await scan_scheduler.run(user_id, lambda: analyze_solana_wallet(wallet_address, record=False))
+                keep_report(chat_id, report)
+            _, token_messages, _ = render_solana_report(report)
             total_pages = len(token_messages)
             if 0 <= page < total_pages:
                 nav_keyboard = get_token_pagination_keyboard(wallet_address, page, total_pages)
-                await query.edit_message_text(
+                await outbound.submit(
+                    chat_id,
+                    PRIORITY_REPLY,
+                    query.edit_message_text,
                     token_messages[page],
                     parse_mode="Markdown",
                     reply_markup=nav_keyboard,
                     disable_web_page_preview=True
                 )
         except Exception as e:
-            await query.edit_message_text(f"❌ *Error:* `{escape_markdown(str(e))}`", parse_mode="Markdown")
+            await outbound.submit(chat_id, PRIORITY_REPLY, query.edit_message_text, f"❌ *Error:* `{escape_markdown(str(e))}`", parse_mode="Markdown")
 
-async def main():
-    print_banner()
-    print("\n" * 3)
-    print("🚀 DK3Y Wallet Scanner Bot is starting...\n")
-    
-    if not TELEGRAM_TOKEN:
-        print("❌ Error: TELEGRAM_TOKEN not found in environment variables")
-        return
-    
-    # Load user data at startup
-    await load_user_data()
-    print(f"📊 Loaded data for {user_count} users")
-    
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+def build_application(request: Optional[BaseRequest] = None, updater: bool = True) -> Application:
+    """Application with every handler registered; request replaces the Bot API transport"""
+    # Updates are handled concurrently; scan fairness is enforced by the scan scheduler
+    builder = Application.builder().token(TELEGRAM_TOKEN).concurrent_updates(True)
+    if TELEGRAM_BASE_URL:
+        builder = builder.base_url(TELEGRAM_BASE_URL)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    if not updater:
+        # Updates arrive through the embedded webhook server (or replay.py) instead of getUpdates
+        builder = builder.updater(None)
+    application = builder.build()
     
     # Add Error Handler
     application.add_error_handler(error_handler)
@@ -992,18 +1614,72 @@ async def main():
     application.add_handler(CommandHandler("ping", status))
     application.add_handler(CommandHandler("stats", admin_stats))
     application.add_handler(CommandHandler("broadcast", broadcast))
+    application.add_handler(CommandHandler("tier", tier_command))
+    application.add_handler(CommandHandler("trace", trace_command))
+    application.add_handler(CommandHandler("watch", watch_command))
+    application.add_handler(CommandHandler("unwatch", unwatch_command))
+    application.add_handler(CommandHandler("history", history_command))
+    application.add_handler(InlineQueryHandler(inline_query))
     
     # Add Callback & Message Handlers
     application.add_handler(CallbackQueryHandler(handle_callback))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_wallet_address))
+    return application
+
+async def report_first_reply():
+    """Log how long after process start the first reply went out, e.g. to updates queued during a restart"""
+    await outbound.first_sent.wait()
+    cold_start = outbound.first_sent_at - PROCESS_STARTED
+    STARTUP_SECONDS.set(cold_start, stage="first_reply")
+    if cold_start > COLD_START_TARGET:
+        logger.warning(f"First reply sent {cold_start:.2f}s after start (target {COLD_START_TARGET:.1f}s)")
+    else:
+        logger.info(f"First reply sent {cold_start:.2f}s after start")
+
+async def main():
+    print_banner()
+    print("🚀 DK3Y Wallet Scanner Bot is starting...\n")
+    
+    errors = validate_config()
+    if errors:
+        for error in errors:
+            print(f"❌ Error: {error}")
+        return
+    
+    application = build_application(updater=BOT_MODE != "webhook")
     
-    print("🚀 Bot is now running and listening for messages!")
+    # Upstream connections and prices warm up in the background; the first scan waits on them anyway
+    prewarm_task = asyncio.create_task(prewarm())
+    # The Telegram handshake and loading user data are independent, so overlap them
+    await asyncio.gather(application.initialize(), load_user_data())
+    print(f"📊 Loaded data for {user_store.count()} users")
     
-    # Manual initialization and polling for full async control
+    # Manual initialization and polling/webhook for full async control
+    webhook_server = None
+    metrics_server = None
     async with application:
-        await application.initialize()
         await application.start()
-        await application.updater.start_polling()
+        if METRICS_PORT:
+            metrics_server = MetricsServer()
+            await metrics_server.start()
+        if BOT_MODE == "webhook":
+            webhook_server = WebhookServer(application)
+            await webhook_server.start()
+            await webhook_server.register()
+        else:
+            await application.updater.start_polling()
+        
+        ready = time.monotonic() - PROCESS_STARTED
+        STARTUP_SECONDS.set(ready, stage="ready")
+        print(f"🚀 Bot is now running and listening for messages! (ready in {ready:.2f}s)")
+        first_reply_task = asyncio.create_task(report_first_reply())
+        subscription_engine.on_change = lambda address: handle_watch_change(
+            application, address, watched_wallets().get(address, []), invalidate=False
+        )
+        watch_poller.start(
+            watched_wallets, lambda address, user_ids: handle_watch_change(application, address, user_ids),
+            subscriptions=subscription_engine if subscription_engine.enabled else None
+        )
         
         # Keep the bot running until interrupted
         try:
@@ -1012,10 +1688,21 @@ async def main():
         except (KeyboardInterrupt, asyncio.CancelledError):
             logger.info("Bot is shutting down...")
         finally:
-            if application.updater.running:
+            prewarm_task.cancel()
+            first_reply_task.cancel()
+            await watch_poller.stop()
+            await subscription_engine.stop()
+            if webhook_server:
+                await webhook_server.stop()
+            if metrics_server:
+                await metrics_server.stop()
+            if application.updater and application.updater.running:
                 await application.updater.stop()
+            await scan_scheduler.stop()
+            await outbound.stop()
             await application.stop()
             await application.shutdown()
+            await close_session()
 
 if __name__ == "__main__":
     try:
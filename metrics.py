@@ -0,0 +1,243 @@
+import os
+import time
+import bisect
+import logging
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Tuple, Callable, Sequence
+
+from aiohttp import web
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 disables the standalone endpoint
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SCAN_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+AGE_BUCKETS = (1, 10, 30, 60, 120, 300, 600, 900, 1800, 3600)
+
+# ── Metric Types ───────────────────────────────────────────────────────────
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in self._values.items()]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._fn = fn
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> List[str]:
+        if self._fn is not None:
+            return [f"{self.name} {_format_value(self._fn())}"]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in self._values.items()]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # key -> bucket counts + [sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0.0] * (len(self.buckets) + 3)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), fn: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, fn))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# ── Application Metrics ────────────────────────────────────────────────────
+UPSTREAM_LATENCY = registry.histogram(
+    "scanner_upstream_request_seconds", "Upstream API request latency by service function", ["function"])
+UPSTREAM_ERRORS = registry.counter(
+    "scanner_upstream_errors_total", "Failed upstream API requests by service function", ["function"])
+CACHE_REQUESTS = registry.counter(
+    "scanner_cache_requests_total", "CacheService lookups by key prefix and result (hit/miss)", ["prefix", "result"])
+SCAN_LATENCY = registry.histogram(
+    "scanner_scan_seconds", "End-to-end wallet analysis latency", ["chain", "size"], SCAN_BUCKETS)
+SCANS_IN_FLIGHT = registry.gauge(
+    "scanner_scans_in_flight", "Wallet analyses currently running")
+TELEGRAM_SEND_LATENCY = registry.histogram(
+    "scanner_telegram_send_seconds", "Telegram API call latency by outbound priority", ["priority"])
+TELEGRAM_QUEUE_WAIT = registry.histogram(
+    "scanner_telegram_queue_wait_seconds", "Time Telegram calls wait in the outbound queue", ["priority"])
+PRICE_TTL = registry.histogram(
+    "scanner_price_ttl_seconds", "Cache TTL chosen for token prices from their volatility", (), AGE_BUCKETS)
+PRICE_STALENESS = registry.histogram(
+    "scanner_price_staleness_seconds", "Age of token prices when used in a scan (0 when just fetched)", (), AGE_BUCKETS)
+PRICE_REFRESHES = registry.counter(
+    "scanner_price_refreshes_total",
+    "Token price fetches avoided (saved) or added (extra) compared with a fixed CACHE_DURATION TTL", ["effect"])
+WATCH_PROBES = registry.counter(
+    "scanner_watch_probes_total", "Watched wallet change probes by result (unchanged/changed/error)", ["result"])
+WATCHED_WALLETS = registry.gauge(
+    "scanner_watched_wallets", "Distinct wallets on at least one watchlist")
+ETHERSCAN_KEY_CALLS = registry.counter(
+    "scanner_etherscan_key_calls_total", "Etherscan calls per API key (last 4 characters) by result", ["key", "result"])
+ETHERSCAN_KEYS_BENCHED = registry.gauge(
+    "scanner_etherscan_keys_benched", "Etherscan API keys resting after rate-limit or invalid-key responses")
+INLINE_QUERIES = registry.counter(
+    "scanner_inline_queries_total", "Inline queries by answer (summary/quick/invalid)", ["result"])
+WS_SUBSCRIPTIONS = registry.gauge(
+    "scanner_ws_subscriptions", "Confirmed Solana account subscriptions per WebSocket connection", ["connection"])
+WS_EVENTS = registry.counter(
+    "scanner_ws_events_total", "Solana WebSocket events (notification/connect/disconnect/error)", ["event"])
+STARTUP_SECONDS = registry.gauge(
+    "scanner_startup_seconds", "Seconds from process start until the bot was ready and until its first reply", ["stage"])
+
+@contextmanager
+def track_upstream(function: str):
+    """Time an upstream request and count it as an error if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(function=function)
+        raise
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - started, function=function)
+
+def wallet_size_bucket(token_count: int) -> str:
+    """Coarse wallet-size label so scan latency series stay few"""
+    if token_count == 0:
+        return "0"
+    if token_count <= 10:
+        return "1-10"
+    if token_count <= 50:
+        return "11-50"
+    if token_count <= 200:
+        return "51-200"
+    return "200+"
+
+# ── Metrics Endpoint ───────────────────────────────────────────────────────
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+class MetricsServer:
+    """Standalone /metrics endpoint for Prometheus scraping"""
+
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics endpoint listening on {self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
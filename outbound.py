@@ -0,0 +1,396 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Optional, Dict, List, Any, Callable, Deque
+
+from metrics import TELEGRAM_SEND_LATENCY, TELEGRAM_QUEUE_WAIT
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Priorities ─────────────────────────────────────────────────────────────
+PRIORITY_REPLY = 0      # Direct replies to the user who is waiting
+PRIORITY_PROGRESS = 1   # Progress edits on processing messages
+PRIORITY_LOG = 2        # Admin activity logs & error alerts
+PRIORITY_BROADCAST = 3  # Bulk announcements to every user
+
+PRIORITY_NAMES = ["reply", "progress", "log", "broadcast"]
+
+# ── Rate Limits ────────────────────────────────────────────────────────────
+GLOBAL_RATE = 30.0   # Telegram allows ~30 messages/sec per bot
+CHAT_RATE = 1.0      # ~1 message/sec per chat
+CHAT_BURST = 3       # Short bursts per chat are tolerated
+WAIT_SAMPLES = 500   # Recent queue wait samples kept per priority
+PROGRESS_INTERVAL = 1.0  # Minimum seconds between progress edits on one message
+PRUNE_INTERVAL = 60.0    # Seconds between sweeps of idle per-chat state
+
+# ── Outbound Scheduler ─────────────────────────────────────────────────────
+class _Job:
+    __slots__ = ("chat_id", "priority", "func", "args", "kwargs", "future", "enqueued_at", "key", "retried_at")
+
+    def __init__(self, chat_id, priority, func, args, kwargs, future, key=None):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.key = key  # Edits of one message share a key; a newer edit replaces a queued older one
+        self.retried_at: Optional[float] = None  # Set when flood control sent the job back to the queue
+
+class OutboundScheduler:
+    """Single queue for every Telegram send/edit, paced against the global and per-chat limits"""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE, chat_burst: int = CHAT_BURST):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._queues: List[Deque[_Job]] = [deque() for _ in PRIORITY_NAMES]
+        self._keyed: Dict[Any, _Job] = {}  # Queued job per key
+        self._global_tokens = global_rate
+        self._global_updated = time.monotonic()
+        self._chat_buckets: Dict[Any, List[float]] = {}
+        self._blocked_until: Dict[Any, float] = {}
+        self._last_prune = time.monotonic()
+        self._inflight: set = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop = None
+        self._wait_stats = [
+            {"sent": 0, "total_wait": 0.0, "max_wait": 0.0, "recent": deque(maxlen=WAIT_SAMPLES)}
+            for _ in PRIORITY_NAMES
+        ]
+        self._send_stats = {"sent": 0, "failed": 0, "retried": 0, "replaced": 0, "total_latency": 0.0, "retry_wait": 0.0}
+        self.first_sent = asyncio.Event()  # Set once the first call succeeds, for the cold-start measurement
+        self.first_sent_at: Optional[float] = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    def enqueue(self, chat_id: Optional[int], priority: int, func: Callable, *args, **kwargs) -> asyncio.Future:
+        """Queue a Telegram API call and return a future for its result"""
+        return self._enqueue(chat_id, priority, func, args, kwargs)
+
+    def _enqueue(self, chat_id, priority: int, func: Callable, args: tuple, kwargs: dict, key=None) -> asyncio.Future:
+        self._ensure_worker()
+        job = _Job(chat_id, priority, func, args, kwargs, self._loop.create_future(), key)
+        if key is not None:
+            older = self._keyed.pop(key, None)
+            if older is not None and older in self._queues[older.priority]:
+                # The older edit would only be overwritten; its caller gets the newer edit's result
+                self._queues[older.priority].remove(older)
+                self._send_stats["replaced"] += 1
+                _chain(job.future, older.future)
+            self._keyed[key] = job
+        self._queues[priority].append(job)
+        self._wakeup.set()
+        return job.future
+
+    async def submit(self, chat_id: Optional[int], priority: int, func: Callable, *args, **kwargs) -> Any:
+        """Queue a Telegram API call and wait for its result"""
+        return await self.enqueue(chat_id, priority, func, *args, **kwargs)
+
+    def post(self, chat_id: Optional[int], priority: int, func: Callable, *args, **kwargs) -> asyncio.Future:
+        """Fire-and-forget variant of submit; failures are logged instead of raised"""
+        future = self.enqueue(chat_id, priority, func, *args, **kwargs)
+        future.add_done_callback(_log_failure)
+        return future
+
+    # Convenience wrappers for the common call shapes in main.py
+    async def reply(self, message, text: str, priority: int = PRIORITY_REPLY, **kwargs) -> Any:
+        return await self.submit(message.chat_id, priority, message.reply_text, text, **kwargs)
+
+    async def edit(self, message, text: str, priority: int = PRIORITY_PROGRESS, **kwargs) -> Any:
+        key = ("edit", message.chat_id, message.message_id)
+        return await self._enqueue(message.chat_id, priority, message.edit_text, (text,), kwargs, key)
+
+    async def delete(self, message, priority: int = PRIORITY_PROGRESS) -> Any:
+        return await self.submit(message.chat_id, priority, message.delete)
+
+    async def send(self, bot, chat_id: int, text: str, priority: int = PRIORITY_REPLY, **kwargs) -> Any:
+        return await self.submit(chat_id, priority, bot.send_message, chat_id, text, **kwargs)
+
+    def send_nowait(self, bot, chat_id: int, text: str, priority: int = PRIORITY_LOG, **kwargs) -> asyncio.Future:
+        return self.post(chat_id, priority, bot.send_message, chat_id, text, **kwargs)
+
+    def _refill(self, now: float):
+        self._global_tokens = min(self.global_rate, self._global_tokens + (now - self._global_updated) * self.global_rate)
+        self._global_updated = now
+
+    def _chat_ready_at(self, chat_id, now: float) -> float:
+        """Returns the time at which chat_id may receive its next message"""
+        blocked = self._blocked_until.get(chat_id, 0.0)
+        if chat_id is None:
+            return blocked
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            return blocked
+        tokens = min(self.chat_burst, bucket[0] + (now - bucket[1]) * self.chat_rate)
+        if tokens >= 1:
+            return blocked
+        return max(blocked, now + (1 - tokens) / self.chat_rate)
+
+    def _consume(self, chat_id, now: float):
+        self._global_tokens -= 1
+        if chat_id is None:
+            return
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = [float(self.chat_burst), now]
+        bucket[0] = min(self.chat_burst, bucket[0] + (now - bucket[1]) * self.chat_rate) - 1
+        bucket[1] = now
+
+    def _prune(self, now: float):
+        """Forget chats whose bucket is full again and whose flood block is over; a missing entry means exactly that"""
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._chat_buckets = {
+            chat_id: bucket for chat_id, bucket in self._chat_buckets.items()
+            if bucket[0] + (now - bucket[1]) * self.chat_rate < self.chat_burst
+        }
+        self._blocked_until = {chat_id: until for chat_id, until in self._blocked_until.items() if until > now}
+        self._last_prune = now
+
+    def _next_job(self):
+        """Pick the highest-priority job whose chat is ready; otherwise return how long to sleep"""
+        now = time.monotonic()
+        self._prune(now)
+        self._refill(now)
+        if self._global_tokens < 1:
+            return None, (1 - self._global_tokens) / self.global_rate
+
+        earliest = None
+        for queue in self._queues:
+            skipped = set()
+            for idx, job in enumerate(queue):
+                if job.future.cancelled():
+                    continue
+                if job.chat_id in skipped:
+                    continue
+                ready_at = self._chat_ready_at(job.chat_id, now)
+                if ready_at <= now:
+                    del queue[idx]
+                    if job.key is not None and self._keyed.get(job.key) is job:
+                        del self._keyed[job.key]
+                    self._consume(job.chat_id, now)
+                    return job, None
+                skipped.add(job.chat_id)
+                earliest = ready_at if earliest is None else min(earliest, ready_at)
+            # Drop cancelled jobs so they do not accumulate
+            if any(job.future.cancelled() for job in queue):
+                live = [job for job in queue if not job.future.cancelled()]
+                queue.clear()
+                queue.extend(live)
+                self._keyed = {key: job for key, job in self._keyed.items() if not job.future.cancelled()}
+
+        if earliest is None:
+            return None, None
+        return None, max(0.0, earliest - now)
+
+    async def _run(self):
+        while True:
+            job, delay = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if job.retried_at is None:
+                wait = time.monotonic() - job.enqueued_at
+                stats = self._wait_stats[job.priority]
+                stats["sent"] += 1
+                stats["total_wait"] += wait
+                stats["max_wait"] = max(stats["max_wait"], wait)
+                stats["recent"].append(wait)
+                TELEGRAM_QUEUE_WAIT.observe(wait, priority=PRIORITY_NAMES[job.priority])
+            else:
+                # Queue wait was counted on the first attempt; the flood pause is tracked on its own
+                self._send_stats["retry_wait"] += time.monotonic() - job.retried_at
+
+            task = asyncio.create_task(self._dispatch(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, job: _Job):
+        started = time.monotonic()
+        try:
+            result = await job.func(*job.args, **job.kwargs)
+        except Exception as e:
+            retry_after = getattr(e, "retry_after", None)
+            if retry_after is not None:
+                # Flood control: pause this chat and retry the job ahead of the chat's later messages,
+                # unless a newer edit of the same message was queued meanwhile and makes it moot
+                seconds = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+                logger.warning(f"Flood control for chat {job.chat_id}, retrying in {seconds:.1f}s")
+                self._blocked_until[job.chat_id] = time.monotonic() + seconds
+                self._send_stats["retried"] += 1
+                newer = None if job.key is None else self._keyed.get(job.key)
+                if newer is not None and not newer.future.cancelled():
+                    self._send_stats["replaced"] += 1
+                    _chain(newer.future, job.future)
+                    return
+                job.retried_at = time.monotonic()
+                if job.key is not None:
+                    self._keyed[job.key] = job
+                self._queues[job.priority].appendleft(job)
+                self._wakeup.set()
+                return
+            self._send_stats["failed"] += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        finally:
+            latency = time.monotonic() - started
+            self._send_stats["total_latency"] += latency
+            TELEGRAM_SEND_LATENCY.observe(latency, priority=PRIORITY_NAMES[job.priority])
+
+        self._send_stats["sent"] += 1
+        if self.first_sent_at is None:
+            self.first_sent_at = time.monotonic()
+            self.first_sent.set()
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait-time and send-latency summary for the admin"""
+        priorities = {}
+        for name, queue, stats in zip(PRIORITY_NAMES, self._queues, self._wait_stats):
+            recent = sorted(stats["recent"])
+            priorities[name] = {
+                "queued": len(queue),
+                "sent": stats["sent"],
+                "avg_wait": stats["total_wait"] / stats["sent"] if stats["sent"] else 0.0,
+                "p95_wait": recent[int(len(recent) * 0.95) - 1] if recent else 0.0,
+                "max_wait": stats["max_wait"],
+            }
+        attempts = self._send_stats["sent"] + self._send_stats["failed"] + self._send_stats["retried"]
+        return {
+            "priorities": priorities,
+            "sent": self._send_stats["sent"],
+            "failed": self._send_stats["failed"],
+            "retried": self._send_stats["retried"],
+            "replaced": self._send_stats["replaced"],
+            "retry_wait": self._send_stats["retry_wait"],
+            "inflight": len(self._inflight),
+            "avg_send_latency": self._send_stats["total_latency"] / attempts if attempts else 0.0,
+        }
+
+    async def stop(self, timeout: float = 5.0):
+        """Cancel the worker once the queue has drained (or the timeout expires)"""
+        deadline = time.monotonic() + timeout
+        while (self.queued() or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._worker and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+# ── Progress Reporter ──────────────────────────────────────────────────────
+class ProgressReporter:
+    """Debounced progress edits for a processing message.
+
+    update() only records the latest text and returns immediately; a background
+    task applies at most one edit per interval, always with the newest text, and
+    skips edits that would not change what is already shown.
+    """
+
+    def __init__(self, message, text: Optional[str] = None, interval: float = PROGRESS_INTERVAL,
+                 parse_mode: Optional[str] = "Markdown", scheduler: Optional[OutboundScheduler] = None):
+        self.message = message
+        self.interval = interval
+        self.parse_mode = parse_mode
+        self._scheduler = scheduler or outbound
+        self._shown = text
+        self._latest = text
+        self._last_edit = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._sending = False
+        self._closed = False
+
+    def set(self, text: str):
+        if self._closed:
+            return
+        self._latest = text
+        if text != self._shown and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._flush())
+
+    async def update(self, text: str):
+        """Awaitable form of set(), usable as an analysis progress_callback"""
+        self.set(text)
+
+    __call__ = update
+
+    async def _flush(self):
+        while not self._closed and self._latest != self._shown:
+            delay = self._last_edit + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            text = self._latest
+            self._last_edit = time.monotonic()
+            self._sending = True
+            try:
+                await self._scheduler.edit(self.message, text, priority=PRIORITY_PROGRESS, parse_mode=self.parse_mode)
+                self._shown = text
+            except Exception as e:
+                if "not modified" in str(e).lower():
+                    self._shown = text
+                else:
+                    logger.debug(f"Progress edit failed: {e}")
+                    return
+            finally:
+                self._sending = False
+
+    async def close(self):
+        """Stop editing; an edit already on the wire is allowed to finish"""
+        self._closed = True
+        if self._task is None or self._task.done():
+            return
+        if not self._sending:
+            self._task.cancel()
+        try:
+            await self._task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    async def finish(self):
+        """Close the reporter and delete its processing message"""
+        await self.close()
+        try:
+            await self._scheduler.delete(self.message)
+        except Exception:
+            pass
+
+def _chain(source: asyncio.Future, target: asyncio.Future):
+    """Settle target the same way as source once source is done"""
+    def copy(done: asyncio.Future):
+        if target.done():
+            return
+        if done.cancelled():
+            target.cancel()
+        elif done.exception() is not None:
+            target.set_exception(done.exception())
+        else:
+            target.set_result(done.result())
+    source.add_done_callback(copy)
+
+def _log_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Error sending queued message: {future.exception()}")
+
+outbound = OutboundScheduler()
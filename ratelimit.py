@@ -0,0 +1,119 @@
+import os
+import time
+import math
+import asyncio
+from typing import Optional, Dict, Any, Tuple, Callable
+
+# ── Configuration ──────────────────────────────────────────────────────────
+DEFAULT_TIER = os.getenv("DEFAULT_TIER", "free")
+BATCH_WALLETS_PER_SCAN = 5  # A batch costs one scan token per this many wallets
+PRUNE_INTERVAL = 600        # Seconds between sweeps of idle buckets
+
+# Limits per tier: <action>_per_min refill rate, <action>_burst bucket size, max_batch wallets per paste.
+# None means unlimited.
+TIERS: Dict[str, Dict[str, Optional[float]]] = {
+    "free": {"scan_per_min": 6, "scan_burst": 3, "refresh_per_min": 6, "refresh_burst": 3, "max_batch": 10},
+    "pro": {"scan_per_min": 30, "scan_burst": 10, "refresh_per_min": 30, "refresh_burst": 10, "max_batch": 50},
+    "unlimited": {"scan_per_min": None, "scan_burst": None, "refresh_per_min": None, "refresh_burst": None, "max_batch": None},
+}
+
+# ── Token Bucket ───────────────────────────────────────────────────────────
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate  # tokens per second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, cost: float = 1) -> float:
+        """Take cost tokens; returns 0 on success, otherwise seconds until they are available"""
+        now = time.monotonic()
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    async def try_acquire_async(self, cost: float = 1) -> float:
+        """try_acquire for buckets whose state lives outside the process"""
+        return self.try_acquire(cost)
+
+    async def acquire(self, cost: float = 1):
+        """Wait until cost tokens are available and take them"""
+        while True:
+            wait = await self.try_acquire_async(cost)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def idle(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+# ── Per-User Limiter ───────────────────────────────────────────────────────
+BucketFactory = Callable[[str, float, float], TokenBucket]  # (key, capacity, rate) -> bucket
+
+class UserRateLimiter:
+    """Per-user token buckets for scans and refreshes, sized by the user's tier.
+
+    Buckets come from create_bucket; main.py sets it to storage.create_token_bucket, so with
+    STORAGE_BACKEND=sqlite every worker charges the same per-user budget.
+    """
+
+    def __init__(self, tiers: Optional[Dict[str, Dict[str, Optional[float]]]] = None,
+                 create_bucket: Optional[BucketFactory] = None):
+        self.tiers = {name: dict(limits) for name, limits in (tiers or TIERS).items()}
+        self.create_bucket: BucketFactory = create_bucket or (lambda key, capacity, rate: TokenBucket(capacity, rate))
+        self._buckets: Dict[Tuple[Any, str], TokenBucket] = {}
+        self._last_prune = time.monotonic()
+
+    def limits(self, tier: Optional[str]) -> Dict[str, Optional[float]]:
+        return self.tiers.get(tier or DEFAULT_TIER) or self.tiers.get(DEFAULT_TIER) or {}
+
+    async def check(self, user_id: Any, tier: Optional[str], action: str, cost: float = 1) -> float:
+        """Charge an action to user_id; returns 0 if allowed, otherwise seconds to wait"""
+        limits = self.limits(tier)
+        per_min = limits.get(f"{action}_per_min")
+        burst = limits.get(f"{action}_burst")
+        if not per_min or not burst:
+            return 0.0
+
+        key = (user_id, action)
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.capacity != burst or bucket.rate != per_min / 60:
+            # A shared bucket keeps its stored tokens across tier changes, capped at the new burst
+            bucket = self._buckets[key] = self.create_bucket(f"user:{user_id}:{action}", burst, per_min / 60)
+        wait = await bucket.try_acquire_async(cost)
+        self._prune()
+        return wait
+
+    async def check_batch(self, user_id: Any, tier: Optional[str], size: int) -> Tuple[Optional[int], float]:
+        """Returns (max_batch if size exceeds it else None, seconds to wait for the scan tokens)"""
+        max_batch = self.limits(tier).get("max_batch")
+        if max_batch and size > max_batch:
+            return int(max_batch), 0.0
+        return None, await self.check(user_id, tier, "scan", math.ceil(size / BATCH_WALLETS_PER_SCAN))
+
+    def set_limit(self, tier: str, limit: str, value: Optional[float]):
+        self.tiers.setdefault(tier, dict(self.limits(DEFAULT_TIER)))[limit] = value
+
+    def load_tiers(self, tiers: Optional[Dict[str, Dict[str, Optional[float]]]]):
+        for name, limits in (tiers or {}).items():
+            self.tiers.setdefault(name, {}).update(limits)
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        idle_keys = [key for key, bucket in self._buckets.items() if bucket.idle(now)]
+        for key in idle_keys:
+            del self._buckets[key]
+        self._last_prune = now
+
+rate_limiter = UserRateLimiter()
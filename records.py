@@ -0,0 +1,86 @@
+import os
+from typing import Optional, Dict, List, Any, NamedTuple, Type, TypeVar
+
+# Records are tuples so they stay small in the memory cache and survive the sqlite cache's JSON
+# round trip as plain lists (rebuilt with as_record / as_records on the way out)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+TEXT_POOL_SIZE = int(os.getenv("TEXT_POOL_SIZE", "100000"))  # Distinct mints, symbols and names shared between records
+
+# ── Shared Strings ─────────────────────────────────────────────────────────
+_text_pool: Dict[str, str] = {}
+
+def share(text: str) -> str:
+    """One copy of a string that repeats across cached records, e.g. USDC's mint in thousands of wallets"""
+    shared = _text_pool.get(text)
+    if shared is None:
+        if len(_text_pool) >= TEXT_POOL_SIZE:
+            # Mostly one-off spam mints by then; start over instead of keeping them forever as sys.intern would
+            _text_pool.clear()
+        shared = _text_pool[text] = text
+    return shared
+
+# ── Records ────────────────────────────────────────────────────────────────
+def token_amount(amount: Dict[str, Any]) -> float:
+    """UI amount of a jsonParsed token balance, decimals and mint extensions already applied by the RPC"""
+    # uiAmountString carries Token-2022 interest-bearing / scaled amounts and is exact for balances
+    # too large for uiAmount, which the RPC then sends as null
+    if amount.get("uiAmountString") is not None:
+        return float(amount["uiAmountString"])
+    if amount.get("uiAmount") is not None:
+        return float(amount["uiAmount"])
+    return int(amount.get("amount") or 0) / 10 ** (amount.get("decimals") or 0)
+
+class TokenAccount(NamedTuple):
+    """A wallet's token account as cached: only what scans and subscriptions read of the jsonParsed response"""
+    pubkey: str
+    mint: str
+    amount: float  # UI amount
+    program: str
+
+    @classmethod
+    def from_parsed(cls, account: Dict[str, Any], program: str) -> "TokenAccount":
+        info = account.get("account", {}).get("data", {}).get("parsed", {}).get("info", {})
+        return cls(account.get("pubkey") or "", share(info.get("mint") or ""),
+                   token_amount(info.get("tokenAmount", {})), program)
+
+class TokenMarket(NamedTuple):
+    """Market data of one token, as cached per mint"""
+    name: str
+    symbol: str
+    price_usd: Optional[float]
+    price_in_sol: Optional[float]
+    market_cap: Optional[float]
+    volume_24h: Optional[float]
+    liquidity: Optional[float]
+    price_change_24h: Optional[float]
+    url: str
+    verified: bool = False
+    fetched_at: float = 0.0
+
+class TokenRow(NamedTuple):
+    """One valuable holding in a report"""
+    mint: str
+    name: str
+    symbol: str
+    balance: float
+    price_usd: Optional[float]
+    token_usd_value: float
+    market_cap: Optional[float]
+    volume_24h: Optional[float]
+    price_change_24h: Optional[float]
+    verified: bool
+    url: str
+    token_sol_value: Optional[float] = None  # Solana holdings only
+    network: Optional[str] = None            # EVM holdings only
+
+Record = TypeVar("Record", TokenAccount, TokenMarket, TokenRow)
+
+def as_record(cls: Type[Record], value: Any) -> Record:
+    """A cached record, rebuilt if the cache backend handed it back as a list"""
+    return value if isinstance(value, cls) else cls._make(value)
+
+def as_records(cls: Type[Record], values: List[Any]) -> List[Record]:
+    if not values or isinstance(values[0], cls):
+        return values
+    return [cls._make(value) for value in values]
@@ -0,0 +1,394 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import itertools
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Optional, Dict, List, Any, Iterator, Tuple
+
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+from benchmark import FakeUpstreams, UPSTREAMS, UPSTREAM_LIMIT_VARS, summarize, peak_rss_bytes, random_solana_address, random_ethereum_address
+
+# ── Configuration ──────────────────────────────────────────────────────────
+UPDATE_KINDS = ("wallet", "batch", "refresh", "page")
+DEFAULT_MIX = "wallet=60,batch=5,refresh=25,page=10"
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "Replay", "username": "replay_bot"}
+
+# ── Recording Bot API ──────────────────────────────────────────────────────
+class RecordingRequest(BaseRequest):
+    """Bot API transport that answers every call locally and records it"""
+
+    def __init__(self, latency_ms: float = 0, jitter: float = 0.2, flood_rate: float = 0.0, seed: int = 1):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.rng = random.Random(seed)
+        self.counts: Counter = Counter()
+        self.chat_calls: Dict[Any, List[float]] = defaultdict(list)  # chat_id -> monotonic call times
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return 5.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000 * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            self.counts[f"{api_method}.429"] += 1
+            body = {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1}}
+            return 429, json.dumps(body).encode()
+
+        self.counts[api_method] += 1
+        chat_id = params.get("chat_id")
+        if chat_id is not None:
+            self.chat_calls[int(chat_id)].append(time.monotonic())
+        return 200, json.dumps({"ok": True, "result": self._result(api_method, params)}).encode()
+
+    def _result(self, api_method: str, params: Dict[str, Any]) -> Any:
+        if api_method == "getMe":
+            return {**BOT_USER, "can_join_groups": False, "can_read_all_group_messages": False,
+                    "supports_inline_queries": False}
+        if api_method in ("sendMessage", "sendDocument", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            message_id = params.get("message_id") or next(self._message_ids)
+            return {
+                "message_id": int(message_id),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        return True
+
+    def first_call_after(self, chat_id: int, since: float) -> Optional[float]:
+        times = self.chat_calls.get(chat_id, [])
+        index = bisect_left(times, since)
+        return times[index] if index < len(times) else None
+
+# ── Synthetic Updates ──────────────────────────────────────────────────────
+class UpdateFactory:
+    """Builds raw update payloads like the ones Telegram sends for pastes and button presses"""
+
+    def __init__(self, upstreams: Optional[FakeUpstreams], users: int, wallet_tokens: List[int],
+                 batch_size: int, eth_share: float, rng: random.Random):
+        self.upstreams = upstreams
+        self.users = users
+        self.wallet_tokens = wallet_tokens
+        self.batch_size = batch_size
+        self.eth_share = eth_share
+        self.rng = rng
+        self.scanned: Dict[int, List[Tuple[str, str]]] = defaultdict(list)  # user -> wallets it has pasted
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1_000_000)
+        self._wallets = itertools.count()
+
+    def _user(self, user_id: int) -> Dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": f"Replay{user_id}", "username": f"replay_{user_id}"}
+
+    def _wallet(self, user_id: int) -> Tuple[str, str]:
+        if self.rng.random() < self.eth_share:
+            wallet = (random_ethereum_address(self.rng), "ethereum")
+        else:
+            wallet = (random_solana_address(self.rng), "solana")
+            if self.upstreams:
+                self.upstreams.wallets[wallet[0]] = self.wallet_tokens[next(self._wallets) % len(self.wallet_tokens)]
+        self.scanned[user_id].append(wallet)
+        return wallet
+
+    def _message(self, user_id: int, text: str) -> Dict[str, Any]:
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self._user(user_id),
+                "text": text,
+            },
+        }
+
+    def _callback(self, user_id: int, data: str) -> Dict[str, Any]:
+        update_id = next(self._update_ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "🟣 Enhanced Solana Analysis",
+                },
+            },
+        }
+
+    def build(self, kind: str) -> Tuple[str, Dict[str, Any]]:
+        user_id = self.rng.randint(1, self.users)
+        history = self.scanned.get(user_id)
+        if kind == "refresh" and history:
+            address, wallet_type = self.rng.choice(history)
+            return kind, self._callback(user_id, f"refresh_{address}_{wallet_type}")
+        if kind == "page":
+            solana = [address for address, wallet_type in history or [] if wallet_type == "solana"]
+            if solana:
+                return kind, self._callback(user_id, f"tokens_{self.rng.choice(solana)}_{self.rng.randint(0, 2)}")
+        if kind == "batch":
+            wallets = [self._wallet(user_id)[0] for _ in range(self.batch_size)]
+            return kind, self._message(user_id, "\n".join(wallets))
+        # Callbacks need an earlier paste from the same user
+        return "wallet", self._message(user_id, self._wallet(user_id)[0])
+
+    def stream(self, mix: Dict[str, float], count: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        kinds, weights = zip(*mix.items())
+        for _ in range(count):
+            yield self.build(self.rng.choices(kinds, weights)[0])
+
+def recorded_updates(path: str, count: Optional[int]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Updates from an NDJSON file of raw Telegram update payloads (e.g. captured getUpdates results)"""
+    with open(path) as f:
+        lines = (line for line in f if line.strip())
+        for line in itertools.islice(lines, count):
+            data = json.loads(line)
+            if "callback_query" in data:
+                kind = "refresh" if (data["callback_query"].get("data") or "").startswith("refresh_") else "page"
+            else:
+                kind = "batch" if "\n" in ((data.get("message") or {}).get("text") or "").strip() else "wallet"
+            yield kind, data
+
+# ── Replay ─────────────────────────────────────────────────────────────────
+def chat_id_of(update: Update) -> Optional[int]:
+    return update.effective_chat.id if update.effective_chat else None
+
+async def replay(args: argparse.Namespace) -> Dict[str, Any]:
+    upstreams = None
+    if not args.live_upstreams:
+        upstreams = FakeUpstreams(args.latencies, args.jitter, args.error_rate, args.mint_pool, args.tokens[0], args.seed)
+        await upstreams.start()
+        os.environ.update(upstreams.env())
+
+    # main.py configures itself at import time, so everything it reads must be set first
+    os.environ.setdefault("TELEGRAM_TOKEN", "123456:REPLAY")
+    os.environ.setdefault("ETHERSCAN_API_KEY", "replay")
+    if not args.respect_limits:
+        os.environ["DEFAULT_TIER"] = "unlimited"
+    if not args.upstream_limits:
+        for name in UPSTREAM_LIMIT_VARS:
+            os.environ.setdefault(name, "0")
+    state_dir = tempfile.TemporaryDirectory(prefix="replay-")
+    os.environ["USER_DATA_FILE"] = os.path.join(state_dir.name, "user_data.json")
+    os.environ["SHARED_DB_PATH"] = os.path.join(state_dir.name, "scanner_state.db")
+    cold_started = time.monotonic()
+    import main as bot
+    imported_in = time.monotonic() - cold_started
+    from outbound import outbound
+    from scan_scheduler import scan_scheduler
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+    if args.outbound_rate:
+        outbound.global_rate = args.outbound_rate
+
+    request = RecordingRequest(args.telegram_latency_ms, args.jitter, args.flood_rate, args.seed)
+    application = bot.build_application(request=request, updater=False)
+    handler_errors: Counter = Counter()
+
+    async def count_error(update: object, context):
+        handler_errors[type(context.error).__name__] += 1
+    application.add_error_handler(count_error)
+
+    if args.updates:
+        source = recorded_updates(args.updates, args.count)
+    else:
+        factory = UpdateFactory(upstreams, args.users, args.tokens, args.batch_size, args.eth_share, random.Random(args.seed))
+        source = factory.stream(args.mix, args.count)
+
+    results: Dict[str, List[Tuple[float, Optional[float]]]] = defaultdict(list)  # kind -> (handled, first reply)
+    max_lag = 0.0
+    interval = 60 / args.rate if args.rate else 0.0
+
+    async def process(kind: str, update: Update, injected: float):
+        await application.update_processor.process_update(update, application.process_update(update))
+        handled = time.monotonic() - injected
+        chat_id = chat_id_of(update)
+        first = request.first_call_after(chat_id, injected) if chat_id is not None else None
+        results[kind].append((handled, first - injected if first is not None else None))
+
+    # Same startup sequence as main.main(), timed for the cold-start report
+    prewarm_task = asyncio.create_task(bot.prewarm())
+    await asyncio.gather(application.initialize(), bot.load_user_data())
+    async with application:
+        await application.start()
+        ready_in = time.monotonic() - cold_started
+        tasks = []
+        started = time.monotonic()
+        for index, (kind, data) in enumerate(source):
+            due = started + index * interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+            update = Update.de_json(data, application.bot)
+            tasks.append(asyncio.create_task(process(kind, update, time.monotonic())))
+        injected_in = time.monotonic() - started
+        await asyncio.gather(*tasks)
+        await outbound.stop(timeout=30)
+        elapsed = time.monotonic() - started
+        await application.stop()
+    await prewarm_task
+    await scan_scheduler.stop()
+    if upstreams:
+        await upstreams.stop()
+    state_dir.cleanup()
+
+    total = sum(len(samples) for samples in results.values())
+    return {
+        "generated_at": time.time(),
+        "config": {
+            "source": args.updates or "synthetic",
+            "count": args.count,
+            "rate_per_minute": args.rate,
+            "mix": args.mix,
+            "users": args.users,
+            "batch_size": args.batch_size,
+            "wallet_tokens": args.tokens,
+            "eth_share": args.eth_share,
+            "telegram_latency_ms": args.telegram_latency_ms,
+            "flood_rate": args.flood_rate,
+            "outbound_rate": outbound.global_rate,
+            "upstream_latency_ms": None if args.live_upstreams else args.latencies,
+            "upstream_error_rate": args.error_rate,
+            "respect_limits": args.respect_limits,
+            "upstream_limits": args.upstream_limits,
+            "seed": args.seed,
+        },
+        "updates": total,
+        "duration": round(elapsed, 3),
+        "injected_per_minute": round(total / injected_in * 60, 1) if injected_in else None,
+        "handled_per_minute": round(total / elapsed * 60, 1) if elapsed else None,
+        "max_injection_lag": round(max_lag, 4),
+        "cold_start": {
+            "import": round(imported_in, 4),
+            "ready": round(ready_in, 4),
+            "first_reply": round(outbound.first_sent_at - cold_started, 4) if outbound.first_sent_at else None,
+            "target": bot.COLD_START_TARGET,
+        },
+        "by_kind": {
+            kind: {
+                "count": len(samples),
+                "handler_latency": summarize([handled for handled, _ in samples]),
+                "first_reply_latency": summarize([first for _, first in samples if first is not None]),
+            }
+            for kind, samples in sorted(results.items())
+        },
+        "handler_errors": dict(handler_errors),
+        "telegram_calls": dict(sorted(request.counts.items())),
+        "outbound": outbound.stats(),
+        "scan_scheduler": scan_scheduler.stats(),
+        "upstream_calls": dict(sorted(upstreams.calls.items())) if upstreams else None,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+# ── Entry Point ────────────────────────────────────────────────────────────
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay synthetic or recorded Telegram updates through the bot's Application")
+    parser.add_argument("--count", type=int, default=1000, help="Updates to replay")
+    parser.add_argument("--rate", type=float, default=3000, help="Updates per minute (0 = as fast as possible)")
+    parser.add_argument("--updates", help="NDJSON file of recorded update payloads instead of synthetic ones")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weights of synthetic update kinds: " + ", ".join(UPDATE_KINDS))
+    parser.add_argument("--users", type=int, default=200, help="Distinct synthetic users")
+    parser.add_argument("--batch-size", type=int, default=5, help="Wallets per synthetic batch paste")
+    parser.add_argument("--eth-share", type=float, default=0.2, help="Fraction of pasted wallets that are Ethereum")
+    parser.add_argument("--wallet-tokens", default="10", help="Comma separated token counts for fake Solana wallets")
+    parser.add_argument("--mint-pool", type=int, default=500)
+    parser.add_argument("--telegram-latency-ms", type=float, default=40, help="Simulated Bot API latency")
+    parser.add_argument("--outbound-rate", type=float, help="Override the outbound scheduler's global sends/second")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Fraction of Bot API calls answered with 429")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Simulated upstream API latency")
+    parser.add_argument("--upstream-latency", action="append", default=[], metavar="NAME=MS")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream requests that fail")
+    parser.add_argument("--live-upstreams", action="store_true", help="Use the real APIs instead of local fakes")
+    parser.add_argument("--upstream-limits", action="store_true", help="Keep the per-upstream request rate limits")
+    parser.add_argument("--respect-limits", action="store_true", help="Keep per-user rate limits (default: unlimited tier)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="Keep the bot's logging")
+    args = parser.parse_args(argv)
+
+    mix = {}
+    for part in args.mix.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in UPDATE_KINDS or not weight:
+            parser.error(f"bad --mix entry {part!r}")
+        mix[kind.strip()] = float(weight)
+    args.mix = mix
+    args.tokens = [int(t) for t in args.wallet_tokens.split(",")]
+    args.latencies = {name: args.latency_ms for name in UPSTREAMS}
+    for override in args.upstream_latency:
+        name, _, value = override.partition("=")
+        if name not in UPSTREAMS or not value:
+            parser.error(f"bad --upstream-latency {override!r}")
+        args.latencies[name] = float(value)
+    return args
+
+def print_summary(report: Dict[str, Any]):
+    print(
+        f"{report['updates']} updates in {report['duration']:.1f}s "
+        f"(injected {report['injected_per_minute']}/min, handled {report['handled_per_minute']}/min, "
+        f"max lag {report['max_injection_lag'] * 1000:.0f}ms)",
+        file=sys.stderr
+    )
+    cold = report["cold_start"]
+    first_reply = f"{cold['first_reply']:.2f}s" if cold["first_reply"] is not None else "-"
+    print(
+        f"cold start: import {cold['import']:.2f}s, ready {cold['ready']:.2f}s, "
+        f"first reply {first_reply} (target {cold['target']:.1f}s)",
+        file=sys.stderr
+    )
+    for kind, stats in report["by_kind"].items():
+        handled, first = stats["handler_latency"], stats["first_reply_latency"]
+        print(
+            f"{kind:<8} n={stats['count']:<5} handler p50={handled['p50']*1000:.0f}ms p95={handled['p95']*1000:.0f}ms "
+            f"p99={handled['p99']*1000:.0f}ms  first reply p50={first['p50']*1000:.0f}ms p95={first['p95']*1000:.0f}ms",
+            file=sys.stderr
+        )
+    if report["handler_errors"]:
+        print(f"handler errors: {report['handler_errors']}", file=sys.stderr)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(replay(args))
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    print_summary(report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from collections import OrderedDict, deque
+from typing import Optional, Dict, List, Any, Callable, Awaitable, Deque
+
+from metrics import SCANS_IN_FLIGHT
+from tracing import record_span
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "8"))            # Concurrent scans across all users
+SCAN_MAX_PER_USER = int(os.getenv("SCAN_MAX_PER_USER", "2"))  # Concurrent scans for any one user
+INITIAL_SCAN_SECONDS = 3.0  # ETA seed until real scan durations are observed
+
+# Scan classes, served in this order
+CLASS_SINGLE = 0  # Single-wallet scans, refreshes & pagination
+CLASS_BATCH = 1   # Items of a multi-wallet batch
+
+# ── Scan Scheduler ─────────────────────────────────────────────────────────
+class ScanTicket:
+    """Handle for a queued scan; await it for the scan result"""
+    __slots__ = ("scheduler", "user_id", "scan_class", "factory", "future", "context", "enqueued_at", "started_at")
+
+    def __init__(self, scheduler: "ScanScheduler", user_id: Any, scan_class: int,
+                 factory: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.scan_class = scan_class
+        self.factory = factory
+        self.future = future
+        self.context = contextvars.copy_context()  # The scan runs in the submitter's context (e.g. its trace)
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+
+    def __await__(self):
+        return self.future.__await__()
+
+    @property
+    def started(self) -> bool:
+        return self.started_at is not None
+
+    def position(self) -> int:
+        """Number of queued scans that will start before this one (0 once started)"""
+        return self.scheduler.position(self)
+
+    def eta(self) -> float:
+        """Estimated seconds until this scan starts"""
+        return self.scheduler.eta(self)
+
+    def cancel(self):
+        if not self.future.done():
+            self.future.cancel()
+
+class ScanScheduler:
+    """Bounded worker pool with per-user queues served round-robin.
+
+    Single scans are always picked before batch items, and within a class each
+    user with queued work gets one scan per round so a large batch cannot starve
+    everyone else.
+    """
+
+    def __init__(self, workers: int = SCAN_WORKERS, max_per_user: int = SCAN_MAX_PER_USER):
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self._queues: List["OrderedDict[Any, Deque[ScanTicket]]"] = [OrderedDict(), OrderedDict()]
+        self._running: Dict[Any, int] = {}
+        self._inflight: set = set()
+        self._avg_duration = INITIAL_SCAN_SECONDS
+        self._completed = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._loop = None
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._run())
+
+    def submit(self, user_id: Any, factory: Callable[[], Awaitable[Any]], batch: bool = False) -> ScanTicket:
+        """Queue a scan for user_id; factory is called once a worker is free"""
+        self._ensure_dispatcher()
+        scan_class = CLASS_BATCH if batch else CLASS_SINGLE
+        ticket = ScanTicket(self, user_id, scan_class, factory, self._loop.create_future())
+        queue = self._queues[scan_class]
+        if user_id not in queue:
+            queue[user_id] = deque()
+        queue[user_id].append(ticket)
+        self._wakeup.set()
+        return ticket
+
+    async def run(self, user_id: Any, factory: Callable[[], Awaitable[Any]], batch: bool = False) -> Any:
+        """Queue a scan and wait for its result"""
+        return await self.submit(user_id, factory, batch)
+
+    def _next_ticket(self) -> Optional[ScanTicket]:
+        if len(self._inflight) >= self.workers:
+            return None
+        for queue in self._queues:
+            for user_id in list(queue.keys()):
+                tickets = queue[user_id]
+                while tickets and tickets[0].future.done():
+                    tickets.popleft()  # Cancelled while waiting
+                if not tickets:
+                    del queue[user_id]
+                    continue
+                if self._running.get(user_id, 0) >= self.max_per_user:
+                    continue
+                ticket = tickets.popleft()
+                # Rotate this user to the back of the round
+                del queue[user_id]
+                if tickets:
+                    queue[user_id] = tickets
+                return ticket
+        return None
+
+    async def _run(self):
+        while True:
+            ticket = self._next_ticket()
+            if ticket is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            ticket.started_at = time.monotonic()
+            self._running[ticket.user_id] = self._running.get(ticket.user_id, 0) + 1
+            task = asyncio.create_task(self._execute(ticket), context=ticket.context)
+            self._inflight.add(task)
+
+    async def _execute(self, ticket: ScanTicket):
+        SCANS_IN_FLIGHT.inc()
+        record_span("queue", ticket.started_at - ticket.enqueued_at)
+        try:
+            result = await ticket.factory()
+        except Exception as e:
+            if not ticket.future.done():
+                ticket.future.set_exception(e)
+        except asyncio.CancelledError:
+            # Raised by the factory or by cancelling this task; either way the caller must not wait forever
+            if not ticket.future.done():
+                ticket.future.cancel()
+            raise
+        except BaseException as e:
+            if not ticket.future.done():
+                ticket.future.set_exception(e)
+            raise
+        else:
+            if not ticket.future.done():
+                ticket.future.set_result(result)
+        finally:
+            SCANS_IN_FLIGHT.dec()
+            duration = time.monotonic() - ticket.started_at
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            self._completed += 1
+            self._running[ticket.user_id] -= 1
+            if not self._running[ticket.user_id]:
+                del self._running[ticket.user_id]
+            self._inflight.discard(asyncio.current_task())
+            self._wakeup.set()
+
+    def position(self, ticket: ScanTicket) -> int:
+        """Scans ahead of ticket assuming round-robin order and no new arrivals"""
+        if ticket.started or ticket.future.done():
+            return 0
+        own = self._queues[ticket.scan_class].get(ticket.user_id)
+        if own is None or ticket not in own:
+            return 0
+        depth = own.index(ticket)
+        ahead = depth
+        for scan_class, queue in enumerate(self._queues):
+            if scan_class > ticket.scan_class:
+                break
+            for user_id, tickets in queue.items():
+                if scan_class == ticket.scan_class and user_id == ticket.user_id:
+                    continue
+                ahead += len(tickets) if scan_class < ticket.scan_class else min(len(tickets), depth + 1)
+        return ahead
+
+    def eta(self, ticket: ScanTicket) -> float:
+        if ticket.started or ticket.future.done():
+            return 0.0
+        slots_needed = self.position(ticket) + len(self._inflight) - self.workers + 1
+        if slots_needed <= 0:
+            return 0.0
+        return (slots_needed / self.workers + 1) * self._avg_duration
+
+    def queued(self) -> int:
+        return sum(len(tickets) for queue in self._queues for tickets in queue.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": len(self._inflight),
+            "queued_single": sum(len(t) for t in self._queues[CLASS_SINGLE].values()),
+            "queued_batch": sum(len(t) for t in self._queues[CLASS_BATCH].values()),
+            "users_waiting": len(set(self._queues[CLASS_SINGLE]) | set(self._queues[CLASS_BATCH])),
+            "completed": self._completed,
+            "avg_duration": self._avg_duration,
+        }
+
+    async def stop(self):
+        for queue in self._queues:
+            for tickets in queue.values():
+                for ticket in tickets:
+                    ticket.cancel()
+            queue.clear()
+        if self._dispatcher and not self._dispatcher.done():
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+        self._dispatcher = None
+
+scan_scheduler = ScanScheduler()
@@ -1,64 +1,496 @@
 import os
 import ssl
 import time
+import socket
+import asyncio
 import hashlib
 import logging
 import aiohttp
 import certifi
-from typing import Optional, Dict, List, Any
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, List, Any, Tuple
 from aiohttp import ClientTimeout
 
+from storage import CacheBackend, create_cache_backend, create_token_bucket
+from metrics import (
+    track_upstream, CACHE_REQUESTS, PRICE_TTL, PRICE_STALENESS, PRICE_REFRESHES, ETHERSCAN_KEY_CALLS,
+    ETHERSCAN_KEYS_BENCHED
+)
+from tracing import record_cache
+from records import TokenAccount, TokenMarket, as_record, as_records, share
+
 # ── Logging ────────────────────────────────────────────────────────────────
 logger = logging.getLogger(__name__)
 
 # ── API Endpoints ──────────────────────────────────────────────────────────
-SOLANA_RPC_URL = "https://api.mainnet-beta.solana.com"
-SOL_PRICE_API = "https://api.coingecko.com/api/v3/simple/price?ids=solana&vs_currencies=usd"
-DEXSCREENER_API = "https://api.dexscreener.com/latest/dex/search"
-ETHERSCAN_API = "https://api.etherscan.io/api"
-ETH_PRICE_API = "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd"
+# Overridable so the bot can be pointed at a private RPC or at local stand-ins (see benchmark.py)
+SOLANA_RPC_URL = os.getenv("SOLANA_RPC_URL", "https://api.mainnet-beta.solana.com")
+# Account subscriptions for watched wallets (see subscriptions.py); "off" falls back to polling only
+SOLANA_WS_URL = os.getenv("SOLANA_WS_URL", SOLANA_RPC_URL.replace("https://", "wss://", 1).replace("http://", "ws://", 1))
+COINGECKO_API = os.getenv("COINGECKO_API", "https://api.coingecko.com/api/v3")
+COINGECKO_API_KEY = os.getenv("COINGECKO_API_KEY")
+COINGECKO_KEY_HEADER = os.getenv("COINGECKO_KEY_HEADER", "x-cg-demo-api-key")  # x-cg-pro-api-key for paid plans
+DEXSCREENER_API = os.getenv("DEXSCREENER_API", "https://api.dexscreener.com/latest/dex/search")
+# Etherscan V2: one endpoint and key for every supported EVM chain, selected with chainid
+ETHERSCAN_API = os.getenv("ETHERSCAN_API", "https://api.etherscan.io/v2/api")
 
 # ── Configuration ──────────────────────────────────────────────────────────
 ETHERSCAN_API_KEY = os.getenv("ETHERSCAN_API_KEY")
+# Several keys (comma separated) multiply Etherscan throughput: each gets its own ETHERSCAN_RPS budget
+ETHERSCAN_API_KEYS = [
+    key.strip() for key in os.getenv("ETHERSCAN_API_KEYS", ETHERSCAN_API_KEY or "").split(",") if key.strip()
+]
+ETHERSCAN_BENCH_SECONDS = float(os.getenv("ETHERSCAN_BENCH_SECONDS", "2"))  # Rest for a key over its per-second limit
+ETHERSCAN_LONG_BENCH_SECONDS = 3600  # ... and for one that is invalid or out of daily quota
+ETHERSCAN_MAX_WAIT = 10.0            # Longest a call waits for a benched key before giving up
+
+# EVM chains checked for 0x addresses; coin is the CoinGecko id of the native coin, platform its token platform id
+EVM_CHAIN_INFO = {
+    "ethereum": {"id": 1, "name": "Ethereum", "symbol": "ETH", "coin": "ethereum",
+                 "platform": "ethereum", "explorer": "https://etherscan.io"},
+    "base": {"id": 8453, "name": "Base", "symbol": "ETH", "coin": "ethereum",
+             "platform": "base", "explorer": "https://basescan.org"},
+    "arbitrum": {"id": 42161, "name": "Arbitrum", "symbol": "ETH", "coin": "ethereum",
+                 "platform": "arbitrum-one", "explorer": "https://arbiscan.io"},
+    "optimism": {"id": 10, "name": "Optimism", "symbol": "ETH", "coin": "ethereum",
+                 "platform": "optimistic-ethereum", "explorer": "https://optimistic.etherscan.io"},
+    "polygon": {"id": 137, "name": "Polygon", "symbol": "POL", "coin": "polygon-ecosystem-token",
+                "platform": "polygon-pos", "explorer": "https://polygonscan.com"},
+    "bsc": {"id": 56, "name": "BNB Chain", "symbol": "BNB", "coin": "binancecoin",
+            "platform": "binance-smart-chain", "explorer": "https://bscscan.com"},
+}
+EVM_CHAINS = [
+    chain for chain in (c.strip().lower() for c in os.getenv("EVM_CHAINS", ",".join(EVM_CHAIN_INFO)).split(","))
+    if chain in EVM_CHAIN_INFO
+] or ["ethereum"]
+TOKEN_TRANSFERS_PAGE_SIZE = 10000  # Etherscan returns at most 10,000 records per query window
 CACHE_DURATION = 300  # 5 minutes
 
+# Token prices are cached until they have probably drifted PRICE_TOLERANCE_PCT, within these bounds.
+# TTL = 2592s / 24h change %: 40%/day -> 65s, 10%/day -> 259s, 5%/day -> 518s, under 1.44%/day -> PRICE_TTL_MAX.
+# Anything moving more than ~8.6%/day is refetched sooner than the flat CACHE_DURATION, before volume scaling.
+PRICE_TOLERANCE_PCT = float(os.getenv("PRICE_TOLERANCE_PCT", "0.03"))
+PRICE_TTL_MIN = float(os.getenv("PRICE_TTL_MIN", "30"))
+PRICE_TTL_MAX = float(os.getenv("PRICE_TTL_MAX", "1800"))
+PRICE_BATCH_WINDOW = float(os.getenv("PRICE_BATCH_WINDOW", "0.05"))  # Seconds to collect price requests per batch
+PRICE_BATCH_SIZE = int(os.getenv("PRICE_BATCH_SIZE", "100"))          # Ids or contract addresses per CoinGecko call
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))  # Open upstream connections kept by the shared session
+# Send related Solana RPC calls as one JSON-RPC batch; disable for providers that reject batches
+SOLANA_RPC_BATCH = os.getenv("SOLANA_RPC_BATCH", "true").lower() not in ("0", "false", "no")
+# Balances of wallets with live account subscriptions are invalidated on change, so they may be cached longer
+LIVE_CACHE_DURATION = float(os.getenv("LIVE_CACHE_DURATION", "3600"))
+
+# Token accounts are owned by either the classic SPL Token program or Token-2022 (token extensions)
+SPL_TOKEN_PROGRAM_ID = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+TOKEN_2022_PROGRAM_ID = "TokenzQdBNbLqP5VEhdkAS6EPFLC1PHnBqCXEpPxuEb"
+TOKEN_PROGRAM_IDS = (SPL_TOKEN_PROGRAM_ID, TOKEN_2022_PROGRAM_ID)
+
+# Requests per second each upstream tolerates (0 disables the limit) and how many may be sent in a burst
+UPSTREAM_LIMITS = {
+    "solana_rpc": (float(os.getenv("SOLANA_RPC_RPS", "10")), 100),
+    "dexscreener": (float(os.getenv("DEXSCREENER_RPS", "5")), 300),
+    "etherscan": (float(os.getenv("ETHERSCAN_RPS", "5")), 1),  # Per key; spaced out, as Etherscan counts per second
+    "coingecko": (float(os.getenv("COINGECKO_RPS", "0.5")), 30),
+}
+
 # ── Secure SSL Context ─────────────────────────────────────────────────────
 ssl_context = ssl.create_default_context(cafile=certifi.where())
 
+# ── HTTP Session ───────────────────────────────────────────────────────────
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_session() -> aiohttp.ClientSession:
+    """Process-wide session so upstream connections and TLS handshakes are reused between scans"""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(ssl=ssl_context, limit=HTTP_POOL_SIZE, ttl_dns_cache=300)
+        )
+        _session_loop = loop
+    return _session
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+async def prewarm():
+    """Open upstream connections and fill the price cache before the first scan needs them"""
+    started = time.monotonic()
+    sol_price, evm_prices = await asyncio.gather(get_sol_price(), get_evm_native_prices(EVM_CHAINS))
+    logger.info(f"Pre-warmed upstreams in {time.monotonic() - started:.2f}s (SOL ${sol_price}, EVM {evm_prices})")
+
 # ── Cache Service ──────────────────────────────────────────────────────────
+LOCK_TIMEOUT = 15.0         # Longest a single-flight lease is held before others give up waiting
+LOCK_POLL_INTERVAL = 0.05   # How often a worker re-checks a lease held by another worker
+
 class CacheService:
-    def __init__(self):
-        self._cache: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self.backend = backend or create_cache_backend()
         self._last_cleanup = time.time()
         self._cleanup_interval = 600
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._locks: Dict[str, List[Any]] = {}  # key -> [asyncio.Lock, waiter count]
 
     def _cleanup(self):
         now = time.time()
         if now - self._last_cleanup > self._cleanup_interval:
-            expired_keys = [k for k, v in self._cache.items() if now - v['timestamp'] > CACHE_DURATION]
-            for k in expired_keys:
-                del self._cache[k]
+            self.backend.purge(now)
             self._last_cleanup = now
 
-    def get(self, key: str) -> Optional[Any]:
+    def get(self, key: str, record: bool = True) -> Optional[Any]:
+        """Fresh cached value or None; record=False skips hit/miss metrics for internal re-checks"""
         self._cleanup()
-        if key in self._cache:
-            entry = self._cache[key]
-            if time.time() - entry['timestamp'] < CACHE_DURATION:
-                return entry['data']
-            else:
-                del self._cache[key]
-        return None
+        entry = self.backend.get(key)
+        data = entry[0] if entry is not None and time.time() < entry[1] else None
+        if record:
+            CACHE_REQUESTS.inc(prefix=key.rsplit('_', 1)[0], result='miss' if data is None else 'hit')
+            record_cache(data is not None)
+        return data
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Cached value even if it has expired (until the next purge)"""
+        entry = self.backend.get(key)
+        return entry[0] if entry is not None else None
 
-    def set(self, key: str, data: Any):
-        self._cache[key] = {'data': data, 'timestamp': time.time()}
+    def set(self, key: str, data: Any, ttl: Optional[float] = None):
+        self.backend.set(key, data, time.time() + (CACHE_DURATION if ttl is None else ttl))
         self._cleanup()
 
+    def delete(self, key: str):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.purge(float("inf"))
+
+    async def lease(self, key: str, ttl: float) -> bool:
+        """Take or renew a lease on key for ttl seconds, e.g. so one worker runs a background job"""
+        return await self.backend.try_lock(key, self._owner, ttl)
+
     def get_key(self, prefix: str, data: str) -> str:
         return f"{prefix}_{hashlib.md5(data.encode()).hexdigest()[:8]}"
 
+    @asynccontextmanager
+    async def single_flight(self, key: str):
+        """Only one fetch of key at a time: across coroutines here, and across workers on a shared backend.
+
+        Callers re-check the cache once inside, so waiters reuse the winner's result.
+        """
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                leased = await self._acquire_lease(key)
+                try:
+                    yield
+                finally:
+                    if leased:
+                        self.backend.unlock(key, self._owner)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def _acquire_lease(self, key: str) -> bool:
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while not await self.backend.try_lock(key, self._owner, LOCK_TIMEOUT):
+            # Another worker is fetching; stop waiting once it has filled the cache
+            if self.get(key, record=False) is not None or time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+        return True
+
 cache_service = CacheService()
 
+# ── Upstream Rate Limits ───────────────────────────────────────────────────
+# Shared by the bot and cli.py; with STORAGE_BACKEND=sqlite also across processes
+upstream_buckets = {
+    name: create_token_bucket(f"upstream:{name}", burst, rps)
+    for name, (rps, burst) in UPSTREAM_LIMITS.items() if rps > 0 and name != "etherscan"  # Per key, see below
+}
+
+async def throttle(upstream: str):
+    """Wait until upstream has room for another request"""
+    bucket = upstream_buckets.get(upstream)
+    if bucket is not None:
+        await bucket.acquire()
+
+# ── Etherscan Key Pool ─────────────────────────────────────────────────────
+class EtherscanKey:
+    """One API key with its own request budget and health"""
+    __slots__ = ("key", "label", "bucket", "in_flight", "benched_until", "bench_reason", "stats")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.label = f"…{key[-4:]}"  # Never log or export a whole key
+        rps, burst = UPSTREAM_LIMITS["etherscan"]
+        digest = hashlib.sha256(key.encode()).hexdigest()[:12]
+        self.bucket = create_token_bucket(f"upstream:etherscan:{digest}", burst, rps) if rps > 0 else None
+        self.in_flight = 0
+        self.benched_until = 0.0
+        self.bench_reason = ""
+        self.stats = {"calls": 0, "rate_limited": 0, "invalid": 0, "errors": 0}
+
+class EtherscanKeyPool:
+    """Spreads Etherscan calls over several keys: least loaded first, misbehaving keys benched for a while"""
+
+    def __init__(self, keys: List[str]):
+        self.keys = [EtherscanKey(key) for key in dict.fromkeys(keys)]
+
+    def _available(self, now: float) -> List[EtherscanKey]:
+        keys = [key for key in self.keys if key.benched_until <= now]
+        ETHERSCAN_KEYS_BENCHED.set(len(self.keys) - len(keys))
+        return sorted(keys, key=lambda key: (key.in_flight, key.stats["calls"]))
+
+    async def acquire(self) -> EtherscanKey:
+        """A key with budget for one more call, waiting for the first to refill if all are busy"""
+        while True:
+            now = time.time()
+            available = self._available(now)
+            if not available:
+                wait = min(key.benched_until for key in self.keys) - now
+                if wait > ETHERSCAN_MAX_WAIT:
+                    raise RuntimeError("Every Etherscan API key is benched")
+                await asyncio.sleep(wait)
+                continue
+            waits = []
+            for key in available:
+                wait = await key.bucket.try_acquire_async() if key.bucket is not None else 0.0
+                if not wait:
+                    key.in_flight += 1
+                    key.stats["calls"] += 1
+                    return key
+                waits.append(wait)
+            await asyncio.sleep(min(waits))
+
+    def release(self, key: EtherscanKey, data: Optional[Dict[str, Any]], status: int = 200) -> Optional[str]:
+        """Record the outcome of a call; returns "rate_limited" or "invalid" if the key was benched for it"""
+        key.in_flight -= 1
+        message = str(data.get("result") or data.get("message") or "") if isinstance(data, dict) else ""
+        lowered = message.lower()
+        if status == 429 or "rate limit" in lowered:
+            # "Max calls per sec" clears within a second or two, "Max daily rate limit" not until tomorrow
+            problem = "rate_limited"
+            seconds = ETHERSCAN_LONG_BENCH_SECONDS if "daily" in lowered else ETHERSCAN_BENCH_SECONDS
+        elif "invalid api key" in lowered:
+            problem, seconds = "invalid", ETHERSCAN_LONG_BENCH_SECONDS
+        else:
+            ETHERSCAN_KEY_CALLS.inc(key=key.label, result="ok" if data is not None else "error")
+            if data is None:
+                key.stats["errors"] += 1
+            return None
+        key.stats[problem] += 1
+        key.benched_until = time.time() + seconds
+        key.bench_reason = message[:80]
+        ETHERSCAN_KEY_CALLS.inc(key=key.label, result=problem)
+        logger.error(f"Etherscan key {key.label} benched for {seconds:.0f}s: {message[:80]}")
+        return problem
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        return [
+            {"key": key.label, "in_flight": key.in_flight, **key.stats,
+             "benched_for": max(0.0, key.benched_until - now), "bench_reason": key.bench_reason}
+            for key in self.keys
+        ]
+
+etherscan_keys = EtherscanKeyPool(ETHERSCAN_API_KEYS)
+
+async def etherscan_get(params: Dict[str, Any], name: str, timeout: float = 10) -> Dict[str, Any]:
+    """One Etherscan V2 call on the least-loaded key, tried again on another key if this one gets benched"""
+    session = get_session()
+    for _ in range(len(etherscan_keys.keys) + 1):
+        key = await etherscan_keys.acquire()
+        data, status = None, 200
+        try:
+            with track_upstream(name):
+                async with session.get(ETHERSCAN_API, params={**params, "apikey": key.key},
+                                       timeout=ClientTimeout(total=timeout)) as response:
+                    status = response.status
+                    if status != 429:
+                        response.raise_for_status()
+                        data = await response.json()
+        finally:
+            problem = etherscan_keys.release(key, data, status)
+        if problem is None:
+            return data
+    raise RuntimeError("Etherscan rate limited or rejected every API key")
+
+# ── Price Freshness ────────────────────────────────────────────────────────
+def price_ttl(price_change_24h: Optional[float], volume_24h: Optional[float] = None,
+              liquidity: Optional[float] = None) -> float:
+    """Seconds a token price takes to drift PRICE_TOLERANCE_PCT at its recent pace, clamped to the TTL bounds"""
+    if price_change_24h is None:
+        return CACHE_DURATION
+    pace = max(abs(float(price_change_24h)), 0.01) / 86400  # Percent per second over the last day
+    if volume_24h and liquidity:
+        # Heavy turnover against thin liquidity swings the price far more than its net 24h change shows
+        pace *= 1 + min(float(volume_24h) / float(liquidity), 100) ** 0.5
+    return min(max(PRICE_TOLERANCE_PCT / pace, PRICE_TTL_MIN), PRICE_TTL_MAX)
+
+def price_fetched_at(entry: Any) -> Optional[float]:
+    """When a cached price was fetched: a TokenMarket field, or a key of the CoinGecko entries"""
+    if isinstance(entry, dict):
+        return entry.get("fetched_at")
+    return as_record(TokenMarket, entry).fetched_at
+
+def cache_price(cache_key: str, entry: Any, ttl: float) -> Any:
+    """Store a freshly fetched token price with its volatility TTL; returns the entry as stored"""
+    previous = cache_service.peek(cache_key)
+    if previous and time.time() - (price_fetched_at(previous) or 0) < CACHE_DURATION:
+        PRICE_REFRESHES.inc(effect="extra")
+    if isinstance(entry, TokenMarket):
+        entry = entry._replace(fetched_at=time.time())
+    else:
+        entry["fetched_at"] = time.time()
+    cache_service.set(cache_key, entry, ttl)
+    PRICE_TTL.observe(ttl)
+    PRICE_STALENESS.observe(0)
+    return entry
+
+def observe_cached_price(entry: Any):
+    """Staleness of a token price served from cache; past CACHE_DURATION it is a fetch the adaptive TTL saved"""
+    age = time.time() - (price_fetched_at(entry) or time.time())
+    PRICE_STALENESS.observe(age)
+    if age > CACHE_DURATION:
+        PRICE_REFRESHES.inc(effect="saved")
+
+# ── Price Service ──────────────────────────────────────────────────────────
+class PriceService:
+    """Per-asset price cache in front of CoinGecko; requests from concurrent scans share batched calls"""
+
+    def __init__(self, window: float = PRICE_BATCH_WINDOW, batch_size: int = PRICE_BATCH_SIZE):
+        self.window = window
+        self.batch_size = batch_size
+        self._pending: Dict[str, Dict[str, asyncio.Future]] = {}  # endpoint -> key -> future
+        self._flushers: Dict[str, asyncio.Task] = {}
+        self.stats = {"requested": 0, "fetched": 0, "calls": 0}
+
+    async def get_coin_prices(self, coin_ids: List[str]) -> Dict[str, float]:
+        """USD prices by CoinGecko id (e.g. solana, ethereum); 0.0 when unavailable"""
+        prices = await self._get("coins", "price", coin_ids)
+        return {coin_id: price or 0.0 for coin_id, price in prices.items()}
+
+    async def get_coin_price(self, coin_id: str) -> float:
+        return (await self.get_coin_prices([coin_id]))[coin_id]
+
+    async def get_token_prices(self, platform: str, addresses: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """USD price, market cap, volume and 24h change by contract address; None if CoinGecko has no price"""
+        return await self._get(f"tokens:{platform}", f"token_price_{platform}", addresses)
+
+    async def _get(self, endpoint: str, cache_prefix: str, keys: List[str]) -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            cached = cache_service.get(cache_service.get_key(cache_prefix, key))
+            if cached is not None:
+                if endpoint != "coins":
+                    observe_cached_price(cached)
+                results[key] = cached["value"]
+            else:
+                missing.append(key)
+        if missing:
+            self.stats["requested"] += len(missing)
+            loop = asyncio.get_running_loop()
+            pending = self._pending.setdefault(endpoint, {})
+            futures = {}
+            for key in missing:
+                if key not in pending:
+                    pending[key] = loop.create_future()
+                futures[key] = pending[key]
+            if endpoint not in self._flushers:
+                self._flushers[endpoint] = loop.create_task(self._flush(endpoint, cache_prefix))
+            # Shielded so one cancelled scan does not cancel a price other scans are waiting for
+            values = await asyncio.gather(*(asyncio.shield(future) for future in futures.values()))
+            results.update(zip(futures, values))
+        return results
+
+    async def _flush(self, endpoint: str, cache_prefix: str):
+        """After the batching window, fetch everything requested for endpoint in as few calls as possible"""
+        pending: Dict[str, asyncio.Future] = {}
+        try:
+            await asyncio.sleep(self.window)
+            del self._flushers[endpoint]
+            pending = self._pending.pop(endpoint, {})
+            keys = list(pending)
+            chunks = [keys[i:i + self.batch_size] for i in range(0, len(keys), self.batch_size)]
+            fetched = await asyncio.gather(*(self._fetch(endpoint, chunk) for chunk in chunks))
+            # Waiters first, so a failing cache write can't hold up prices that did arrive
+            for chunk, values in zip(chunks, fetched):
+                for key in chunk:
+                    if not pending[key].done():
+                        pending[key].set_result(values.get(key) if values is not None else None)
+            for chunk, values in zip(chunks, fetched):
+                if values is None:
+                    continue
+                for key in chunk:
+                    # Misses are cached too, so unlisted tokens are not asked for on every scan
+                    value = values.get(key)
+                    cache_key = cache_service.get_key(cache_prefix, key)
+                    if endpoint == "coins":
+                        cache_service.set(cache_key, {"value": value})
+                    elif value is None:
+                        cache_price(cache_key, {"value": None}, PRICE_TTL_MAX)
+                    else:
+                        cache_price(cache_key, {"value": value}, price_ttl(value["price_change_24h"]))
+                    self.stats["fetched"] += 1
+        except Exception as e:
+            logger.error(f"Error fetching batched prices ({endpoint}): {e}")
+        finally:
+            if self._flushers.get(endpoint) is asyncio.current_task():
+                # Stopped before taking its batch (cancelled while waiting): take it now, and let the next request
+                # start a new flusher
+                del self._flushers[endpoint]
+                pending = self._pending.pop(endpoint, {})
+            # Scans wait on these behind asyncio.shield; none may be left waiting forever
+            for future in pending.values():
+                if not future.done():
+                    future.set_result(None)
+
+    async def _fetch(self, endpoint: str, keys: List[str]) -> Optional[Dict[str, Any]]:
+        """One CoinGecko call; None when it failed so nothing is cached"""
+        headers = {COINGECKO_KEY_HEADER: COINGECKO_API_KEY} if COINGECKO_API_KEY else None
+        if endpoint == "coins":
+            url = f"{COINGECKO_API}/simple/price"
+            params = {"ids": ",".join(keys), "vs_currencies": "usd"}
+        else:
+            url = f"{COINGECKO_API}/simple/token_price/{endpoint.split(':', 1)[1]}"
+            params = {
+                "contract_addresses": ",".join(keys), "vs_currencies": "usd",
+                "include_market_cap": "true", "include_24hr_vol": "true", "include_24hr_change": "true",
+            }
+        self.stats["calls"] += 1
+        try:
+            await throttle("coingecko")
+            with track_upstream("coingecko_simple_price" if endpoint == "coins" else "coingecko_token_price"):
+                async with get_session().get(url, params=params, headers=headers, timeout=ClientTimeout(total=10)) as response:
+                    response.raise_for_status()
+                    data = await response.json()
+        except Exception as e:
+            logger.error(f"Error fetching prices from CoinGecko ({endpoint}, {len(keys)} ids): {e}")
+            return None
+        if endpoint == "coins":
+            return {key: (data.get(key) or {}).get("usd") for key in keys}
+        # Contract addresses may come back in a different case (EVM addresses are lowercased)
+        by_address = {address.lower(): quote for address, quote in data.items()}
+        values = {}
+        for key in keys:
+            quote = by_address.get(key.lower()) or {}
+            values[key] = {
+                "price_usd": quote["usd"],
+                "market_cap": quote.get("usd_market_cap"),
+                "volume_24h": quote.get("usd_24h_vol"),
+                "price_change_24h": quote.get("usd_24h_change"),
+            } if quote.get("usd") else None
+        return values
+
+price_service = PriceService()
+
 # ── Solana API Functions ───────────────────────────────────────────────────
 async def get_sol_balance(wallet_address: str) -> float:
     cache_key = cache_service.get_key('sol_balance', wallet_address)
@@ -66,187 +498,282 @@ async def get_sol_balance(wallet_address: str) -> float:
     if cached_result is not None:
         return cached_result
     
-    try:
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getBalance",
-            "params": [wallet_address]
-        }
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-            async with session.post(SOLANA_RPC_URL, json=payload, timeout=ClientTimeout(total=10)) as response:
-                response.raise_for_status()
-                balance_data = await response.json()
-                balance = balance_data.get("result", {}).get("value", 0) / 1e9
-                cache_service.set(cache_key, balance)
-                return balance
-    except Exception as e:
-        logger.error(f"Error fetching SOL balance: {e}")
-        return 0.0
+    async with cache_service.single_flight(cache_key):
+        cached_result = cache_service.get(cache_key, record=False)
+        if cached_result is not None:
+            return cached_result
+
+        try:
+            payload = {
+                "jsonrpc": "2.0",
+                "id": 1,
+                "method": "getBalance",
+                "params": [wallet_address]
+            }
+            await throttle("solana_rpc")
+            with track_upstream("get_sol_balance"):
+                session = get_session()
+                async with session.post(SOLANA_RPC_URL, json=payload, timeout=ClientTimeout(total=10)) as response:
+                    response.raise_for_status()
+                    balance_data = await response.json()
+                    balance = balance_data.get("result", {}).get("value", 0) / 1e9
+                    cache_wallet(cache_key, balance, wallet_address)
+                    return balance
+        except Exception as e:
+            logger.error(f"Error fetching SOL balance: {e}")
+            return 0.0
 
 async def get_sol_price() -> float:
-    cache_key = cache_service.get_key('sol_price', 'current')
-    cached_result = cache_service.get(cache_key)
-    if cached_result is not None:
-        return cached_result
-    
-    try:
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-            async with session.get(SOL_PRICE_API, timeout=ClientTimeout(total=10)) as response:
+    return await price_service.get_coin_price("solana")
+
+async def solana_rpc(calls: List[Dict[str, Any]], name: str) -> List[Dict[str, Any]]:
+    """Responses to several JSON-RPC calls, in order: one batch request, or concurrent requests if batching is off"""
+    payloads = [{"jsonrpc": "2.0", "id": i, **call} for i, call in enumerate(calls)]
+    session = get_session()
+
+    async def post(body):
+        await throttle("solana_rpc")
+        with track_upstream(name):
+            async with session.post(SOLANA_RPC_URL, json=body, timeout=ClientTimeout(total=10)) as response:
                 response.raise_for_status()
-                data = await response.json()
-                price = data.get("solana", {}).get("usd", 0)
-                cache_service.set(cache_key, price)
-                return price
-    except Exception as e:
-        logger.error(f"Error fetching SOL price: {e}")
-        return 0.0
+                return await response.json()
+
+    if SOLANA_RPC_BATCH:
+        responses = await post(payloads)
+        if not isinstance(responses, list):
+            raise ValueError(f"Batch request rejected: {responses.get('error') if isinstance(responses, dict) else responses}")
+        by_id = {item.get("id"): item for item in responses}
+        return [by_id.get(payload["id"], {}) for payload in payloads]
+    return list(await asyncio.gather(*(post(payload) for payload in payloads)))
 
-async def get_token_accounts(wallet_address: str) -> List[dict]:
+async def get_token_accounts(wallet_address: str) -> List[TokenAccount]:
+    """Token accounts under both token programs, each tagged with its program id"""
     cache_key = cache_service.get_key('token_accounts', wallet_address)
     cached_result = cache_service.get(cache_key)
     if cached_result is not None:
-        return cached_result
+        return as_records(TokenAccount, cached_result)
     
+    async with cache_service.single_flight(cache_key):
+        cached_result = cache_service.get(cache_key, record=False)
+        if cached_result is not None:
+            return as_records(TokenAccount, cached_result)
+
+        calls = [
+            {
+                "method": "getTokenAccountsByOwner",
+                "params": [wallet_address, {"programId": program_id}, {"encoding": "jsonParsed"}]
+            }
+            for program_id in TOKEN_PROGRAM_IDS
+        ]
+        try:
+            responses = await solana_rpc(calls, "get_token_accounts")
+        except Exception as e:
+            logger.error(f"Error fetching token accounts: {e}")
+            return []
+
+        accounts = []
+        complete = True
+        for program_id, response in zip(TOKEN_PROGRAM_IDS, responses):
+            if "result" not in response:
+                logger.error(f"Error fetching token accounts ({program_id}): {response.get('error')}")
+                complete = False
+                continue
+            # Only the few fields a scan reads are kept; the parsed response is several times larger
+            accounts.extend(TokenAccount.from_parsed(account, program_id) for account in response["result"].get("value", []))
+        # A partial result is returned but not cached, so the next scan asks again
+        if complete:
+            cache_wallet(cache_key, accounts, wallet_address)
+        return accounts
+
+async def probe_solana_wallets(addresses: List[str]) -> Dict[str, Optional[Tuple[Optional[str], int]]]:
+    """Cheap change probe per wallet: (latest signature, lamports), or None if the probe failed"""
+    calls = []
+    for address in addresses:
+        calls.append({"method": "getSignaturesForAddress", "params": [address, {"limit": 1}]})
+        calls.append({"method": "getBalance", "params": [address]})
     try:
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getTokenAccountsByOwner",
-            "params": [
-                wallet_address,
-                {"programId": "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"},
-                {"encoding": "jsonParsed"}
-            ]
-        }
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-            async with session.post(SOLANA_RPC_URL, json=payload, timeout=ClientTimeout(total=10)) as response:
-                response.raise_for_status()
-                accounts = (await response.json()).get("result", {}).get("value", [])
-                cache_service.set(cache_key, accounts)
-                return accounts
+        responses = await solana_rpc(calls, "probe_solana_wallets")
     except Exception as e:
-        logger.error(f"Error fetching token accounts: {e}")
-        return []
+        logger.error(f"Error probing {len(addresses)} watched wallets: {e}")
+        return {address: None for address in addresses}
+
+    probes: Dict[str, Optional[Tuple[Optional[str], int]]] = {}
+    for i, address in enumerate(addresses):
+        signatures, balance = responses[2 * i], responses[2 * i + 1]
+        if "result" not in signatures or "result" not in balance:
+            probes[address] = None
+            continue
+        latest = signatures["result"][0]["signature"] if signatures["result"] else None
+        probes[address] = (latest, balance["result"].get("value", 0))
+    return probes
+
+# Solana wallets whose accounts are all subscribed right now; maintained by subscriptions.py
+live_wallets = set()
+
+# Bulk runs (cli.py) read every wallet once and turn this off, so their memory doesn't grow with the input
+cache_wallets = True
+
+def wallet_cache_ttl(wallet_address: str) -> Optional[float]:
+    """Cache lifetime of a wallet's balance and token accounts; None is the default CACHE_DURATION"""
+    return LIVE_CACHE_DURATION if wallet_address in live_wallets else None
+
+def cache_wallet(cache_key: str, data: Any, wallet_address: str):
+    """Cache a per-wallet entry (a balance or token accounts) unless wallet caching is off"""
+    if cache_wallets:
+        cache_service.set(cache_key, data, ttl=wallet_cache_ttl(wallet_address))
+
+def invalidate_solana_wallet(wallet_address: str):
+    """Drop a wallet's cached balance and token accounts so the next scan reads them fresh"""
+    cache_service.delete(cache_service.get_key('sol_balance', wallet_address))
+    cache_service.delete(cache_service.get_key('token_accounts', wallet_address))
 
-async def get_token_data_dexscreener(session: aiohttp.ClientSession, mint: str, sol_price_usd: float) -> Optional[Dict[str, Any]]:
+async def get_token_data_dexscreener(session: aiohttp.ClientSession, mint: str, sol_price_usd: float) -> Optional[TokenMarket]:
     cache_key = cache_service.get_key('token_data', mint)
     cached_result = cache_service.get(cache_key)
     if cached_result is not None:
-        return cached_result
+        observe_cached_price(cached_result)
+        return as_record(TokenMarket, cached_result)
     
-    try:
-        url = f"{DEXSCREENER_API}?q={mint}&chain=solana"
-        async with session.get(url, timeout=ClientTimeout(total=15)) as resp:
-            resp.raise_for_status()
-            data = await resp.json()
-            pairs = data.get("pairs", [])
+    async with cache_service.single_flight(cache_key):
+        cached_result = cache_service.get(cache_key, record=False)
+        if cached_result is not None:
+            return as_record(TokenMarket, cached_result)
+
+        try:
+            url = f"{DEXSCREENER_API}?q={mint}&chain=solana"
+            await throttle("dexscreener")
+            with track_upstream("get_token_data_dexscreener"):
+                async with session.get(url, timeout=ClientTimeout(total=15)) as resp:
+                    resp.raise_for_status()
+                    data = await resp.json()
+                    pairs = data.get("pairs", [])
             
-            for pair in pairs:
-                base_token = pair.get("baseToken", {})
-                quote_token = pair.get("quoteToken", {})
+                    for pair in pairs:
+                        base_token = pair.get("baseToken", {})
+                        quote_token = pair.get("quoteToken", {})
                 
-                token_data = None
-                if base_token.get("address", "").lower() == mint.lower():
-                    name = base_token.get("name", "Unknown")
-                    symbol = base_token.get("symbol", "UNK")
-                    price_usd = float(pair.get("priceUsd", 0)) if pair.get("priceUsd") else None
+                        token_data = None
+                        if base_token.get("address", "").lower() == mint.lower():
+                            name = base_token.get("name", "Unknown")
+                            symbol = base_token.get("symbol", "UNK")
+                            price_usd = float(pair.get("priceUsd", 0)) if pair.get("priceUsd") else None
                     
-                    if quote_token.get("symbol", "").lower() == "sol":
-                        price_in_sol = float(pair.get("priceNative", 0)) if pair.get("priceNative") else None
-                    else:
-                        price_in_sol = price_usd / sol_price_usd if price_usd and sol_price_usd > 0 else None
+                            if quote_token.get("symbol", "").lower() == "sol":
+                                price_in_sol = float(pair.get("priceNative", 0)) if pair.get("priceNative") else None
+                            else:
+                                price_in_sol = price_usd / sol_price_usd if price_usd and sol_price_usd > 0 else None
                     
-                    token_data = {
-                        "name": name,
-                        "symbol": symbol,
-                        "price_usd": price_usd,
-                        "price_in_sol": price_in_sol,
-                        "market_cap": pair.get("fdv"),
-                        "volume_24h": pair.get("volume", {}).get("h24"),
-                        "liquidity": pair.get("liquidity", {}).get("usd"),
-                        "price_change_24h": pair.get("priceChange", {}).get("h24"),
-                        "url": pair.get("url") or f"https://dexscreener.com/solana/{pair.get('pairAddress', mint)}"
-                    }
+                            token_data = TokenMarket(
+                                name=share(name),
+                                symbol=share(symbol),
+                                price_usd=price_usd,
+                                price_in_sol=price_in_sol,
+                                market_cap=pair.get("fdv"),
+                                volume_24h=pair.get("volume", {}).get("h24"),
+                                liquidity=pair.get("liquidity", {}).get("usd"),
+                                price_change_24h=pair.get("priceChange", {}).get("h24"),
+                                url=pair.get("url") or f"https://dexscreener.com/solana/{pair.get('pairAddress', mint)}"
+                            )
                     
-                elif (quote_token.get("address", "").lower() == mint.lower() and 
-                      base_token.get("symbol", "").lower() == "sol"):
-                    name = quote_token.get("name", "Unknown")
-                    symbol = quote_token.get("symbol", "UNK")
-                    price_native = pair.get("priceNative")
+                        elif (quote_token.get("address", "").lower() == mint.lower() and 
+                              base_token.get("symbol", "").lower() == "sol"):
+                            name = quote_token.get("name", "Unknown")
+                            symbol = quote_token.get("symbol", "UNK")
+                            price_native = pair.get("priceNative")
                     
-                    if price_native and float(price_native) > 0:
-                        price_in_sol = 1 / float(price_native)
-                        price_usd = price_in_sol * sol_price_usd if sol_price_usd > 0 else None
-                    else:
-                        price_in_sol = None
-                        price_usd = None
+                            if price_native and float(price_native) > 0:
+                                price_in_sol = 1 / float(price_native)
+                                price_usd = price_in_sol * sol_price_usd if sol_price_usd > 0 else None
+                            else:
+                                price_in_sol = None
+                                price_usd = None
                     
-                    token_data = {
-                        "name": name,
-                        "symbol": symbol,
-                        "price_usd": price_usd,
-                        "price_in_sol": price_in_sol,
-                        "market_cap": None,
-                        "volume_24h": None,
-                        "liquidity": None,
-                        "price_change_24h": None,
-                        "url": pair.get("url") or f"https://dexscreener.com/solana/{pair.get('pairAddress', mint)}"
-                    }
+                            token_data = TokenMarket(
+                                name=share(name),
+                                symbol=share(symbol),
+                                price_usd=price_usd,
+                                price_in_sol=price_in_sol,
+                                market_cap=None,
+                                volume_24h=None,
+                                liquidity=None,
+                                price_change_24h=None,
+                                url=pair.get("url") or f"https://dexscreener.com/solana/{pair.get('pairAddress', mint)}"
+                            )
                 
-                if token_data:
-                    cache_service.set(cache_key, token_data)
-                    return token_data
+                        if token_data:
+                            ttl = price_ttl(token_data.price_change_24h, token_data.volume_24h, token_data.liquidity)
+                            return cache_price(cache_key, token_data, ttl)
             
-            return None
+                    return None
             
-    except Exception as e:
-        logger.error(f"Error fetching token data from DexScreener for {mint}: {e}")
-        return None
+        except Exception as e:
+            logger.error(f"Error fetching token data from DexScreener for {mint}: {e}")
+            return None
 
-# ── Ethereum API Functions ─────────────────────────────────────────────────
-async def get_eth_balance(wallet_address: str) -> float:
-    cache_key = cache_service.get_key('eth_balance', wallet_address)
+# ── EVM API Functions ──────────────────────────────────────────────────────
+async def get_evm_balance(chain: str, wallet_address: str) -> Optional[float]:
+    """Native coin balance on one EVM chain; None when the explorer could not be asked"""
+    chain_id = EVM_CHAIN_INFO[chain]["id"]
+    cache_key = cache_service.get_key('evm_balance', f"{chain_id}:{wallet_address}")
     cached_result = cache_service.get(cache_key)
     if cached_result is not None:
         return cached_result
     
-    if not ETHERSCAN_API_KEY:
+    if not etherscan_keys.keys:
         logger.error("ETHERSCAN_API_KEY not set")
-        return 0.0
+        return None
+
+    async with cache_service.single_flight(cache_key):
+        cached_result = cache_service.get(cache_key, record=False)
+        if cached_result is not None:
+            return cached_result
+
+        try:
+            payload = {
+                "chainid": chain_id,
+                "module": "account",
+                "action": "balance",
+                "address": wallet_address,
+                "tag": "latest",
+            }
+            data = await etherscan_get(payload, "get_evm_balance")
+            balance = int(data.get("result", 0)) / 1e18
+            cache_wallet(cache_key, balance, wallet_address)
+            return balance
+        except Exception as e:
+            logger.error(f"Error fetching {EVM_CHAIN_INFO[chain]['name']} balance: {e}")
+            return None
 
+async def get_token_transfers(chain: str, wallet_address: str, start_block: int) -> Optional[List[Dict[str, Any]]]:
+    """One page of ERC-20 transfers to or from a wallet from start_block on, oldest first; None on failure"""
+    if not etherscan_keys.keys:
+        logger.error("ETHERSCAN_API_KEY not set")
+        return None
     try:
         payload = {
+            "chainid": EVM_CHAIN_INFO[chain]["id"],
             "module": "account",
-            "action": "balance",
+            "action": "tokentx",
             "address": wallet_address,
-            "tag": "latest",
-            "apikey": ETHERSCAN_API_KEY
+            "startblock": start_block,
+            "endblock": 99999999,
+            "page": 1,
+            "offset": TOKEN_TRANSFERS_PAGE_SIZE,
+            "sort": "asc",
         }
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-            async with session.get(ETHERSCAN_API, params=payload, timeout=ClientTimeout(total=10)) as response:
-                response.raise_for_status()
-                balance = int((await response.json()).get("result", 0)) / 1e18
-                cache_service.set(cache_key, balance)
-                return balance
+        data = await etherscan_get(payload, "get_token_transfers", timeout=30)
+        # "No transactions found" comes back as status 0 with an empty list; real errors carry a message string
+        if not isinstance(data.get("result"), list):
+            raise ValueError(data.get("result") or data.get("message"))
+        return data["result"]
     except Exception as e:
-        logger.error(f"Error fetching ETH balance: {e}")
-        return 0.0
+        logger.error(f"Error fetching {EVM_CHAIN_INFO[chain]['name']} token transfers: {e}")
+        return None
+
+async def get_evm_native_prices(chains: List[str]) -> Dict[str, float]:
+    """USD price of each chain's native coin, from one batched CoinGecko lookup"""
+    prices = await price_service.get_coin_prices([EVM_CHAIN_INFO[chain]["coin"] for chain in chains])
+    return {chain: prices[EVM_CHAIN_INFO[chain]["coin"]] for chain in chains}
 
 async def get_eth_price() -> float:
-    cache_key = cache_service.get_key('eth_price', 'current')
-    cached_result = cache_service.get(cache_key)
-    if cached_result is not None:
-        return cached_result
-    
-    try:
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-            async with session.get(ETH_PRICE_API, timeout=ClientTimeout(total=10)) as response:
-                response.raise_for_status()
-                data = await response.json()
-                price = data.get("ethereum", {}).get("usd", 0)
-                cache_service.set(cache_key, price)
-                return price
-    except Exception as e:
-        logger.error(f"Error fetching ETH price: {e}")
-        return 0.0
+    return await price_service.get_coin_price("ethereum")
@@ -0,0 +1,648 @@
+import os
+import copy
+import json
+import time
+import bisect
+import sqlite3
+import asyncio
+import logging
+import threading
+import aiofiles
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict, List, Any, Tuple, Callable, Sequence
+
+from ratelimit import TokenBucket
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory").lower()  # "memory" or "sqlite"
+SHARED_DB_PATH = os.getenv("SHARED_DB_PATH", "scanner_state.db")  # Used by the sqlite backend
+USER_DATA_FILE = os.getenv("USER_DATA_FILE", "user_data.json")     # Used by the memory backend
+HOLDINGS_INDEX_SIZE = int(os.getenv("HOLDINGS_INDEX_SIZE", "10000"))  # Wallets kept by the memory holdings index
+HISTORY_WALLETS = int(os.getenv("HISTORY_WALLETS", "10000"))          # Wallets kept by the memory history store
+# Portfolio history resolution: every point for a day, then one per hour, one per day after a month, gone after a year
+HISTORY_RAW_AGE = 86400
+HISTORY_HOURLY_AGE = 30 * 86400
+HISTORY_RETENTION = float(os.getenv("HISTORY_RETENTION_DAYS", "365")) * 86400
+HISTORY_COMPACT_INTERVAL = 3600  # Seconds between downsampling passes over one wallet's history
+
+# ── Cache Backends ─────────────────────────────────────────────────────────
+class CacheBackend:
+    """Storage for CacheService entries plus the leases behind its single-flight locks"""
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Returns (data, expires) or None; expired entries stay readable until purged"""
+        raise NotImplementedError
+
+    def set(self, key: str, data: Any, expires: float):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def purge(self, expired_before: float):
+        """Drop entries that expire before expired_before"""
+        raise NotImplementedError
+
+    async def try_lock(self, key: str, owner: str, ttl: float) -> bool:
+        """Take a lease on key for ttl seconds; False if another owner holds it"""
+        raise NotImplementedError
+
+    def unlock(self, key: str, owner: str):
+        raise NotImplementedError
+
+class MemoryCacheBackend(CacheBackend):
+    """Process-local dict, the default single-worker behaviour"""
+
+    def __init__(self):
+        self._cache: Dict[str, Tuple[Any, float]] = {}
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        return self._cache.get(key)
+
+    def set(self, key: str, data: Any, expires: float):
+        self._cache[key] = (data, expires)
+
+    def delete(self, key: str):
+        self._cache.pop(key, None)
+
+    def purge(self, expired_before: float):
+        expired_keys = [k for k, (_, expires) in self._cache.items() if expires < expired_before]
+        for k in expired_keys:
+            del self._cache[k]
+
+    async def try_lock(self, key: str, owner: str, ttl: float) -> bool:
+        # Only one process uses this cache, CacheService's asyncio locks are enough
+        return True
+
+    def unlock(self, key: str, owner: str):
+        pass
+
+class SQLiteDatabase:
+    """Shared SQLite file used by every bot worker on the host.
+
+    Writes run on one writer thread, so waiting for another worker's write lock (up to the busy timeout)
+    never stalls the event loop. Reads use their own connection: in WAL mode they never wait for writers.
+    """
+
+    def __init__(self, path: str = SHARED_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+                """
+                -- cache.timestamp holds the entry's expiry time (per-entry TTLs)
+                CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, data TEXT NOT NULL, timestamp REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, user_number INTEGER NOT NULL, data TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                -- buckets.idle_at: once the bucket has been full for a whole refill window the row is purged
+                CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, idle_at REAL);
+                CREATE TABLE IF NOT EXISTS holdings (key TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL);
+                -- Clustered by wallet and time, so a range is one contiguous read
+                CREATE TABLE IF NOT EXISTS history (
+                    key TEXT NOT NULL, ts REAL NOT NULL, value REAL NOT NULL, top TEXT NOT NULL, PRIMARY KEY (key, ts)
+                ) WITHOUT ROWID;
+                """
+        )
+        if "idle_at" not in {row[1] for row in self._conn.execute("PRAGMA table_info(buckets)")}:
+            try:
+                self._conn.execute("ALTER TABLE buckets ADD COLUMN idle_at REAL")
+            except sqlite3.OperationalError:
+                pass  # Another worker added it first
+        self._reader = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._mutex = threading.RLock()  # Guards the reader connection
+
+    def execute(self, sql: str, params: tuple = ()) -> list:
+        """Read query, answered on the calling thread"""
+        with self._mutex:
+            return self._reader.execute(sql, params).fetchall()
+
+    def write(self, sql: str, params: tuple = ()) -> Future:
+        """Queue one write statement on the writer thread without waiting for it; writes apply in order"""
+        return self.submit(lambda conn: conn.execute(sql, params))
+
+    def submit(self, fn: Callable[[sqlite3.Connection], Any]) -> Future:
+        """Queue fn as a write transaction without waiting for it"""
+        future = self._writer.submit(self._transaction, fn)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    async def run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run fn as a write transaction on the writer thread and wait for its result"""
+        return await asyncio.wrap_future(self._writer.submit(self._transaction, fn))
+
+    def transaction(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Blocking form of run, for code outside the event loop"""
+        return self._writer.submit(self._transaction, fn).result()
+
+    def _transaction(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run fn inside BEGIN IMMEDIATE so concurrent workers serialise on the write lock"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(self._conn)
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return result
+
+    @staticmethod
+    def _log_failure(future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Error writing to the shared database: {future.exception()}")
+
+class PendingWrites:
+    """Values queued for the writer thread, served to reads until they are on disk"""
+
+    def __init__(self):
+        self._pending: Dict[str, Tuple[Any, Future]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, value: Any, future: Future):
+        with self._lock:
+            self._pending[key] = (value, future)
+        future.add_done_callback(lambda done: self._discard(key, done))
+
+    def _discard(self, key: str, future: Future):
+        with self._lock:
+            if key in self._pending and self._pending[key][1] is future:
+                del self._pending[key]
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """(True, value) while a write of key is queued, value None for a queued delete"""
+        with self._lock:
+            pending = self._pending.get(key)
+        return (False, None) if pending is None else (True, pending[0])
+
+class SQLiteCacheBackend(CacheBackend):
+    """Cache shared between worker processes through a SQLite file; values are stored as JSON"""
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+        self._pending = PendingWrites()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        queued, entry = self._pending.get(key)
+        if queued:
+            return entry
+        rows = self.db.execute("SELECT data, timestamp FROM cache WHERE key = ?", (key,))
+        if not rows:
+            return None
+        return json.loads(rows[0][0]), rows[0][1]
+
+    def set(self, key: str, data: Any, expires: float):
+        # Serialised now, so later changes to data can't leak into the stored value
+        serialised = json.dumps(data)
+        future = self.db.write(
+            "INSERT OR REPLACE INTO cache (key, data, timestamp) VALUES (?, ?, ?)", (key, serialised, expires)
+        )
+        self._pending.add(key, (json.loads(serialised), expires), future)
+
+    def delete(self, key: str):
+        self._pending.add(key, None, self.db.write("DELETE FROM cache WHERE key = ?", (key,)))
+
+    def purge(self, expired_before: float):
+        self.db.write("DELETE FROM cache WHERE timestamp < ?", (expired_before,))
+        self.db.write("DELETE FROM locks WHERE expires < ?", (time.time(),))
+        # Missing bucket rows read as full buckets, so idle ones go; rows from before idle_at after a day unused
+        now = time.time()
+        self.db.write(
+            "DELETE FROM buckets WHERE idle_at < ? OR (idle_at IS NULL AND updated < ?)", (now, now - 86400)
+        )
+
+    async def try_lock(self, key: str, owner: str, ttl: float) -> bool:
+        def acquire(conn):
+            now = time.time()
+            row = conn.execute("SELECT owner, expires FROM locks WHERE key = ?", (key,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO locks (key, owner, expires) VALUES (?, ?, ?)", (key, owner, now + ttl))
+            return True
+        return await self.db.run(acquire)
+
+    def unlock(self, key: str, owner: str):
+        self.db.write("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner))
+
+# ── User Stores ────────────────────────────────────────────────────────────
+class UserStore:
+    """Registry of known users with sequential user numbers, plus small shared settings"""
+
+    async def load(self):
+        pass
+
+    def get(self, user_id) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Number of users ever registered (the last user number handed out)"""
+        raise NotImplementedError
+
+    async def register(self, user_id, record: Dict[str, Any]) -> Optional[int]:
+        """Add a user and return their new user number, or None if they already exist"""
+        raise NotImplementedError
+
+    async def modify(self, user_id, mutate: Callable[[Dict[str, Any]], None]) -> bool:
+        """Apply mutate to the user's record atomically; False if the user is unknown"""
+        raise NotImplementedError
+
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    async def set_meta(self, key: str, value: Any):
+        raise NotImplementedError
+
+class JsonUserStore(UserStore):
+    """In-memory registry persisted to user_data.json, the default single-worker behaviour"""
+
+    def __init__(self, path: str = USER_DATA_FILE):
+        self.path = path
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._user_count = 0
+        self._meta: Dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        try:
+            if os.path.exists(self.path):
+                async with aiofiles.open(self.path, 'r') as f:
+                    data = json.loads(await f.read())
+                self._user_count = data.get('user_count', 0)
+                self._users = data.get('users', {})
+                self._meta = {k: v for k, v in data.items() if k not in ('user_count', 'users')}
+            else:
+                self._users = {}
+                self._user_count = 0
+        except Exception as e:
+            logger.error(f"Error loading user data: {e}")
+            self._users = {}
+
+    async def save(self):
+        try:
+            data = {'user_count': self._user_count, 'users': self._users, **self._meta}
+            # Handlers run concurrently, so serialise writers to keep the file intact
+            async with self._lock:
+                async with aiofiles.open(self.path, 'w') as f:
+                    await f.write(json.dumps(data, indent=2))
+        except Exception as e:
+            logger.error(f"Error saving user data: {e}")
+
+    def get(self, user_id) -> Optional[Dict[str, Any]]:
+        return self._users.get(str(user_id))
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        return self._users
+
+    def count(self) -> int:
+        return self._user_count
+
+    async def register(self, user_id, record: Dict[str, Any]) -> Optional[int]:
+        if str(user_id) in self._users:
+            return None
+        self._user_count += 1
+        self._users[str(user_id)] = {**record, 'user_number': self._user_count}
+        await self.save()
+        return self._user_count
+
+    async def modify(self, user_id, mutate: Callable[[Dict[str, Any]], None]) -> bool:
+        record = self._users.get(str(user_id))
+        if record is None:
+            return False
+        mutate(record)
+        await self.save()
+        return True
+
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        return self._meta.get(key, default)
+
+    def all_meta(self) -> Dict[str, Any]:
+        return self._meta
+
+    async def set_meta(self, key: str, value: Any):
+        self._meta[key] = value
+        await self.save()
+
+class SQLiteUserStore(UserStore):
+    """Registry shared between worker processes; numbering is assigned inside one write transaction"""
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    async def load(self):
+        # Seed an empty database from an existing user_data.json so switching backends keeps users
+        if self.count() or not os.path.exists(USER_DATA_FILE):
+            return
+        legacy = JsonUserStore(USER_DATA_FILE)
+        await legacy.load()
+
+        def migrate(conn):
+            for user_id, record in legacy.all().items():
+                conn.execute(
+                    "INSERT OR IGNORE INTO users (user_id, user_number, data) VALUES (?, ?, ?)",
+                    (user_id, record.get('user_number', 0), json.dumps(record))
+                )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('user_count', ?)", (json.dumps(legacy.count()),))
+            for key, value in legacy.all_meta().items():
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+        await self.db.run(migrate)
+
+    def get(self, user_id) -> Optional[Dict[str, Any]]:
+        rows = self.db.execute("SELECT data FROM users WHERE user_id = ?", (str(user_id),))
+        return json.loads(rows[0][0]) if rows else None
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        return {user_id: json.loads(data) for user_id, data in self.db.execute("SELECT user_id, data FROM users")}
+
+    def count(self) -> int:
+        return self.get_meta('user_count', 0)
+
+    async def register(self, user_id, record: Dict[str, Any]) -> Optional[int]:
+        def insert(conn):
+            if conn.execute("SELECT 1 FROM users WHERE user_id = ?", (str(user_id),)).fetchone():
+                return None
+            row = conn.execute("SELECT value FROM meta WHERE key = 'user_count'").fetchone()
+            user_number = (json.loads(row[0]) if row else 0) + 1
+            conn.execute(
+                "INSERT INTO users (user_id, user_number, data) VALUES (?, ?, ?)",
+                (str(user_id), user_number, json.dumps({**record, 'user_number': user_number}))
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('user_count', ?)", (json.dumps(user_number),))
+            return user_number
+        return await self.db.run(insert)
+
+    async def modify(self, user_id, mutate: Callable[[Dict[str, Any]], None]) -> bool:
+        def update(conn):
+            row = conn.execute("SELECT data FROM users WHERE user_id = ?", (str(user_id),)).fetchone()
+            if row is None:
+                return False
+            record = json.loads(row[0])
+            mutate(record)
+            conn.execute("UPDATE users SET data = ? WHERE user_id = ?", (json.dumps(record), str(user_id)))
+            return True
+        return await self.db.run(update)
+
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        rows = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,))
+        return json.loads(rows[0][0]) if rows else default
+
+    async def set_meta(self, key: str, value: Any):
+        serialised = json.dumps(value)
+        await self.db.run(lambda conn: conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, serialised)))
+
+# ── Holdings Index ─────────────────────────────────────────────────────────
+class HoldingsIndex:
+    """Per-wallet token balances built from transfer history, with the last block already applied"""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        raise NotImplementedError
+
+class MemoryHoldingsIndex(HoldingsIndex):
+    """Process-local index of the most recently scanned wallets; rebuilt from scratch after a restart"""
+
+    def __init__(self, max_size: int = HOLDINGS_INDEX_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return copy.deepcopy(entry)  # Callers update their copy and put it back
+        return None
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+class SQLiteHoldingsIndex(HoldingsIndex):
+    """Index kept in the shared database, so it survives restarts and is shared by every worker"""
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+        self._pending = PendingWrites()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        queued, data = self._pending.get(key)
+        if not queued:
+            rows = self.db.execute("SELECT data FROM holdings WHERE key = ?", (key,))
+            data = rows[0][0] if rows else None
+        return json.loads(data) if data is not None else None
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        data = json.dumps(entry)
+        future = self.db.write("INSERT OR REPLACE INTO holdings (key, data, updated) VALUES (?, ?, ?)", (key, data, time.time()))
+        self._pending.add(key, data, future)
+
+# ── Portfolio History ──────────────────────────────────────────────────────
+# A point is (timestamp, total USD value, ((symbol, USD value), ...) of the top holdings)
+HistoryPoint = Tuple[float, float, Tuple[Tuple[str, float], ...]]
+
+def history_drops(timestamps: Sequence[float], now: float) -> List[float]:
+    """Timestamps to delete so older history thins out; the latest point of each hour or day bucket stays"""
+    drops = []
+    seen = set()
+    for ts in reversed(timestamps):
+        age = now - ts
+        if age <= HISTORY_RAW_AGE:
+            continue
+        if age > HISTORY_RETENTION:
+            drops.append(ts)
+            continue
+        # Buckets are aligned to the epoch, so compacting again keeps the same points
+        width = 3600 if age <= HISTORY_HOURLY_AGE else 86400
+        bucket = (width, int(ts // width))
+        if bucket in seen:
+            drops.append(ts)
+        else:
+            seen.add(bucket)
+    return drops
+
+class HistoryStore:
+    """Per-wallet portfolio value series, appended on every scan and downsampled as it ages"""
+
+    def append(self, key: str, point: HistoryPoint):
+        raise NotImplementedError
+
+    def last(self, key: str) -> Optional[HistoryPoint]:
+        raise NotImplementedError
+
+    def range(self, key: str, start: float, end: float) -> List[HistoryPoint]:
+        """Points with start <= timestamp <= end, oldest first"""
+        raise NotImplementedError
+
+class HistorySeries:
+    """One wallet's history as parallel arrays: 16 bytes a point plus the top holdings"""
+    __slots__ = ("ts", "values", "tops", "compacted")
+
+    def __init__(self):
+        self.ts = array("d")
+        self.values = array("d")
+        self.tops: List[Tuple[Tuple[str, float], ...]] = []
+        self.compacted = 0.0
+
+class MemoryHistoryStore(HistoryStore):
+    """Process-local history of the most recently scanned wallets; lost on restart"""
+
+    def __init__(self, max_size: int = HISTORY_WALLETS):
+        self.max_size = max_size
+        self._series: "OrderedDict[str, HistorySeries]" = OrderedDict()
+
+    def append(self, key: str, point: HistoryPoint):
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = HistorySeries()
+        self._series.move_to_end(key)
+        ts, value, top = point
+        if series.ts and ts < series.ts[-1]:
+            return  # Scans finishing out of order; the newer point is already there
+        series.ts.append(ts)
+        series.values.append(value)
+        series.tops.append(top)
+        if ts - series.compacted >= HISTORY_COMPACT_INTERVAL:
+            self._compact(series, ts)
+        while len(self._series) > self.max_size:
+            self._series.popitem(last=False)
+
+    def _compact(self, series: HistorySeries, now: float):
+        series.compacted = now
+        aged = bisect.bisect_right(series.ts, now - HISTORY_RAW_AGE)
+        drops = set(history_drops(series.ts[:aged], now))
+        if drops:
+            keep = [i for i, ts in enumerate(series.ts) if ts not in drops]
+            series.ts = array("d", (series.ts[i] for i in keep))
+            series.values = array("d", (series.values[i] for i in keep))
+            series.tops = [series.tops[i] for i in keep]
+
+    def last(self, key: str) -> Optional[HistoryPoint]:
+        series = self._series.get(key)
+        if series is None or not series.ts:
+            return None
+        return series.ts[-1], series.values[-1], series.tops[-1]
+
+    def range(self, key: str, start: float, end: float) -> List[HistoryPoint]:
+        series = self._series.get(key)
+        if series is None:
+            return []
+        lo = bisect.bisect_left(series.ts, start)
+        hi = bisect.bisect_right(series.ts, end)
+        return [(series.ts[i], series.values[i], series.tops[i]) for i in range(lo, hi)]
+
+class SQLiteHistoryStore(HistoryStore):
+    """History kept in the shared database; ranges are read straight off the (key, ts) primary key"""
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+        self._compacted: Dict[str, float] = {}
+
+    def append(self, key: str, point: HistoryPoint):
+        ts, value, top = point
+        self.db.write(
+            "INSERT OR REPLACE INTO history (key, ts, value, top) VALUES (?, ?, ?, ?)",
+            (key, ts, value, json.dumps(top))
+        )
+        if ts - self._compacted.get(key, 0.0) >= HISTORY_COMPACT_INTERVAL:
+            self._compacted[key] = ts
+            aged = [row[0] for row in self.db.execute(
+                "SELECT ts FROM history WHERE key = ? AND ts < ? ORDER BY ts", (key, ts - HISTORY_RAW_AGE)
+            )]
+            drops = history_drops(aged, ts)
+            if drops:
+                self.db.submit(lambda conn: conn.executemany(
+                    "DELETE FROM history WHERE key = ? AND ts = ?", [(key, drop) for drop in drops]
+                ))
+
+    def last(self, key: str) -> Optional[HistoryPoint]:
+        rows = self.db.execute("SELECT ts, value, top FROM history WHERE key = ? ORDER BY ts DESC LIMIT 1", (key,))
+        return self._point(rows[0]) if rows else None
+
+    def range(self, key: str, start: float, end: float) -> List[HistoryPoint]:
+        rows = self.db.execute(
+            "SELECT ts, value, top FROM history WHERE key = ? AND ts BETWEEN ? AND ? ORDER BY ts", (key, start, end)
+        )
+        return [self._point(row) for row in rows]
+
+    @staticmethod
+    def _point(row) -> HistoryPoint:
+        return row[0], row[1], tuple((symbol, value) for symbol, value in json.loads(row[2]))
+
+# ── Shared Token Buckets ───────────────────────────────────────────────────
+class SQLiteTokenBucket(TokenBucket):
+    """TokenBucket kept in the shared database so every worker and CLI run draws from one budget"""
+    __slots__ = ("db", "key")
+
+    def __init__(self, db: SQLiteDatabase, key: str, capacity: float, rate: float):
+        super().__init__(capacity, rate)
+        self.db = db
+        self.key = key
+
+    def try_acquire(self, cost: float = 1) -> float:
+        return self.db.transaction(self._take(cost))
+
+    async def try_acquire_async(self, cost: float = 1) -> float:
+        return await self.db.run(self._take(cost))
+
+    def _take(self, cost: float) -> Callable[[sqlite3.Connection], float]:
+        cost = min(cost, self.capacity)
+
+        def take(conn):
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (self.key,)).fetchone()
+            tokens = self.capacity if row is None else min(self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+            if tokens < cost:
+                return (cost - tokens) / self.rate
+            # Full again after (capacity - tokens) / rate, then kept for one more refill window like UserRateLimiter._prune
+            idle_at = now + (self.capacity - tokens + cost) / self.rate + self.capacity / self.rate
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated, idle_at) VALUES (?, ?, ?, ?)",
+                (self.key, tokens - cost, now, idle_at)
+            )
+            return 0.0
+        return take
+
+# ── Backend Selection ──────────────────────────────────────────────────────
+_shared_db: Optional[SQLiteDatabase] = None
+
+def get_shared_db() -> SQLiteDatabase:
+    global _shared_db
+    if _shared_db is None:
+        _shared_db = SQLiteDatabase(SHARED_DB_PATH)
+    return _shared_db
+
+def create_cache_backend() -> CacheBackend:
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteCacheBackend(get_shared_db())
+    return MemoryCacheBackend()
+
+def create_user_store() -> UserStore:
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteUserStore(get_shared_db())
+    return JsonUserStore(USER_DATA_FILE)
+
+def create_holdings_index() -> HoldingsIndex:
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteHoldingsIndex(get_shared_db())
+    return MemoryHoldingsIndex(HOLDINGS_INDEX_SIZE)
+
+def create_history_store() -> HistoryStore:
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteHistoryStore(get_shared_db())
+    return MemoryHistoryStore(HISTORY_WALLETS)
+
+def create_token_bucket(key: str, capacity: float, rate: float) -> TokenBucket:
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteTokenBucket(get_shared_db(), key, capacity, rate)
+    return TokenBucket(capacity, rate)
@@ -0,0 +1,258 @@
+import os
+import json
+import zlib
+import random
+import asyncio
+import logging
+import aiohttp
+from typing import Optional, Dict, List, Any, Set, Callable, Awaitable
+
+from services import (
+    get_session, get_sol_balance, get_token_accounts, invalidate_solana_wallet, live_wallets, SOLANA_WS_URL
+)
+from metrics import WS_SUBSCRIPTIONS, WS_EVENTS
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+WS_CONNECTIONS = int(os.getenv("WS_CONNECTIONS", "2"))                    # Multiplexed connections for all subscriptions
+WS_MAX_ACCOUNTS = int(os.getenv("WS_MAX_ACCOUNTS", "100"))                # Token accounts subscribed per wallet at most
+WS_DEBOUNCE = float(os.getenv("WS_DEBOUNCE", "1.0"))                      # Seconds to collect notifications of one transaction
+WS_BACKOFF_MAX = float(os.getenv("WS_BACKOFF_MAX", "60"))                 # Longest wait between reconnect attempts
+WS_HEARTBEAT = 30.0
+WS_COMMITMENT = "confirmed"
+
+# ── Connection ─────────────────────────────────────────────────────────────
+class SubscriptionConnection:
+    """One WebSocket carrying accountSubscribe for its share of accounts; reconnects and resubscribes by itself"""
+
+    def __init__(self, engine: "SubscriptionEngine", index: int):
+        self.engine = engine
+        self.index = index
+        self.accounts: Set[str] = set()        # Accounts that should be subscribed on this connection
+        self.subscribed: Dict[str, int] = {}   # account -> subscription id, confirmed by the server
+        self._by_subscription: Dict[int, str] = {}
+        self._requests: Dict[int, tuple] = {}  # request id -> (method, account)
+        self._next_id = 0
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None and not self._ws.closed
+
+    def add(self, account: str):
+        if account not in self.accounts:
+            self.accounts.add(account)
+            if self.connected:
+                self._send("accountSubscribe", account, [account, {"encoding": "base64", "commitment": WS_COMMITMENT}])
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def remove(self, account: str):
+        self.accounts.discard(account)
+        subscription = self.subscribed.pop(account, None)
+        if subscription is not None:
+            self._by_subscription.pop(subscription, None)
+            WS_SUBSCRIPTIONS.set(len(self.subscribed), connection=str(self.index))
+            if self.connected:
+                self._send("accountUnsubscribe", account, [subscription])
+
+    def _send(self, method: str, account: str, params: List[Any]):
+        self._next_id += 1
+        self._requests[self._next_id] = (method, account)
+        payload = {"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params}
+        asyncio.ensure_future(self._write(self._ws, payload))
+
+    async def _write(self, ws: aiohttp.ClientWebSocketResponse, payload: Dict[str, Any]):
+        try:
+            await ws.send_str(json.dumps(payload))
+        except Exception as e:
+            # The reader sees the closed socket too and resubscribes everything after reconnecting
+            logger.error(f"Error sending {payload['method']} on Solana WebSocket connection {self.index}: {e}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._reset()
+
+    def _reset(self):
+        """Forget subscriptions of a closed socket; their wallets are no longer live"""
+        dropped = {self.engine.owners.get(account) for account in self.subscribed}
+        self.subscribed.clear()
+        self._by_subscription.clear()
+        self._requests.clear()
+        self._ws = None
+        WS_SUBSCRIPTIONS.set(0, connection=str(self.index))
+        for wallet in dropped:
+            if wallet:
+                self.engine.update_live(wallet)
+
+    async def _run(self):
+        attempt = 0
+        while True:
+            try:
+                async with get_session().ws_connect(self.engine.url, heartbeat=WS_HEARTBEAT) as ws:
+                    self._ws = ws
+                    WS_EVENTS.inc(event="connect")
+                    self.engine.stats["connects"] += 1
+                    for account in list(self.accounts):
+                        self._send("accountSubscribe", account,
+                                   [account, {"encoding": "base64", "commitment": WS_COMMITMENT}])
+                    async for message in ws:
+                        if message.type != aiohttp.WSMsgType.TEXT:
+                            break
+                        attempt = 0  # The server is talking to us, so the next drop starts the backoff afresh
+                        self._handle(json.loads(message.data))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                WS_EVENTS.inc(event="error")
+                logger.error(f"Solana WebSocket connection {self.index} failed: {e}")
+            WS_EVENTS.inc(event="disconnect")
+            self._reset()
+            delay = min(WS_BACKOFF_MAX, 2 ** attempt) * random.uniform(0.5, 1.0)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _handle(self, message: Dict[str, Any]):
+        if message.get("method") == "accountNotification":
+            account = self._by_subscription.get(message["params"]["subscription"])
+            if account is not None:
+                self.engine.notify(account)
+            return
+        request = self._requests.pop(message.get("id"), None)
+        if request is None:
+            return
+        method, account = request
+        if "error" in message:
+            logger.error(f"Error on {method} for {account}: {message['error']}")
+            return
+        if method == "accountSubscribe":
+            if account not in self.accounts:
+                # Removed before the server confirmed it
+                self._send("accountUnsubscribe", account, [message["result"]])
+                return
+            self.subscribed[account] = message["result"]
+            self._by_subscription[message["result"]] = account
+            WS_SUBSCRIPTIONS.set(len(self.subscribed), connection=str(self.index))
+            self.engine.update_live(self.engine.owners.get(account))
+
+# ── Subscription Engine ────────────────────────────────────────────────────
+class SubscriptionEngine:
+    """Keeps watched Solana wallets and their token accounts subscribed; a notification invalidates and rewarms the cache"""
+
+    def __init__(self, url: str = SOLANA_WS_URL, connections: int = WS_CONNECTIONS):
+        self.url = url
+        self.connections = [SubscriptionConnection(self, i) for i in range(max(1, connections))]
+        self.wallets: Dict[str, Set[str]] = {}  # wallet -> subscribed accounts (itself and its token accounts)
+        self.owners: Dict[str, str] = {}        # account -> wallet
+        self.truncated: Set[str] = set()        # Wallets with more token accounts than WS_MAX_ACCOUNTS
+        self.on_change: Optional[Callable[[str], Awaitable[None]]] = None
+        self.stats = {"connects": 0, "notifications": 0, "refreshes": 0}
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.url.startswith(("ws://", "wss://"))
+
+    def connection_for(self, account: str) -> SubscriptionConnection:
+        # A stable hash, so every account keeps its connection across reconnects
+        return self.connections[zlib.crc32(account.encode()) % len(self.connections)]
+
+    def is_live(self, wallet: str) -> bool:
+        """Whether every account of the wallet is subscribed, so polling it would learn nothing new"""
+        accounts = self.wallets.get(wallet)
+        if not accounts or wallet in self.truncated:
+            return False
+        return all(account in self.connection_for(account).subscribed for account in accounts)
+
+    def update_live(self, wallet: Optional[str]):
+        if wallet is None:
+            return
+        if self.is_live(wallet):
+            live_wallets.add(wallet)
+        elif wallet in live_wallets:
+            live_wallets.discard(wallet)
+            # Changes may be missed until it is subscribed again, so don't keep serving the long-lived entries
+            invalidate_solana_wallet(wallet)
+
+    async def sync(self, wallets: List[str]):
+        """Subscribe newly watched wallets and drop the ones nobody watches any more"""
+        if not self.enabled:
+            return
+        wanted = set(wallets)
+        for wallet in set(self.wallets) - wanted:
+            self._set_accounts(wallet, set())
+        new = [wallet for wallet in wanted if wallet not in self.wallets]
+        results = await asyncio.gather(*(self.track(wallet) for wallet in new), return_exceptions=True)
+        for wallet, result in zip(new, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error subscribing watched wallet {wallet}: {result}")
+
+    async def track(self, wallet: str):
+        """(Re)read the wallet's token accounts, which also warms the cache, and subscribe to all of them"""
+        token_accounts = await get_token_accounts(wallet)
+        pubkeys = [account.pubkey for account in token_accounts if account.pubkey]
+        if len(pubkeys) > WS_MAX_ACCOUNTS:
+            self.truncated.add(wallet)  # Only partly covered: it stays on the poller as well
+        else:
+            self.truncated.discard(wallet)
+        self._set_accounts(wallet, {wallet, *pubkeys[:WS_MAX_ACCOUNTS]})
+
+    def _set_accounts(self, wallet: str, accounts: Set[str]):
+        previous = self.wallets.get(wallet, set())
+        if accounts:
+            self.wallets[wallet] = accounts
+        else:
+            self.wallets.pop(wallet, None)
+            self.truncated.discard(wallet)
+        for account in previous - accounts:
+            self.owners.pop(account, None)
+            self.connection_for(account).remove(account)
+        for account in accounts - previous:
+            self.owners[account] = wallet
+            self.connection_for(account).add(account)
+        self.update_live(wallet)
+
+    def notify(self, account: str):
+        """An account changed: drop the owner's cached entries now, refresh once the transaction's burst is over"""
+        wallet = self.owners.get(account)
+        if wallet is None:
+            return
+        self.stats["notifications"] += 1
+        WS_EVENTS.inc(event="notification")
+        invalidate_solana_wallet(wallet)
+        if wallet not in self._pending:
+            self._pending[wallet] = asyncio.create_task(self._refresh(wallet))
+
+    async def _refresh(self, wallet: str):
+        try:
+            await asyncio.sleep(WS_DEBOUNCE)
+            del self._pending[wallet]
+            invalidate_solana_wallet(wallet)
+            self.stats["refreshes"] += 1
+            # Rewarm before anyone asks; new token accounts get subscribed, closed ones dropped
+            await asyncio.gather(get_sol_balance(wallet), self.track(wallet))
+            if self.on_change is not None and wallet in self.wallets:
+                await self.on_change(wallet)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error refreshing watched wallet {wallet} after a notification: {e}")
+
+    async def stop(self):
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+        await asyncio.gather(*(connection.stop() for connection in self.connections))
+        for wallet in list(self.wallets):
+            live_wallets.discard(wallet)
+
+subscription_engine = SubscriptionEngine()
@@ -0,0 +1,92 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+from services import cache_service
+from storage import STORAGE_BACKEND
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "50000"))   # Wallet summaries kept for inline queries (~0.5 KB each)
+SUMMARY_TTL = float(os.getenv("SUMMARY_TTL", "1800"))               # Seconds a summary is served without a rescan
+SUMMARY_TOP_TOKENS = 3
+
+# ── Wallet Summaries ───────────────────────────────────────────────────────
+class WalletSummary:
+    """The few numbers an inline card shows, without the full report's token list"""
+    __slots__ = ("chain", "address", "total_value_usd", "native_balance", "native_value_usd",
+                 "token_count", "top", "scanned_at")
+
+    def __init__(self, chain: str, address: str, total_value_usd: float, native_balance: float,
+                 native_value_usd: float, token_count: int, top: Tuple[Tuple[str, float], ...], scanned_at: float):
+        self.chain = chain
+        self.address = address
+        self.total_value_usd = total_value_usd
+        self.native_balance = native_balance
+        self.native_value_usd = native_value_usd
+        self.token_count = token_count
+        self.top = top
+        self.scanned_at = scanned_at
+
+    @classmethod
+    def from_report(cls, report: Dict[str, Any]) -> "WalletSummary":
+        top = tuple((token.symbol, token.token_usd_value) for token in report["tokens"][:SUMMARY_TOP_TOKENS])
+        return cls(report["chain"], report["address"], report["total_value_usd"], report["native_balance"],
+                   report["native_value_usd"], report["token_count"], top, report["scanned_at"])
+
+    def to_list(self) -> list:
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_list(cls, values: list) -> "WalletSummary":
+        values = list(values)
+        values[6] = tuple(tuple(holding) for holding in values[6])
+        return cls(*values)
+
+class SummaryCache:
+    """Bounded LRU of wallet summaries in front of the shared cache, so inline queries never wait for a scan"""
+
+    def __init__(self, max_size: int = SUMMARY_CACHE_SIZE, ttl: float = SUMMARY_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._summaries: "OrderedDict[str, WalletSummary]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(chain: str, address: str) -> str:
+        return f"{chain}:{address.lower() if chain == 'ethereum' else address}"
+
+    def get(self, chain: str, address: str) -> Optional[WalletSummary]:
+        key = self.key(chain, address)
+        summary = self._summaries.get(key)
+        if summary is None and STORAGE_BACKEND == "sqlite":
+            # Another worker may have scanned it
+            shared = cache_service.get(cache_service.get_key('summary', key), record=False)
+            if shared is not None:
+                summary = WalletSummary.from_list(shared)
+                self._store(key, summary)
+        if summary is None or time.time() - summary.scanned_at > self.ttl:
+            self.stats["misses"] += 1
+            return None
+        self._summaries.move_to_end(key)
+        self.stats["hits"] += 1
+        return summary
+
+    def put(self, report: Dict[str, Any]):
+        summary = WalletSummary.from_report(report)
+        key = self.key(summary.chain, summary.address)
+        self._store(key, summary)
+        if STORAGE_BACKEND == "sqlite":
+            cache_service.set(cache_service.get_key('summary', key), summary.to_list(), ttl=self.ttl)
+
+    def _store(self, key: str, summary: WalletSummary):
+        self._summaries[key] = summary
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > self.max_size:
+            self._summaries.popitem(last=False)
+
+summary_cache = SummaryCache()
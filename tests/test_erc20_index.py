@@ -0,0 +1,58 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import erc20_index
+from erc20_index import Erc20Index
+from storage import MemoryHoldingsIndex
+
+WALLET = "0x00000000000000000000000000000000000000aa"
+TOKEN = "0x00000000000000000000000000000000000000cc"
+PAGE_SIZE = 3
+
+def transfer(block: int, value: int = 1) -> dict:
+    return {"blockNumber": str(block), "contractAddress": TOKEN, "tokenName": "Test", "tokenSymbol": "TST",
+            "tokenDecimal": "0", "from": "0x00000000000000000000000000000000000000bb", "to": WALLET,
+            "value": str(value)}
+
+def fake_etherscan(monkeypatch, history: list) -> list:
+    """Serve history page by page like tokentx does; returns the start blocks that were asked for"""
+    queries = []
+
+    async def get_token_transfers(chain, address, start_block):
+        queries.append(start_block)
+        return [t for t in history if int(t["blockNumber"]) >= start_block][:PAGE_SIZE]
+
+    monkeypatch.setattr(erc20_index, "get_token_transfers", get_token_transfers)
+    monkeypatch.setattr(erc20_index, "TOKEN_TRANSFERS_PAGE_SIZE", PAGE_SIZE)
+    return queries
+
+def test_page_ending_mid_block_is_resumed_at_that_block(monkeypatch):
+    history = [transfer(10), transfer(11), transfer(11), transfer(12), transfer(12), transfer(13)]
+    queries = fake_etherscan(monkeypatch, history)
+    index = Erc20Index(MemoryHoldingsIndex())
+
+    assert asyncio.run(index.sync("ethereum", WALLET, "key"))
+    entry = index.store.get("key")
+    assert queries == [0, 11, 12, 13]
+    assert entry["tokens"][TOKEN]["raw"] == "6"
+    assert entry["block"] == 13 and entry["complete"]
+
+def test_page_inside_one_block_does_not_skip_the_block(monkeypatch):
+    history = [transfer(10), transfer(11), transfer(11), transfer(11), transfer(11), transfer(12)]
+    queries = fake_etherscan(monkeypatch, history)
+    index = Erc20Index(MemoryHoldingsIndex())
+
+    assert not asyncio.run(index.sync("ethereum", WALLET, "key"))
+    entry = index.store.get("key")
+    # Block 10 is applied; block 11 has more transfers than a page, so the cursor stays before it
+    assert queries == [0, 11]
+    assert entry["block"] == 10 and not entry["complete"]
+    assert entry["tokens"][TOKEN]["raw"] == "1"
+
+    # Later syncs ask for block 11 again instead of jumping to 12
+    asyncio.run(index.sync("ethereum", WALLET, "key"))
+    assert queries[-1] == 11
+    assert index.store.get("key")["tokens"][TOKEN]["raw"] == "1"
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from typing import Optional, Dict, List, Any, Iterable, Iterator, Tuple
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+TOKEN_REGISTRY_PATH = os.getenv("TOKEN_REGISTRY_PATH", "token_registry.db")
+# Which Solana mints get priced: "all", "listed" (in the registry) or "verified" (verified in the registry)
+TOKEN_PRICING = os.getenv("TOKEN_PRICING", "all").lower()
+
+SOLANA_CHAIN_ID = 101
+DEFAULT_VERIFIED_TAGS = ("verified", "strict")
+LOOKUP_CHUNK = 500  # Stays below SQLite's bound parameter limit
+
+# ── Registry ───────────────────────────────────────────────────────────────
+class TokenRegistry:
+    """Read-only mint -> name/symbol/decimals/verified index; lookups hit the on-disk B-tree, so memory stays flat"""
+
+    def __init__(self, path: str = TOKEN_REGISTRY_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._opened = False
+        self.stats = {"lookups": 0, "hits": 0}
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if not self._opened:
+            self._opened = True
+            if os.path.exists(self.path):
+                try:
+                    self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+                    logger.info(f"Token registry {self.path} opened ({self.count()} mints)")
+                except sqlite3.Error as e:
+                    logger.error(f"Error opening token registry {self.path}: {e}")
+        return self._conn
+
+    @property
+    def available(self) -> bool:
+        return self._connection() is not None
+
+    def count(self) -> int:
+        conn = self._connection()
+        if conn is None:
+            return 0
+        return conn.execute("SELECT value FROM info WHERE key = 'count'").fetchone()[0]
+
+    def get(self, mint: str) -> Optional[Dict[str, Any]]:
+        return self.lookup([mint]).get(mint)
+
+    def lookup(self, mints: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Registry entries for the given mints; unknown mints are left out"""
+        conn = self._connection()
+        mints = list(mints)
+        self.stats["lookups"] += len(mints)
+        if conn is None or not mints:
+            return {}
+        found: Dict[str, Dict[str, Any]] = {}
+        for i in range(0, len(mints), LOOKUP_CHUNK):
+            chunk = mints[i:i + LOOKUP_CHUNK]
+            rows = conn.execute(
+                f"SELECT mint, name, symbol, decimals, verified FROM tokens WHERE mint IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            for mint, name, symbol, decimals, verified in rows:
+                found[mint] = {"name": name, "symbol": symbol, "decimals": decimals, "verified": bool(verified)}
+        self.stats["hits"] += len(found)
+        return found
+
+    def should_price(self, mint: str, entry: Optional[Dict[str, Any]]) -> bool:
+        """Whether a mint is worth a price lookup under TOKEN_PRICING"""
+        if TOKEN_PRICING == "all" or not self.available:
+            return True
+        if TOKEN_PRICING == "verified":
+            return bool(entry and entry["verified"])
+        return entry is not None
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+        self._opened = False
+
+token_registry = TokenRegistry()
+
+# ── Index Builder ──────────────────────────────────────────────────────────
+def iter_token_list(path: str, verified_tags: Tuple[str, ...], all_verified: bool) -> Iterator[tuple]:
+    """Rows from a Solana token-list ({"tokens": [...]}) or a plain list of tokens (e.g. Jupiter)"""
+    with open(path) as f:
+        data = json.load(f)
+    tokens = data.get("tokens", []) if isinstance(data, dict) else data
+    for token in tokens:
+        mint = token.get("address") or token.get("mint")
+        if not mint or token.get("chainId", SOLANA_CHAIN_ID) != SOLANA_CHAIN_ID:
+            continue
+        tags = set(token.get("tags") or [])
+        verified = all_verified or token.get("verified") is True or bool(tags.intersection(verified_tags))
+        yield mint, token.get("name") or "Unknown", token.get("symbol") or "UNK", token.get("decimals"), int(verified)
+
+def build_index(sources: List[str], output: str = TOKEN_REGISTRY_PATH,
+                verified_tags: Tuple[str, ...] = DEFAULT_VERIFIED_TAGS, all_verified: bool = False) -> int:
+    """Write a fresh index from token-list files; later files win for duplicate mints"""
+    tmp_path = f"{output}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(
+            """
+            CREATE TABLE tokens (
+                mint TEXT PRIMARY KEY, name TEXT NOT NULL, symbol TEXT NOT NULL, decimals INTEGER, verified INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE info (key TEXT PRIMARY KEY, value) WITHOUT ROWID;
+            """
+        )
+        for source in sources:
+            conn.executemany(
+                "INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?, ?)",
+                iter_token_list(source, verified_tags, all_verified)
+            )
+        count = conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+        conn.executemany("INSERT INTO info VALUES (?, ?)", [
+            ("count", count), ("built_at", time.time()), ("sources", json.dumps(sources)),
+        ])
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, output)
+    return count
+
+# ── Entry Point ────────────────────────────────────────────────────────────
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build the local Solana token registry index from token-list JSON files.")
+    parser.add_argument("sources", nargs="+", help="Token-list JSON files (Solana token-list or Jupiter format)")
+    parser.add_argument("-o", "--output", default=TOKEN_REGISTRY_PATH, help="Index file (default TOKEN_REGISTRY_PATH)")
+    parser.add_argument("--verified-tags", default=",".join(DEFAULT_VERIFIED_TAGS),
+                        help="Tags that mark a token as verified")
+    parser.add_argument("--all-verified", action="store_true", help="Treat every listed token as verified (curated lists)")
+    args = parser.parse_args(argv)
+
+    started = time.monotonic()
+    tags = tuple(tag.strip() for tag in args.verified_tags.split(",") if tag.strip())
+    count = build_index(args.sources, args.output, tags, args.all_verified)
+    size = os.path.getsize(args.output)
+    print(f"Indexed {count} mints into {args.output} ({size / 1024 / 1024:.1f} MiB) in {time.monotonic() - started:.1f}s",
+          file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
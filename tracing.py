@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import uuid
+import functools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, List, Any, Deque
+
+# ── Configuration ──────────────────────────────────────────────────────────
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "100"))       # Slow traces kept for /trace
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "2.0"))   # Traces at least this slow are kept
+MAX_SPANS_PER_TRACE = 200
+
+# Phases summed for the /trace breakdown, in display order
+PHASES = ("queue", "fetch", "parse", "pricing", "render", "send")
+
+# ── Spans & Traces ─────────────────────────────────────────────────────────
+class Span:
+    __slots__ = ("name", "parent", "start", "end", "attrs")
+
+    def __init__(self, name: str, parent: Optional[str], start: float, attrs: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.start = start
+        self.end: Optional[float] = None
+        self.attrs = attrs
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+class Trace:
+    """One scan from the moment it is queued until its replies are sent"""
+
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs: Dict[str, Any] = attrs
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.spans: List[Span] = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.dropped_spans = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.end is not None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def add_span(self, name: str, parent: Optional[str] = None, start: Optional[float] = None, **attrs) -> Optional[Span]:
+        if len(self.spans) >= MAX_SPANS_PER_TRACE:
+            self.dropped_spans += 1
+            return None
+        span = Span(name, parent, time.perf_counter() if start is None else start, attrs)
+        self.spans.append(span)
+        return span
+
+    def find(self, key: str, default: Any = None) -> Any:
+        """Attribute from the trace itself or, failing that, its first span that has it"""
+        if key in self.attrs:
+            return self.attrs[key]
+        return next((span.attrs[key] for span in self.spans if key in span.attrs), default)
+
+    def breakdown(self) -> Dict[str, float]:
+        """Seconds spent per phase; spans running in parallel are summed"""
+        phases = {phase: 0.0 for phase in PHASES}
+        for span in self.spans:
+            if span.name in phases and span.end is not None:
+                phases[span.name] += span.end - span.start
+        return {phase: seconds for phase, seconds in phases.items() if seconds}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 4),
+            "attrs": self.attrs,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "breakdown": {phase: round(seconds, 4) for phase, seconds in self.breakdown().items()},
+            "dropped_spans": self.dropped_spans,
+            "spans": [
+                {
+                    "name": span.name,
+                    "parent": span.parent,
+                    "offset": round(span.start - self.start, 4),
+                    "duration": round(span.duration, 4),
+                    **({"attrs": span.attrs} if span.attrs else {}),
+                }
+                for span in self.spans
+            ],
+        }
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+# ── Tracer ─────────────────────────────────────────────────────────────────
+class Tracer:
+    """Keeps the most recent slow traces in a bounded ring buffer"""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE, slow_seconds: float = TRACE_SLOW_SECONDS):
+        self.slow_seconds = slow_seconds
+        self._traces: Deque[Trace] = deque(maxlen=size)
+        self._finished = 0
+
+    def start(self, name: str, **attrs) -> Trace:
+        return Trace(name, **attrs)
+
+    def finish(self, trace: Trace):
+        if trace.finished:
+            return
+        trace.end = time.perf_counter()
+        self._finished += 1
+        if trace.duration >= self.slow_seconds:
+            self._traces.append(trace)
+
+    def slowest(self, limit: int = 5) -> List[Trace]:
+        return sorted(self._traces, key=lambda trace: trace.duration, reverse=True)[:limit]
+
+    def export(self) -> List[Dict[str, Any]]:
+        return [trace.to_dict() for trace in self._traces]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "exported_at": time.time(),
+            "slow_seconds": self.slow_seconds,
+            "traces_finished": self._finished,
+            "traces": self.export(),
+        }, indent=2, default=str)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"finished": self._finished, "buffered": len(self._traces), "slow_seconds": self.slow_seconds}
+
+tracer = Tracer()
+
+# ── Instrumentation ────────────────────────────────────────────────────────
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def activate(trace: Optional[Trace]):
+    """Make trace the current trace for this block (and tasks created in it)"""
+    if trace is None:
+        yield None
+        return
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a phase of the current trace; a no-op when nothing is being traced"""
+    trace = _current_trace.get()
+    if trace is None or trace.finished:
+        yield None
+        return
+    parent = _current_span.get()
+    current = trace.add_span(name, parent.name if parent else None, **attrs)
+    if current is None:
+        yield None
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+
+def record_span(name: str, duration: float, **attrs):
+    """Add an already measured phase that ended just now, e.g. time spent queued"""
+    trace = _current_trace.get()
+    if trace is None or trace.finished:
+        return
+    parent = _current_span.get()
+    end = time.perf_counter()
+    current = trace.add_span(name, parent.name if parent else None, start=end - duration, **attrs)
+    if current is not None:
+        current.end = end
+
+def annotate(**attrs):
+    """Attach attributes to the current span, or to the trace outside of any span"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    current = _current_span.get()
+    (current.attrs if current else trace.attrs).update(attrs)
+
+def record_cache(hit: bool):
+    """Count a cache lookup on the current span and trace"""
+    trace = _current_trace.get()
+    if trace is None or trace.finished:
+        return
+    if hit:
+        trace.cache_hits += 1
+    else:
+        trace.cache_misses += 1
+    current = _current_span.get()
+    if current is not None:
+        key = "cache_hits" if hit else "cache_misses"
+        current.attrs[key] = current.attrs.get(key, 0) + 1
+
+def traced(name: str):
+    """Run an async function as a span of the current trace, or as its own trace if none is active"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _current_trace.get() is not None:
+                with span(name):
+                    return await func(*args, **kwargs)
+            trace = tracer.start(name)
+            try:
+                with activate(trace):
+                    return await func(*args, **kwargs)
+            finally:
+                tracer.finish(trace)
+        return wrapper
+    return decorator
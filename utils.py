@@ -1,5 +1,7 @@
 import re
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Sequence
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
 
 def escape_markdown(text: str) -> str:
     """Helper function to escape telegram markdown symbols"""
@@ -47,6 +49,33 @@ def format_percentage(pct: Optional[float]) -> str:
     else:
         return "⚪ 0.00%"
 
+def format_usd_change(delta: float, base: float) -> str:
+    """Signed USD change with its percentage of base, e.g. +$12.30 (+1.25%)"""
+    sign = "+" if delta >= 0 else "-"
+    pct = f" ({delta / base * 100:+.2f}%)" if base else ""
+    return f"{sign}${abs(delta):,.2f}{pct}"
+
+def format_age(seconds: float) -> str:
+    """Rough age like 45s, 12m, 3h or 2d"""
+    if seconds < 60:
+        return f"{max(seconds, 0):.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    if seconds < 86400:
+        return f"{seconds / 3600:.0f}h"
+    return f"{seconds / 86400:.0f}d"
+
+def sparkline(values: Sequence[float]) -> str:
+    """One block character per value, scaled between the lowest and highest value"""
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    span = high - low
+    return "".join(
+        SPARK_CHARS[int((value - low) / span * (len(SPARK_CHARS) - 1))] if span else SPARK_CHARS[3]
+        for value in values
+    )
+
 def validate_wallet_address(address: str) -> Tuple[bool, str]:
     """Validates Solana and Ethereum wallet addresses"""
     address = address.strip()
@@ -0,0 +1,145 @@
+import os
+import asyncio
+import logging
+from typing import Optional, Dict, List, Any, Tuple, Callable, Awaitable
+
+from services import cache_service, probe_solana_wallets
+from metrics import WATCH_PROBES, WATCHED_WALLETS
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", "60"))       # Seconds between polling rounds
+WATCH_BATCH_SIZE = int(os.getenv("WATCH_BATCH_SIZE", "50"))     # Wallets per JSON-RPC batch (two probes each)
+WATCH_MAX_PER_USER = int(os.getenv("WATCH_MAX_PER_USER", "10"))
+WATCH_SNAPSHOT_TTL = 7 * 86400   # Holdings remembered per watched wallet to tell what changed
+WATCH_LEASE_KEY = "watch_poller"  # With the sqlite backend only the worker holding this lease polls
+# Wallets with live account subscriptions are still probed every this many rounds, e.g. for token accounts
+# someone else opened for them, which no existing subscription sees
+WATCH_LIVE_PROBE_ROUNDS = int(os.getenv("WATCH_LIVE_PROBE_ROUNDS", "10"))
+
+# ── Snapshots ──────────────────────────────────────────────────────────────
+def snapshot(report: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of a report a watcher is told about; dust tokens are not in report["tokens"]"""
+    return {
+        "sol": report["native_balance"],
+        "value_usd": report["total_value_usd"],
+        "tokens": {token.mint: [token.symbol, token.balance] for token in report["tokens"]},
+    }
+
+def load_snapshot(address: str) -> Optional[Dict[str, Any]]:
+    return cache_service.get(cache_service.get_key('watch_snapshot', address), record=False)
+
+def save_snapshot(address: str, current: Dict[str, Any]):
+    cache_service.set(cache_service.get_key('watch_snapshot', address), current, ttl=WATCH_SNAPSHOT_TTL)
+
+def diff_snapshots(previous: Dict[str, Any], current: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """What moved between two snapshots, or None if no balance changed"""
+    def moved(a: float, b: float) -> bool:
+        return abs(a - b) > 1e-9 * max(abs(a), abs(b), 1.0)
+
+    before, after = previous["tokens"], current["tokens"]
+    added = [after[mint][0] for mint in after if mint not in before]
+    removed = [before[mint][0] for mint in before if mint not in after]
+    changed = [
+        (after[mint][0], after[mint][1] - before[mint][1])
+        for mint in after if mint in before and moved(after[mint][1], before[mint][1])
+    ]
+    sol_delta = current["sol"] - previous["sol"]
+    if not (added or removed or changed or moved(current["sol"], previous["sol"])):
+        return None
+    return {
+        "sol_delta": sol_delta,
+        "value_delta": current["value_usd"] - previous["value_usd"],
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+    }
+
+# ── Poller ─────────────────────────────────────────────────────────────────
+class WatchPoller:
+    """Polls every watched Solana wallet once per round, however many users watch it, and reports changed ones"""
+
+    def __init__(self, interval: float = WATCH_INTERVAL, batch_size: int = WATCH_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.probes: Dict[str, Tuple[Optional[str], int]] = {}  # address -> (latest signature, lamports)
+        self.stats = {"rounds": 0, "probes": 0, "requests": 0, "changes": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    async def poll(self, addresses: List[str], watched: Optional[List[str]] = None) -> List[str]:
+        """Probe addresses in batches and return those whose signature or balance moved since the last round"""
+        watched = addresses if watched is None else watched
+        # Probes of subscribed wallets are kept, so falling back to polling compares against something
+        for address in set(self.probes) - set(watched):
+            del self.probes[address]
+        WATCHED_WALLETS.set(len(watched))
+
+        chunks = [addresses[i:i + self.batch_size] for i in range(0, len(addresses), self.batch_size)]
+        results = await asyncio.gather(*(probe_solana_wallets(chunk) for chunk in chunks))
+        self.stats["rounds"] += 1
+        self.stats["requests"] += len(chunks)
+        self.stats["probes"] += len(addresses)
+
+        changed = []
+        for probes in results:
+            for address, probe in probes.items():
+                if probe is None:
+                    WATCH_PROBES.inc(result="error")
+                    continue
+                previous = self.probes.get(address)
+                self.probes[address] = probe
+                # The first probe of a wallet is only a baseline
+                if previous is not None and previous != probe:
+                    changed.append(address)
+                    WATCH_PROBES.inc(result="changed")
+                else:
+                    WATCH_PROBES.inc(result="unchanged")
+        self.stats["changes"] += len(changed)
+        return changed
+
+    def start(self, get_watched: Callable[[], Dict[str, List[Any]]],
+              on_change: Callable[[str, List[Any]], Awaitable[None]], subscriptions=None):
+        """Poll in the background; get_watched maps address -> watcher ids, on_change runs per changed wallet
+
+        With a SubscriptionEngine the watched wallets are subscribed as well, and only those
+        without live subscriptions are polled every round.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(get_watched, on_change, subscriptions))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, get_watched, on_change, subscriptions):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if not await cache_service.lease(WATCH_LEASE_KEY, self.interval * 3):
+                    if subscriptions is not None:
+                        await subscriptions.sync([])  # Another worker watches now
+                    continue
+                watched = get_watched()
+                addresses = list(watched)
+                if subscriptions is not None:
+                    await subscriptions.sync(addresses)
+                    if self.stats["rounds"] % WATCH_LIVE_PROBE_ROUNDS:
+                        addresses = [address for address in addresses if not subscriptions.is_live(address)]
+                changed = await self.poll(addresses, list(watched))
+                results = await asyncio.gather(
+                    *(on_change(address, watched[address]) for address in changed), return_exceptions=True
+                )
+                for address, result in zip(changed, results):
+                    if isinstance(result, Exception):
+                        logger.error(f"Error handling change of watched wallet {address}: {result}")
+            except Exception as e:
+                logger.error(f"Watchlist polling round failed: {e}")
+
+watch_poller = WatchPoller()
@@ -0,0 +1,126 @@
+import os
+import time
+import hmac
+import asyncio
+import logging
+from typing import Optional, Dict, Any
+
+from aiohttp import web
+from telegram import Update
+
+# ── Logging ────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ── Configuration ──────────────────────────────────────────────────────────
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()     # "polling" or "webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")                  # Public URL registered with Telegram
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")            # Checked against X-Telegram-Bot-Api-Secret-Token; required
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "500"))  # Updates in flight before we push back
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+MAX_UPDATE_BYTES = 1024 * 1024
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# ── Webhook Server ─────────────────────────────────────────────────────────
+class WebhookServer:
+    """Embedded aiohttp server that feeds Telegram webhook POSTs into the Application.
+
+    Updates are acknowledged as soon as they are parsed and processed in the
+    background. Once WEBHOOK_MAX_PENDING updates are in flight new POSTs get a
+    503, which makes Telegram back off and redeliver later.
+    """
+
+    def __init__(self, application, secret_token: Optional[str] = WEBHOOK_SECRET, host: str = WEBHOOK_HOST,
+                 port: int = WEBHOOK_PORT, path: str = WEBHOOK_PATH, max_pending: int = WEBHOOK_MAX_PENDING):
+        self.application = application
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.path = path
+        self.max_pending = max_pending
+        self.app = web.Application(client_max_size=MAX_UPDATE_BYTES)
+        self.app.router.add_post(path, self.handle_update)
+        self.app.router.add_get("/healthz", self.handle_health)
+        self._runner: Optional[web.AppRunner] = None
+        self._tasks: set = set()
+        self._started_at = time.time()
+        self._stats = {"received": 0, "rejected": 0, "unauthorized": 0, "invalid": 0, "failed": 0}
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        # Without a secret anyone who can reach the port could post updates, so none are accepted then
+        supplied = request.headers.get(SECRET_HEADER, "")
+        if not self.secret_token or not hmac.compare_digest(supplied, self.secret_token):
+            self._stats["unauthorized"] += 1
+            return web.Response(status=403)
+
+        if self.pending >= self.max_pending:
+            self._stats["rejected"] += 1
+            return web.Response(status=503, headers={"Retry-After": "1"})
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            self._stats["invalid"] += 1
+            logger.error(f"Invalid webhook payload: {e}")
+            return web.Response(status=400)
+
+        self._stats["received"] += 1
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response(status=200)
+
+    async def _process(self, update: Update):
+        try:
+            await self.application.process_update(update)
+        except Exception as e:
+            self._stats["failed"] += 1
+            logger.error(f"Error processing webhook update {update.update_id}: {e}")
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(self.health())
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok" if self.application.running else "starting",
+            "mode": "webhook",
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "uptime": round(time.time() - self._started_at, 1),
+            **self._stats,
+        }
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logger.info(f"Webhook server listening on {self.host}:{self.port}{self.path}")
+
+    async def register(self, url: Optional[str] = WEBHOOK_URL):
+        """Point Telegram at this server; skipped when no public URL is configured"""
+        if not url:
+            logger.warning("WEBHOOK_URL not set, skipping setWebhook")
+            return
+        await self.application.bot.set_webhook(
+            url=url,
+            secret_token=self.secret_token,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop accepting updates and give in-flight ones a chance to finish"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)